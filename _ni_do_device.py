@@ -2,6 +2,8 @@ import nidaqmx
 import numpy as np
 
 from nidaqmx import stream_writers
+from NIdaqmx_ScopeFoundry.ni_phase import PhaseAccumulator
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
 
 class NI_DO_device(object):
     
@@ -28,10 +30,11 @@ class NI_DO_device(object):
         if hasattr(self, 'task'):
             self.close()
             
-        self.task = nidaqmx.Task()
         # self.task.ao_channels.add_ao_voltage_chan(physical_channel=self.channel,
         #                                          min_val=-10.0, max_val=10.0) 
-        self.task.do_channels.add_do_chan(lines=self.channel)
+        self.task = registry.acquire('do', self.channel,
+                                     lambda task: task.do_channels.add_do_chan(lines=self.channel),
+                                     owner = self)
         
     
     def set_trigger(self, trigger = False, trigger_source = "/Dev1/PFI0", trigger_edge_key = 'rising'):
@@ -108,21 +111,18 @@ class NI_DO_device(object):
         #    raise(ValueError('Frequency too high, unable to set DO'))
         self.rate = rate
         
-        T = 1/frequency # Hz 
-        dt = 1/rate
-        
         Ncycles = num_periods
-        epsilon = 1e-9 # 1ns delay to avoid approximation error in rect and step function
-        t = np.arange(0, Ncycles*T, dt) + epsilon
+        Nsteps = 3 # number of steps is set to 3 here
+        phase = PhaseAccumulator(frequency, rate, Nsteps)
+        acc = phase.advance(Ncycles * samples_per_period)
 
         if waveform_type == "rect": 
             width = 0.5
-            samples =  ( (t) % T < (width*T) ).astype('bool')
+            samples = phase.below(acc, width)
         
         elif waveform_type == "step": 
-            Nsteps = 3 # number of steps is set to 3 here
             #deltaAmp = amplitude # the voltage increase in each step is deltaAmp
-            samples =   ( (t//T) % Nsteps ).astype('bool')
+            samples = phase.period(acc).astype('bool')
         else:
             raise(ValueError('Waveform not specified'))
             
@@ -147,7 +147,7 @@ class NI_DO_device(object):
     def close(self):
         if not hasattr(self, 'task'):
             raise(AttributeError('Task not active, unable to close'))
-        self.task.close()
+        registry.release(self.task)
         
         
         delattr(self, 'task')
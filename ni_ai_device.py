@@ -0,0 +1,174 @@
+import nidaqmx
+import numpy as np
+import time
+
+from nidaqmx import stream_readers
+from NIdaqmx_ScopeFoundry.ni_ring_buffer import RingBuffer
+from NIdaqmx_ScopeFoundry.ni_timing import ai_planner, device_name
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
+
+class NI_AI_device(object):
+    '''Continuous multichannel analog input.
+    Every chunk_size samples the callback reads all channels with
+    AnalogMultiChannelReader.read_many_sample directly into the next block, of shape
+    (num_channels, chunk_size), of a preallocated RingBuffer: nothing is allocated while
+    acquiring. Consumers read views of the ring, or add a listener to ring.listeners.'''
+
+    def __init__(self, channel, rate = 10000., chunk_size = 1000, n_blocks = 100,
+                 min_val = -10., max_val = 10., terminal_config = 'default',
+                 debug = False, verbose = True):
+
+        self.debug = debug
+        self.verbose = verbose
+        self.channel = channel
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.n_blocks = n_blocks
+        self.min_val = min_val
+        self.max_val = max_val
+        self.terminal_config = terminal_config
+        self.sample_clock = '' # onboard clock
+        self.terminal_configs = {"default": nidaqmx.constants.TerminalConfiguration.DEFAULT,
+                                 "rse": nidaqmx.constants.TerminalConfiguration.RSE,
+                                 "nrse": nidaqmx.constants.TerminalConfiguration.NRSE,
+                                 "diff": nidaqmx.constants.TerminalConfiguration.DIFF}
+        self.trigger = False
+        self.trigger_edge_modes = {"rising": nidaqmx.constants.Edge.RISING,
+                                   "falling": nidaqmx.constants.Edge.FALLING
+                                   }
+        self.callback_registered = False
+        self.read_errors = 0
+
+        self.create_task()
+
+    def create_task(self):
+        '''creates a task and add the analog input channels,
+        channel can be a comma separated list of channels sharing the task timing'''
+        if hasattr(self, 'task'):
+            self.close()
+
+        self.task = registry.acquire('ai', self.channel, self.configure,
+                                     (self.min_val, self.max_val, self.terminal_config), owner = self)
+        self.num_channels = len(self.task.ai_channels.channel_names)
+        self.timing = ai_planner(device_name(self.channel), self.num_channels)
+        self.reader = stream_readers.AnalogMultiChannelReader(self.task.in_stream)
+        self.ring = RingBuffer((self.num_channels, self.chunk_size), self.n_blocks)
+
+    def configure(self, task):
+        task.ai_channels.add_ai_voltage_chan(physical_channel = self.channel,
+                                             terminal_config = self.terminal_configs[self.terminal_config],
+                                             min_val = self.min_val, max_val = self.max_val)
+
+    def set_trigger(self, trigger = False, trigger_source = "/Dev1/PFI0", trigger_edge_key = 'rising'):
+
+        self.trigger = trigger
+
+        if not hasattr(self, 'task'):
+            raise(AttributeError('AI task not active, unable to set trigger'))
+        self.task.stop()
+        if trigger:
+            self.task.triggers.start_trigger.trig_type = nidaqmx.constants.TriggerType.DIGITAL_EDGE
+            self.task.triggers.start_trigger.cfg_dig_edge_start_trig(trigger_source = trigger_source,
+                                                                     trigger_edge = self.trigger_edge_modes[trigger_edge_key])
+        else:
+            self.task.triggers.start_trigger.disable_start_trig()
+
+        if self.verbose: print(f'trigger set to {trigger} on {trigger_source}')
+
+    def reset_task_on_channel_change(self, channel):
+        self.stop_task()
+        self.channel = channel
+        self.create_task()
+        if self.verbose: print(f'AI task recreated on {channel}')
+
+    def set_chunks(self, chunk_size, n_blocks):
+        '''Change the read size, a new ring buffer is allocated'''
+        self.chunk_size = chunk_size
+        self.n_blocks = n_blocks
+        self.ring = RingBuffer((self.num_channels, self.chunk_size), self.n_blocks)
+
+    def check_rate(self, rate):
+        '''Rate per channel actually produced by the sample clock'''
+        self.timing.check_rate(rate)
+        return self.timing.coerce_rate(rate)
+
+    def configure_acquisition(self, rate = None, sample_clock = None):
+        '''Continuous acquisition at rate per channel, on the onboard clock or
+        on the sample_clock terminal (e.g. /Dev1/ao/SampleClock)'''
+        if rate is not None:
+            self.rate = rate
+        if sample_clock is not None:
+            self.sample_clock = sample_clock
+        self.task.stop()
+        self.task.timing.cfg_samp_clk_timing(rate = float(self.rate),
+                                             source = self.sample_clock,
+                                             sample_mode = nidaqmx.constants.AcquisitionType.CONTINUOUS,
+                                             samps_per_chan = self.chunk_size * self.n_blocks)
+        # the driver buffer holds at least a second, to ride out slow callbacks
+        self.task.in_stream.input_buf_size = max(self.chunk_size * 8, int(self.rate))
+
+    def start_task(self):
+
+        if not hasattr(self, 'task'):
+            raise(AttributeError('Task not active, unable to start'))
+
+        if self.task.is_task_done():
+            self.ring.reset()
+            self.read_errors = 0
+            if not self.callback_registered:
+                self.task.register_every_n_samples_acquired_into_buffer_event(self.chunk_size, self.read_callback)
+                self.callback_registered = True
+            self.task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+            self.start_time = time.perf_counter()
+            self.task.start()
+
+    def read_callback(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        try:
+            self.reader.read_many_sample(self.ring.next_block(),
+                                         number_of_samples_per_channel = self.chunk_size,
+                                         timeout = 0)
+            self.ring.commit()
+        except Exception as err:
+            self.read_errors += 1
+            print(err)
+        return 0
+
+    def block_time(self, index):
+        '''Time of the first sample of the block with absolute index, from the start'''
+        return index * self.chunk_size / self.rate
+
+    def stop_task(self):
+        try:
+            self.task.stop()
+            if self.callback_registered:
+                self.task.register_every_n_samples_acquired_into_buffer_event(self.chunk_size, None)
+                self.callback_registered = False
+        except AttributeError as err:
+            if self.verbose:  print('Task not active: ', err)
+
+    def close(self):
+        try:
+            self.stop_task()
+            registry.release(self.task)
+            delattr(self, 'task')
+        except AttributeError as err:
+            if self.verbose:  print('Task not active: ', err)
+
+
+if __name__ == '__main__':
+
+    import time
+    from matplotlib import pyplot as plt
+
+    dev = NI_AI_device('Dev1/ai0:1', rate = 10000., chunk_size = 1000)
+
+    try:
+        dev.configure_acquisition()
+        dev.start_task()
+        time.sleep(1)
+        dev.stop_task()
+        for view in dev.ring.latest(5):
+            plt.plot(np.concatenate(view, axis = -1).T)
+        plt.show()
+    finally:
+        dev.close()
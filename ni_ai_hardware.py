@@ -0,0 +1,276 @@
+from ScopeFoundry import HardwareComponent
+from qtpy import QtCore
+import time
+
+from NIdaqmx_ScopeFoundry.ni_ai_device import NI_AI_device
+from NIdaqmx_ScopeFoundry.ni_h5_recorder import H5Recorder
+from NIdaqmx_ScopeFoundry.ni_stream_stats import StreamStats
+
+import nidaqmx.system as ni
+
+class NI_AI_hw(HardwareComponent):
+    '''Continuous analog input, the acquired blocks are in AI_device.ring'''
+
+    name = 'NI_DAQ_AI_hw'
+
+    def setup(self):
+
+        board, terminals, trig = self.detect_channels()
+
+        self.devices = self.add_logged_quantity('device',  dtype=str,
+                                                initial=board)
+        self.channel = self.add_logged_quantity('channel', dtype=str,
+                                                choices=terminals, initial=terminals[0])
+        self.terminal_config = self.add_logged_quantity('terminal_config', dtype=str,
+                                                        choices=['default', 'rse', 'nrse', 'diff'],
+                                                        initial='default')
+        self.min_val = self.add_logged_quantity('min_val', dtype = float,
+                                                si = False, ro = 0, initial = -10.,
+                                                vmin=-10, vmax=10, unit='V')
+        self.max_val = self.add_logged_quantity('max_val', dtype = float,
+                                                si = False, ro = 0, initial = 10.,
+                                                vmin=-10, vmax=10, unit='V')
+        self.rate = self.add_logged_quantity('rate', dtype = float,
+                                             si = False, ro = 0, vmin = 1.,
+                                             initial = 10000., unit='Hz')
+        self.sample_clock = self.add_logged_quantity('sample_clock', dtype = str,
+                                                     initial = '')
+        self.chunk_size = self.add_logged_quantity('chunk_size', dtype = int,
+                                                   si = False, ro = 0,
+                                                   vmin = 10, initial = 1000)
+        self.buffer_blocks = self.add_logged_quantity('buffer_blocks', dtype = int,
+                                                      si = False, ro = 0,
+                                                      vmin = 2, initial = 100)
+        self.trigger = self.add_logged_quantity('trigger', dtype = bool,
+                                                si = False, ro = 0, initial = False)
+        self.trigger_source = self.add_logged_quantity('trigger_source', dtype=str,
+                                                       choices=trig, initial=trig[0])
+        self.trigger_edge = self.add_logged_quantity('trigger_edge', dtype=str,
+                                                     choices= ['rising', 'falling'], initial='rising')
+        self.status_interval = self.add_logged_quantity('status_interval', dtype = float,
+                                                        si = False, ro = 0, vmin = 0.05,
+                                                        initial = 0.5, unit='s')
+        self.record = self.add_logged_quantity('record', dtype = bool,
+                                               si = False, ro = 0, initial = False)
+        self.record_path = self.add_logged_quantity('record_path', dtype = 'file',
+                                                    initial = 'ai_record.h5')
+        self.compression = self.add_logged_quantity('compression', dtype = str,
+                                                    choices = ['none', 'lzf', 'gzip'],
+                                                    initial = 'lzf')
+        self.record_throughput = self.add_logged_quantity('record_throughput', dtype = float,
+                                                          ro = 1, initial = 0.,
+                                                          spinbox_decimals = 3, unit='MB/s')
+        self.record_queue_depth = self.add_logged_quantity('record_queue_depth', dtype = int,
+                                                           ro = 1, initial = 0)
+        self.record_dropped = self.add_logged_quantity('record_dropped', dtype = int,
+                                                       ro = 1, initial = 0)
+        self.stats = self.add_logged_quantity('stats', dtype = bool,
+                                              si = False, ro = 0, initial = True)
+        self.stats_channel = self.add_logged_quantity('stats_channel', dtype=str,
+                                                      choices=terminals, initial=terminals[0])
+        self.stats_nperseg = self.add_logged_quantity('stats_nperseg', dtype = int,
+                                                      si = False, ro = 0,
+                                                      vmin = 16, initial = 256)
+        self.stats_mean = self.add_logged_quantity('stats_mean', dtype = float,
+                                                   ro = 1, initial = 0.,
+                                                   spinbox_decimals = 5, unit='V')
+        self.stats_std = self.add_logged_quantity('stats_std', dtype = float,
+                                                  ro = 1, initial = 0.,
+                                                  spinbox_decimals = 5, unit='V')
+        self.stats_rms = self.add_logged_quantity('stats_rms', dtype = float,
+                                                  ro = 1, initial = 0.,
+                                                  spinbox_decimals = 5, unit='V')
+        self.stats_min = self.add_logged_quantity('stats_min', dtype = float,
+                                                  ro = 1, initial = 0.,
+                                                  spinbox_decimals = 5, unit='V')
+        self.stats_max = self.add_logged_quantity('stats_max', dtype = float,
+                                                  ro = 1, initial = 0.,
+                                                  spinbox_decimals = 5, unit='V')
+        self.stats_peak_frequency = self.add_logged_quantity('stats_peak_frequency', dtype = float,
+                                                             ro = 1, initial = 0., unit='Hz')
+        self.actual_rate = self.add_logged_quantity('actual_rate', dtype = float,
+                                                    ro = 1, initial = 0., unit='Hz')
+        self.blocks_acquired = self.add_logged_quantity('blocks_acquired', dtype = int,
+                                                        ro = 1, initial = 0)
+        self.read_errors = self.add_logged_quantity('read_errors', dtype = int,
+                                                    ro = 1, initial = 0)
+
+        self.ai_terminals = terminals
+        self.channel_enable = {}
+        for terminal in terminals:
+            name = terminal.split('/')[-1]
+            self.channel_enable[terminal] = self.add_logged_quantity(f'{name}_enable', dtype = bool,
+                                                                     initial = False)
+
+        self.add_operation("start_task", self.start)
+        self.add_operation("stop_task", self.stop)
+
+    def connect(self):
+
+        self.AI_device = NI_AI_device(','.join(self.task_channels()),
+                                      rate = self.rate.val,
+                                      chunk_size = self.chunk_size.val,
+                                      n_blocks = self.buffer_blocks.val,
+                                      min_val = self.min_val.val,
+                                      max_val = self.max_val.val,
+                                      terminal_config = self.terminal_config.val,
+                                      verbose = True)
+        self.channel.hardware_set_func = self.reset_channels
+        for lq in self.channel_enable.values():
+            lq.hardware_set_func = self.reset_channels
+        for lq in [self.min_val, self.max_val, self.terminal_config]:
+            lq.hardware_set_func = self.reset_channels
+        self.blocks_acquired.hardware_read_func = self.get_blocks_acquired
+        self.read_errors.hardware_read_func = self.get_read_errors
+        self.status_timer = QtCore.QTimer()
+        self.status_timer.timeout.connect(self.read_status)
+
+    def disconnect(self):
+
+        if hasattr(self, 'status_timer'):
+            self.status_timer.stop()
+            del self.status_timer
+
+        if hasattr(self, 'AI_device'):
+            self.AI_device.close()
+            self.stop_recording()
+            self.stop_stats()
+            del self.AI_device
+
+        for lq in self.settings.as_list():
+            lq.hardware_read_func = None
+            lq.hardware_set_func = None
+
+    def start(self):
+
+        self.prepare()
+        if self.record.val:
+            self.start_recording()
+        if self.stats.val:
+            self.start_stats()
+        self.AI_device.start_task()
+        self.status_timer.start(int(1000 * self.status_interval.val))
+
+    def prepare(self):
+        '''Configure the acquisition without starting it'''
+        if not hasattr(self.AI_device, 'task'):
+            self.AI_device.create_task()
+        self.AI_device.stop_task()
+        if (self.chunk_size.val, self.buffer_blocks.val) != (self.AI_device.chunk_size, self.AI_device.n_blocks):
+            self.AI_device.set_chunks(self.chunk_size.val, self.buffer_blocks.val)
+        self.AI_device.set_trigger(self.trigger.val,
+                                   self.trigger_source.val,
+                                   self.trigger_edge.val)
+        rate = self.rate.val if self.sample_clock.val else self.AI_device.check_rate(self.rate.val)
+        self.actual_rate.update_value(float(rate))
+        self.AI_device.configure_acquisition(float(rate), self.sample_clock.val)
+
+    def stop(self):
+
+        self.status_timer.stop()
+        self.AI_device.stop_task()
+        self.stop_recording()
+        self.read_status()
+        self.stop_stats()
+        
+    def start_recording(self):
+        '''Queue every acquired block to an HDF5 dataset written on a background thread'''
+        self.stop_recording()
+        compression = {'none': None}.get(self.compression.val, self.compression.val)
+        self.recorder = H5Recorder(self.record_path.val, compression = compression)
+        attrs = {lq.name: lq.val for lq in self.settings.as_list() 
+                 if isinstance(lq.val, (bool, int, float, str))}
+        attrs.update(channels = self.AI_device.task.ai_channels.channel_names,
+                     start_time = time.strftime('%Y-%m-%dT%H:%M:%S'))
+        name = f'ai_{time.strftime("%Y%m%d_%H%M%S")}'
+        self.recorder.add_dataset(name, self.AI_device.ring.block_shape, 'float64', attrs)
+        self.record_listener = lambda index, block: self.recorder.put(name, block)
+        self.AI_device.ring.listeners.append(self.record_listener)
+        
+    def stop_recording(self):
+        if not hasattr(self, 'recorder'):
+            return
+        self.AI_device.ring.listeners.remove(self.record_listener)
+        self.read_record_status()
+        self.recorder.close()
+        del self.recorder
+        
+    def read_record_status(self):
+        stats = self.recorder.stats()
+        self.record_throughput.update_value(stats['throughput'])
+        self.record_queue_depth.update_value(stats['queue_depth'])
+        self.record_dropped.update_value(stats['dropped'])
+
+    def start_stats(self):
+        '''Merge every acquired block into a new StreamStats,
+        the ring may have been recreated since the last start'''
+        self.stop_stats()
+        self.stream_stats = StreamStats(self.AI_device.num_channels, self.AI_device.chunk_size,
+                                        self.AI_device.rate, self.stats_nperseg.val)
+        self.stats_listener = lambda index, block: self.stream_stats.update(block)
+        self.AI_device.ring.listeners.append(self.stats_listener)
+
+    def stop_stats(self):
+        '''Stop updating, self.stream_stats keeps the last statistics'''
+        if not hasattr(self, 'stats_listener'):
+            return
+        if self.stats_listener in self.AI_device.ring.listeners:
+            self.AI_device.ring.listeners.remove(self.stats_listener)
+        del self.stats_listener
+
+    def read_stats(self):
+        '''Publish the statistics of stats_channel, or of channel if it is not acquired'''
+        channels = self.task_channels()
+        index = channels.index(self.stats_channel.val) if self.stats_channel.val in channels else 0
+        stats = self.stream_stats.snapshot()
+        if stats['count'] == 0:
+            return
+        self.stats_mean.update_value(float(stats['mean'][index]))
+        self.stats_std.update_value(float(stats['std'][index]))
+        self.stats_rms.update_value(float(stats['rms'][index]))
+        self.stats_min.update_value(float(stats['min'][index]))
+        self.stats_max.update_value(float(stats['max'][index]))
+        if stats['segments']:
+            frequencies, psd = self.stream_stats.psd()
+            # DC excluded
+            self.stats_peak_frequency.update_value(float(frequencies[1 + psd[index, 1:].argmax()]))
+
+    def read_status(self):
+        '''Called at status_interval while acquiring'''
+        self.blocks_acquired.read_from_hardware()
+        self.read_errors.read_from_hardware()
+        if hasattr(self, 'recorder'):
+            self.read_record_status()
+        if hasattr(self, 'stream_stats'):
+            self.read_stats()
+
+    def task_channels(self):
+        '''channel followed by the other enabled AI channels'''
+        return [self.channel.val] + [terminal for terminal in self.ai_terminals
+                                     if terminal != self.channel.val and self.channel_enable[terminal].val]
+
+    def reset_channels(self, value = None):
+        self.AI_device.min_val = self.min_val.val
+        self.AI_device.max_val = self.max_val.val
+        self.AI_device.terminal_config = self.terminal_config.val
+        self.AI_device.reset_task_on_channel_change(','.join(self.task_channels()))
+
+    def get_blocks_acquired(self):
+        return self.AI_device.ring.count
+
+    def get_read_errors(self):
+        return self.AI_device.read_errors
+
+    def detect_channels(self):
+        ''' Find a NI device and return board + ai terminals + PFI terminals'''
+        system = ni.System.local()
+        device = system.devices[0]
+        board = device.product_type + ' : ' + device.name
+        terminals = []
+        for line in device.ai_physical_chans:
+            terminals.append(line.name)
+        trig = []
+        for j in device.terminals:
+            if 'PFI' in j:
+                trig.append(j)
+        return board, terminals, trig
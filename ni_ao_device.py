@@ -1,7 +1,15 @@
 import nidaqmx
 import numpy as np
+import threading
+import time
+
+from collections import OrderedDict
 
 from nidaqmx import stream_writers
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
+from NIdaqmx_ScopeFoundry.ni_phase import PhaseAccumulator
+from NIdaqmx_ScopeFoundry.ni_timing import ao_planner, device_name
+from NIdaqmx_ScopeFoundry.ni_waveform_expr import WaveformExpression, classic_expression
 
 class NI_AO_device(object):
     
@@ -12,25 +20,43 @@ class NI_AO_device(object):
         self.verbose = verbose
 
         self.channel = channel
+        self.timing = ao_planner(device_name(channel))
         self.sample_modes = {"continuous": nidaqmx.constants.AcquisitionType.CONTINUOUS,
                              "finite": nidaqmx.constants.AcquisitionType.FINITE,
                              "hw_timed": nidaqmx.constants.AcquisitionType.HW_TIMED_SINGLE_POINT
                              }
         self.trigger = False
+        self.regenerate = False
         self.trigger_edge_modes = {"rising": nidaqmx.constants.Edge.RISING,
                                    "falling": nidaqmx.constants.Edge.FALLING
                                    }
         
+        self.cache = OrderedDict() # LRU cache of generated samples, keyed by generation parameters
+        self.cache_lock = threading.RLock()
+        self.cache_max_bytes = 64 * 2**20
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.written_key = None # key of the samples currently in the task output buffer
+        self.stream_lock = threading.Lock() # stream source, swapped by the GUI and read by the callback
+        self.start_latency = 0. # s
+        self.stop_latency = 0. # s
+        
         self.create_task()
 
     def create_task(self):
-        '''creates a task and add an analog output channel'''            
+        '''creates a task and add the analog output channels, 
+        channel can be a comma separated list of channels sharing the task timing'''            
         if hasattr(self, 'task'):
             self.close()
             
-        self.task = nidaqmx.Task()
-        self.task.ao_channels.add_ao_voltage_chan(physical_channel=self.channel,
-                                                  min_val=-10.0, max_val=10.0) 
+        self.task = registry.acquire('ao', self.channel, self.configure, owner = self)
+        self.num_channels = len(self.task.ao_channels.channel_names)
+        self.written_key = None
+        self.stream_chunk_size = None # no every n samples callback registered on a new task
+        
+    def configure(self, task):
+        task.ao_channels.add_ao_voltage_chan(physical_channel=self.channel,
+                                             min_val=-10.0, max_val=10.0)
     
     def set_trigger(self, trigger = False, trigger_source = "/Dev1/PFI0", trigger_edge_key = 'rising'):
         
@@ -49,24 +75,34 @@ class NI_AO_device(object):
         if self.verbose: print(f'trigger set to {trigger} on {trigger_source}')
      
     def reset_task_on_mode_change(self, mode):
-        self.close()
-        self.create_task()
-        if self.verbose: print(f'AO task recreated, now operating in {mode} mode')
+        '''Keep the task, only release its resources: the next write reconfigures it'''
+        self.task.stop()
+        self.stop_stream()
+        self.task.control(nidaqmx.constants.TaskMode.TASK_UNRESERVE)
+        self.written_key = None
+        if self.verbose: print(f'AO task released, now operating in {mode} mode')
         
     def reset_task_on_channel_change(self, channel):
         self.close()
         self.channel = channel
+        self.timing = ao_planner(device_name(channel))
         self.create_task()
         if self.verbose: print(f'AO task recreated, now operating in channel {channel}')
         
     def write_constant_voltage(self, voltage): 
         try:
             self.task.stop()
+            self.stop_stream()
         except AttributeError as err:
             if self.verbose:  print('Task not active: ', err)
+        self.written_key = None
+        # on demand write on the same task, even if a sample clock was configured
+        self.task.timing.samp_timing_type = nidaqmx.constants.SampleTimingType.ON_DEMAND
+        if self.num_channels > 1:
+            voltage = [voltage] * self.num_channels
         self.task.write(voltage, auto_start = True)
         if self.verbose: print(f'AO voltage set to {voltage}' )
-       
+        
     
     
     def write_waveform( self, sample_mode_key = 'continuous'):
@@ -81,20 +117,256 @@ class NI_AO_device(object):
         sample_mode = self.sample_modes[sample_mode_key]
             
         samples = self.samples
-        num_samples = len(samples) # self.num_periods * int(self.rate/self.frequency)
+        num_samples = samples.shape[-1] # self.num_periods * int(self.rate/self.frequency)
         rate = self.rate
+        if samples.ndim != 1 and len(samples) != self.num_channels:
+            raise(ValueError(f'Samples generated for {len(samples)} channels, task has {self.num_channels}'))
+        
+        samps_per_chan = num_samples
+        if self.regenerate and sample_mode_key == 'finite':
+            # the block is repeated by the driver up to the requested length
+            samps_per_chan = self.num_samples
+        
+        written_key = (self.key, sample_mode_key)
+        if written_key == self.written_key:
+            if self.verbose: print('samples already in the output buffer, write skipped')
+            return
         
         try:
             self.task.stop()
-            self.task.timing.cfg_samp_clk_timing(rate = rate, 
+            self.stop_stream()
+            self.task.timing.cfg_samp_clk_timing(rate = float(rate), 
                                                  sample_mode = sample_mode, 
-                                                 samps_per_chan = num_samples)
-            writer = stream_writers.AnalogSingleChannelWriter(self.task.out_stream, auto_start = False)
-            written_num = writer.write_many_sample(samples)
+                                                 samps_per_chan = samps_per_chan)
+            self.task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.ALLOW_REGENERATION
+            # sized to the written samples in every mode, a buffer left by a previous 
+            # regenerated block must not apply to a longer write
+            self.task.out_stream.output_buf_size = num_samples
+            written_num = self.writer().write_many_sample(samples)
+            self.task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+            self.written_key = written_key
             if self.verbose: print(f'successfully written {written_num} samples' )
             
         except Exception as err: 
+            self.written_key = None
             print (err)
+    
+    def stream_waveform(self, chunks, rate, chunk_size = 10000, buffer_chunks = 4):
+        '''Configure a continuous, non regenerated generation fed by chunks, an iterable 
+        of sample arrays of any length. The buffer is prefilled, then each time chunk_size
+        samples are transferred to the board the next chunk_size samples are written.
+        When chunks is exhausted the output is padded with 0 V. Call start_task to start.
+        '''
+        if not hasattr(self, 'task'):
+            raise(AttributeError('AO task not active, unable to stream signal'))
+        if self.num_channels > 1:
+            raise(ValueError('Streaming is available on a single AO channel only'))
+            
+        self.task.stop()
+        self.stop_stream()
+        self.written_key = None
+        self.rate = rate
+        self.stream_chunks = iter(chunks)
+        self.stream_pending = np.zeros(0)
+        self.stream_done = False
+        self.stream_buffer = np.zeros(chunk_size) # reused for every write
+        
+        buffer_size = chunk_size * buffer_chunks
+        self.task.timing.cfg_samp_clk_timing(rate = float(rate), 
+                                             sample_mode = self.sample_modes['continuous'], 
+                                             samps_per_chan = buffer_size)
+        self.task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.DONT_ALLOW_REGENERATION
+        self.task.out_stream.output_buf_size = buffer_size
+        self.stream_writer = stream_writers.AnalogSingleChannelWriter(self.task.out_stream, auto_start = False)
+        for _ in range(buffer_chunks):
+            self.write_next_chunk()
+        self.task.register_every_n_samples_transferred_from_buffer_event(chunk_size, self.stream_callback)
+        self.stream_chunk_size = chunk_size
+        self.task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+        if self.verbose: print(f'streaming prepared, buffer of {buffer_size} samples')
+        
+    def fill_stream_buffer(self):
+        '''Copy the next samples from the stream iterator into the reusable buffer'''
+        buffer = self.stream_buffer
+        filled = 0
+        while filled < len(buffer):
+            if len(self.stream_pending) == 0:
+                try:
+                    self.stream_pending = np.asarray(next(self.stream_chunks), dtype = 'float')
+                    continue
+                except StopIteration:
+                    buffer[filled:] = 0.
+                    self.stream_done = True
+                    return
+            n = min(len(self.stream_pending), len(buffer) - filled)
+            buffer[filled:filled+n] = self.stream_pending[:n]
+            self.stream_pending = self.stream_pending[n:]
+            filled += n
+        
+    def write_next_chunk(self):
+        self.fill_stream_buffer()
+        self.stream_writer.write_many_sample(self.stream_buffer)
+        
+    def stream_callback(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        try:
+            with self.stream_lock:
+                self.write_next_chunk()
+        except Exception as err:
+            print(err)
+        return 0
+    
+    def stop_stream(self):
+        '''Unregister the streaming callback, if any'''
+        if getattr(self, 'stream_chunk_size', None) is None:
+            return
+        self.task.register_every_n_samples_transferred_from_buffer_event(self.stream_chunk_size, None)
+        self.stream_chunk_size = None
+        self.stream_chunks = None
+        
+    def waveform_chunks(self, chunk_size = 10000,
+                        waveform_type = 'sine',
+                        amplitude_list = [1.,0.],        
+                        frequency = 50,
+                        spike_amplitude = 0., spike_duration = 0., 
+                        samples_per_period = 100,
+                        steps = 3,
+                        offset = 0,
+                        expression = '',
+                        phase = None):
+        '''Endless generator of phase continuous chunks of the periodic waveform,
+        to be used as source of stream_waveform. 
+        An existing PhaseAccumulator can be passed to continue its phase
+        '''
+        rate = self.check_rate(frequency * samples_per_period)
+        waveform = self.compile_waveform(waveform_type, amplitude_list, spike_amplitude, 
+                                         spike_duration, offset, expression)
+        cycle = steps if waveform.uses_period else 1
+        if phase is None:
+            phase = PhaseAccumulator(frequency, rate, cycle)
+        self.stream_phase = phase
+        while True:
+            yield waveform.evaluate(phase, chunk_size, frequency)
+    
+    def file_chunks(self, file_path, chunk_size = 10000, file_format = 'npy', 
+                    scale = 10/32768, loop = False):
+        '''Generator of consecutive slices of a waveform file mapped with np.memmap,
+        to be used as source of stream_waveform. Only the slices being written are read 
+        from disk, so the file size does not matter.
+        file_format is 'npy' (1D array of volts) or the dtype of a raw file: 'float64' 
+        in volts, 'int16' in counts converted to volts with scale
+        '''
+        if file_format == 'npy':
+            data = np.load(file_path, mmap_mode = 'r')
+        else:
+            data = np.memmap(file_path, dtype = file_format, mode = 'r')
+        if data.ndim != 1:
+            raise(ValueError('Waveform file must contain a 1D array'))
+        self.file_num_samples = len(data)
+        if self.verbose: print(f'waveform file {file_path} mapped, {len(data)} samples')
+        
+        while True:
+            for start in range(0, len(data), chunk_size):
+                chunk = data[start:start+chunk_size]
+                if data.dtype.kind in 'iu':
+                    chunk = np.multiply(chunk, scale)
+                yield chunk
+            if not loop or len(data) == 0:
+                return
+        
+    def is_running(self):
+        return hasattr(self, 'task') and not self.task.is_task_done()
+        
+    def update_waveform(self, waveform_type = 'sine',
+                            num_periods = 6, 
+                            amplitude_list = [1.,0.],        
+                            frequency = 50,
+                            spike_amplitude = 0., spike_duration = 0., 
+                            samples_per_period = 100,
+                            steps = 3,
+                            offset = 0,
+                            regenerate = False,
+                            expression = ''):
+        '''Change the waveform of a running generation without stopping the task.
+        With regeneration the new block is written at the current write position, 
+        which is the start of the buffer and therefore a period boundary: the write 
+        returns once the old block has been output and the new one follows without gap.
+        When streaming, the chunk source is replaced by one at the new frequency 
+        continuing from the current phase.
+        Returns False if the change needs a restart (task not running, new rate or length)
+        '''
+        if not self.is_running():
+            return False
+        
+        if self.stream_chunk_size is not None:
+            rate = self.check_rate(frequency * samples_per_period)
+            if float(rate) != float(self.rate):
+                return False
+            waveform = self.compile_waveform(waveform_type, amplitude_list, spike_amplitude, 
+                                             spike_duration, offset, expression)
+            cycle = steps if waveform.uses_period else 1
+            # the callback does not advance the phase while the source is swapped
+            with self.stream_lock:
+                phase = self.stream_phase.retune(frequency, rate, cycle)
+                self.stream_phase = phase # the generator sets it only at its first chunk
+                self.stream_chunks = self.waveform_chunks(self.stream_chunk_size, waveform_type,
+                                                          amplitude_list, frequency, 
+                                                          spike_amplitude, spike_duration,
+                                                          samples_per_period, steps, offset,
+                                                          expression, phase = phase)
+            if self.verbose: print('AO stream source updated')
+            return True
+        
+        return self.rewrite_buffer(self.generate_waveform, waveform_type, num_periods, 
+                                   amplitude_list, frequency, spike_amplitude, spike_duration, 
+                                   samples_per_period, steps, offset, regenerate, expression)
+        
+    def update_multichannel_waveform(self, channel_settings):
+        '''Same as update_waveform for the samples of generate_multichannel_waveform'''
+        if not self.is_running() or self.stream_chunk_size is not None:
+            return False
+        return self.rewrite_buffer(self.generate_multichannel_waveform, channel_settings)
+    
+    def rewrite_buffer(self, generate, *args):
+        '''Regenerate the samples with generate(*args) and write them in the buffer of the 
+        running task, if rate and buffer shape are unchanged'''
+        if self.written_key is None:
+            return False
+        old_rate = self.rate
+        old_shape = self.samples.shape
+        sample_mode_key = self.written_key[1]
+        generate(*args)
+        if self.rate != old_rate or self.samples.shape != old_shape:
+            return False
+        
+        written_num = self.writer().write_many_sample(self.samples)
+        self.written_key = (self.key, sample_mode_key)
+        if self.verbose: print(f'AO waveform updated live, {written_num} samples written' )
+        return True
+    
+    def writer(self):
+        if self.num_channels > 1:
+            return stream_writers.AnalogMultiChannelWriter(self.task.out_stream, auto_start = False)
+        return stream_writers.AnalogSingleChannelWriter(self.task.out_stream, auto_start = False)
+    
+    def check_rate(self, rate):
+        '''Raise if rate is above the AO maximum rate of the board'''
+        return self.timing.check_rate(rate)
+    
+    def plan_timing(self, frequency, samples_per_period, search = True):
+        '''TimingPlan with the rate the board can produce, see ni_timing.TimingPlanner'''
+        return self.timing.plan(frequency, samples_per_period, search)
+    
+    def set_cache_max_bytes(self, max_bytes):
+        self.cache_max_bytes = int(max_bytes)
+        with self.cache_lock:
+            self.trim_cache()
+        
+    def trim_cache(self):
+        '''Evict the least recently used samples until the cache fits in cache_max_bytes'''
+        size = sum(samples.nbytes for samples in self.cache.values())
+        while self.cache and size > self.cache_max_bytes:
+            _key, samples = self.cache.popitem(last = False)
+            size -= samples.nbytes
         
     def generate_waveform(self, waveform_type = 'sine',
                             num_periods = 6, 
@@ -103,75 +375,166 @@ class NI_AO_device(object):
                             spike_amplitude = 0., spike_duration = 0., 
                             samples_per_period = 100,
                             steps = 3,
-                            offset = 0):
+                            offset = 0,
+                            regenerate = False,
+                            expression = ''):
         '''For waveform_type == step a function with steps of the specified amplitude[0] is generated
         Is spike_amplitude > 0 a voltage spike is generated at the beginning of each period 
+        For waveform_type == expression the samples are given by expression (see ni_waveform_expr)
+        If regenerate is True only the smallest repeating block is generated (one period, 
+        or steps periods for step and custom) and the driver regeneration repeats it
+        Generated samples are cached: a call with unchanged parameters reuses them
         '''
-        rate = frequency * samples_per_period 
-        if rate >= 250000:
-            raise(ValueError('Frequency too high, unable to set NIDAQ analog output'))
-         
-        self.rate = rate
-        dt = 1/rate
-        T = 1/frequency # Hz
-        
-        amplitude = amplitude_list[0]
-        amplitude1 = amplitude_list[1]
+        self.rate = self.check_rate(frequency * samples_per_period)
+        self.num_samples = num_periods * samples_per_period
+        self.regenerate = regenerate
+        self.key, self.samples = self.waveform_samples(waveform_type, num_periods, amplitude_list,
+                                                       frequency, spike_amplitude, spike_duration,
+                                                       samples_per_period, steps, offset,
+                                                       regenerate, expression)
         
-        Ncycles = num_periods
-        epsilon = 1e-9 # 1ns delay to avoid approximation error in rect and step function
-        t = np.arange(0, Ncycles*T, dt) + epsilon
-
-        if waveform_type == "sine":
-            samples = amplitude * np.sin(2*np.pi*t/T)
+    def waveform_samples(self, waveform_type = 'sine',
+                            num_periods = 6, 
+                            amplitude_list = [1.,0.],        
+                            frequency = 50,
+                            spike_amplitude = 0., spike_duration = 0., 
+                            samples_per_period = 100,
+                            steps = 3,
+                            offset = 0,
+                            regenerate = False,
+                            expression = ''):
+        '''Return the cache key and the samples of generate_waveform, from the cache if possible.
+        The device state is not changed, so it can run on a worker thread
+        '''
+        return self.single_samples(waveform_type, num_periods, amplitude_list, frequency,
+                                   spike_amplitude, spike_duration, samples_per_period, steps,
+                                   offset, regenerate, expression, count = True)
+    
+    def single_samples(self, waveform_type, num_periods, amplitude_list, frequency,
+                       spike_amplitude, spike_duration, samples_per_period, steps,
+                       offset, regenerate, expression = '', count = True):
+        '''waveform_samples, counting the cache lookup in the hits and misses only if count'''
+        rate = self.check_rate(frequency * samples_per_period)
+        key = (waveform_type, num_periods, tuple(amplitude_list), frequency,
+               spike_amplitude, spike_duration, samples_per_period, steps, offset, regenerate, expression)
         
-        elif waveform_type == "rect": 
-            width = 0.5
-            samples =  amplitude * ( (t) % T < (width*T) ).astype('float')
+        def compute():
+            waveform = self.compile_waveform(waveform_type, amplitude_list, spike_amplitude, 
+                                             spike_duration, offset, expression)
+            Ncycles = num_periods
+            cycle = steps if waveform.uses_period else 1
+            if regenerate:
+                Ncycles = cycle
+            phase = PhaseAccumulator(frequency, rate, cycle)
+            return waveform.evaluate(phase, Ncycles * samples_per_period, frequency)
         
-        elif waveform_type == "step": 
-            Nsteps = steps # number of steps is set to 3 here
-            deltaAmp = amplitude # the voltage increase in each step is deltaAmp
-            samples =  deltaAmp * ( (t//T) % Nsteps ).astype('float')
+        return key, self.cached(key, compute, count)
+    
+    def cached(self, key, compute, count = True):
+        '''Samples of key from the cache, or computed by compute() and cached.
+        With count the lookup is added to cache_hits or cache_misses'''
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                if count: self.cache_hits += 1
+                return self.cache[key]
+            if count: self.cache_misses += 1
+        samples = compute()
+        samples.flags.writeable = False # shared with the cache
+        with self.cache_lock:
+            self.cache[key] = samples
+            self.trim_cache()
+        return samples
+              
+    def generate_multichannel_waveform(self, channel_settings):
+        '''Generate one waveform per task channel, channel_settings is a list of dicts of
+        generate_waveform arguments. All channels share the sample clock, so frequency
+        and samples_per_period must match. The samples are stacked in a C-contiguous 
+        (n_channels, n_samples) array for AnalogMultiChannelWriter
+        '''
+        settings = channel_settings[0]
+        self.rate = self.check_rate(settings['frequency'] * settings['samples_per_period'])
+        self.num_samples = settings['num_periods'] * settings['samples_per_period']
+        self.regenerate = any(s.get('regenerate', False) for s in channel_settings)
+        self.key, self.samples = self.multichannel_samples(channel_settings)
         
-        elif waveform_type == "custom": 
-            Nsteps = steps # number of steps is set to 3 here
-            deltaAmp0 = amplitude # the voltage increase in each step is deltaAmp
-            deltaAmp1 = amplitude1         
-            cycle = ((t // T) % Nsteps).astype('int')
-            samples = deltaAmp0*(cycle>0) + deltaAmp1*(cycle>1)
+    def multichannel_samples(self, channel_settings):
+        '''Return the cache key and the samples of generate_multichannel_waveform, 
+        without changing the device state'''
+        rates = set(settings['frequency'] * settings['samples_per_period'] for settings in channel_settings)
+        if len(rates) != 1:
+            raise(ValueError('All AO channels must have the same frequency and samples_per_period'))
         
+        settings = [dict(settings) for settings in channel_settings]
+        regenerate = any(s.get('regenerate', False) for s in settings)
+        if regenerate:
+            # a block common to all channels: the least common multiple of the number
+            # of samples after which each channel repeats (steps periods or one period)
+            repeats = []
+            for s in settings:
+                waveform = self.compile_waveform(s['waveform_type'], s['amplitude_list'],
+                                                 s['spike_amplitude'], s['spike_duration'],
+                                                 s['offset'], s.get('expression', ''))
+                cycle = s['steps'] if waveform.uses_period else 1
+                repeats.append(cycle * s['samples_per_period'])
+            num_samples = int(np.lcm.reduce(repeats))
         else:
-            raise(ValueError('Waveform not specified'))
+            num_samples = settings[0]['num_periods'] * settings[0]['samples_per_period']
+        for s in settings:
+            # enough periods of each channel to cover num_samples, cut to it below
+            s['regenerate'] = False
+            s['num_periods'] = -(-num_samples // s['samples_per_period'])
             
-        if spike_amplitude > 0:
-            # spikeT = 0.0005 #s
-            # spikeT = 0.05/freq # percentage of the step duration
-            samples += spike_amplitude * ( (t%T) < spike_duration)
+        key = (num_samples,) + tuple(tuple(sorted((k, repr(v)) for k, v in s.items())) for s in settings)
+        # counted once as a whole, the rows reuse the single channel cache silently
+        samples = self.cached(key, lambda: np.stack([self.single_samples(**s, count = False)[1][:num_samples] 
+                                                     for s in settings])) # C-contiguous
+        return key, samples
+    
+    def precompute(self, channel_settings):
+        '''Fill the cache with the samples of channel_settings (a list with one dict of 
+        generate_waveform arguments per channel), so that the next generate call is a hit'''
+        if len(channel_settings) > 1:
+            self.multichannel_samples(channel_settings)
+        else:
+            self.waveform_samples(**channel_settings[0])
+        
+    def compile_waveform(self, waveform_type, amplitude_list, spike_amplitude, spike_duration, 
+                         offset, expression = ''):
+        '''Return the WaveformExpression of waveform_type, or of expression if waveform_type is 'expression' '''
+        if waveform_type == 'expression':
+            return WaveformExpression(expression)
+        return WaveformExpression(classic_expression(waveform_type, amplitude_list, 
+                                                     spike_amplitude, spike_duration, offset))
         
-        samples += offset
-        self.samples = samples
-              
     def start_task(self):
         
         if not hasattr(self, 'task'):
             raise(AttributeError('Task not active, unable to start'))
         
         if self.task.is_task_done()==True:
+            start_time = time.perf_counter()
             self.task.start()
+            self.start_latency = time.perf_counter() - start_time
         
     def stop_task(self):
+        '''Stop the generation and set 0 V with an on demand write on the same task.
+        The 0 V replace the samples in the output buffer, so written_key is cleared:
+        the next write_waveform configures the sample clock and writes the samples 
+        again, taken from the cache without regenerating them'''
         try:
-            self.task.stop()
-            self.create_task()
+            start_time = time.perf_counter()
             self.write_constant_voltage(0.0)
+            self.stop_latency = time.perf_counter() - start_time
         except AttributeError as err:
             if self.verbose:  print('Task not active: ', err)
             
     def close(self):
+        '''Give the task back to the registry, where it stays configured for reuse'''
         try:
-            self.task.stop()
-            self.task.close()
+            self.task.stop() # events can only be unregistered on a stopped task
+            self.stop_stream()
+            registry.release(self.task)
             delattr(self, 'task')
         except AttributeError as err:
             if self.verbose:  print('Task not active: ', err) 
@@ -181,6 +544,7 @@ if __name__ == '__main__':
     
     import time  
     from matplotlib import pyplot as plt
+    from NIdaqmx_ScopeFoundry.ni_decimation import MinMaxPyramid
        
     dev = NI_AO_device('Dev2/ao0')
     
@@ -203,7 +567,8 @@ if __name__ == '__main__':
             dev.start_task()
             time.sleep(1.1)
             plt.figure() 
-            plt.plot(dev.samples)
+            x, y = MinMaxPyramid.from_array(dev.samples).view(0, dev.samples.shape[-1], 2000)
+            plt.plot(x, y.T)
             
         dev.stop_task()
         
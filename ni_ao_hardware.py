@@ -1,8 +1,10 @@
 from ScopeFoundry import HardwareComponent
 
 from NIdaqmx_ScopeFoundry.ni_ao_device import NI_AO_device
+from NIdaqmx_ScopeFoundry.ni_precompute import DebouncedWorker
 
 import nidaqmx.system as ni
+import time
 
 class NI_AO_hw(HardwareComponent):
     
@@ -17,7 +19,7 @@ class NI_AO_hw(HardwareComponent):
         self.channel = self.add_logged_quantity('channel', dtype=str, 
                                                 choices=terminals, initial=terminals[0])
         self.mode = self.add_logged_quantity('mode', dtype=str, 
-                                             choices=['ao_voltage', 'ao_waveform'],
+                                             choices=['ao_voltage', 'ao_waveform', 'ao_stream', 'ao_file'],
                                              initial='ao_waveform')
         self.sample_mode = self.add_logged_quantity('sample_mode', dtype = str,
                                                     choices=[ "continuous", "finite"],
@@ -36,8 +38,10 @@ class NI_AO_hw(HardwareComponent):
                                                        initial = 3, vmin= 1)
         
         self.waveform = self.add_logged_quantity('waveform', dtype=str,
-                                                 choices=["rect", "step", "custom"],
+                                                 choices=["sine", "rect", "step", "custom", "expression"],
                                                  initial='rect')
+        self.expression = self.add_logged_quantity('expression', dtype=str,
+                                                   initial='sum(rect(amplitude=1, duty=0.5), constant(value=0))')
         self.frequency = self.add_logged_quantity('frequency', dtype = float,
                                                   si = False, ro = 0,
                                                   initial = 200, unit='Hz')
@@ -47,6 +51,36 @@ class NI_AO_hw(HardwareComponent):
         self.samples_per_period = self.add_logged_quantity('samples_per_period', dtype = int,
                                                            si = False, ro = 0,
                                                            vmin= 2, initial = 200)
+        self.regenerate = self.add_logged_quantity('regenerate', dtype = bool,
+                                                   si = False, ro = 0, initial = False)
+        self.stream_chunk_size = self.add_logged_quantity('stream_chunk_size', dtype = int,
+                                                          si = False, ro = 0,
+                                                          vmin = 100, initial = 10000)
+        self.file_path = self.add_logged_quantity('file_path', dtype = 'file',
+                                                  initial = '')
+        self.file_format = self.add_logged_quantity('file_format', dtype = str,
+                                                    choices = ['npy', 'float64', 'int16'],
+                                                    initial = 'npy')
+        self.file_rate = self.add_logged_quantity('file_rate', dtype = float,
+                                                  si = False, ro = 0, vmin = 1.,
+                                                  initial = 10000., unit='Hz')
+        self.file_scale = self.add_logged_quantity('file_scale', dtype = float,
+                                                   si = False, ro = 0, initial = 10/32768,
+                                                   spinbox_decimals = 8, unit='V')
+        self.file_loop = self.add_logged_quantity('file_loop', dtype = bool,
+                                                  si = False, ro = 0, initial = False)
+        self.exact_timing = self.add_logged_quantity('exact_timing', dtype = bool,
+                                                     si = False, ro = 0, initial = False)
+        self.actual_rate = self.add_logged_quantity('actual_rate', dtype = float,
+                                                    ro = 1, initial = 0., unit='Hz')
+        self.actual_frequency = self.add_logged_quantity('actual_frequency', dtype = float,
+                                                         ro = 1, initial = 0., 
+                                                         spinbox_decimals = 6, unit='Hz')
+        self.frequency_error = self.add_logged_quantity('frequency_error', dtype = float,
+                                                        ro = 1, initial = 0., 
+                                                        spinbox_decimals = 9, unit='Hz')
+        self.live_update = self.add_logged_quantity('live_update', dtype = bool,
+                                                    si = False, ro = 0, initial = True)
         self.trigger = self.add_logged_quantity('trigger', dtype = bool,
                                                 si = False, ro = 0, initial = False)
         self.trigger_source = self.add_logged_quantity('trigger_source', dtype=str,
@@ -59,20 +93,65 @@ class NI_AO_hw(HardwareComponent):
                                                        si = False, ro = 0,
                                                        spinbox_decimals = 4, spinbox_step=0.001,
                                                        initial = 0., vmin= 0., unit='s')
+        self.cache_max_size = self.add_logged_quantity('cache_max_size', dtype = float,
+                                                       si = False, ro = 0, initial = 64.,
+                                                       vmin = 0., unit='MB')
+        self.cache_hits = self.add_logged_quantity('cache_hits', dtype = int,
+                                                   ro = 1, initial = 0)
+        self.cache_misses = self.add_logged_quantity('cache_misses', dtype = int,
+                                                     ro = 1, initial = 0)
         
+        self.start_latency = self.add_logged_quantity('start_latency', dtype = float,
+                                                      ro = 1, initial = 0., 
+                                                      spinbox_decimals = 3, unit='ms')
+        self.start_duration = self.add_logged_quantity('start_duration', dtype = float,
+                                                       ro = 1, initial = 0., 
+                                                       spinbox_decimals = 3, unit='ms')
+        self.stop_latency = self.add_logged_quantity('stop_latency', dtype = float,
+                                                     ro = 1, initial = 0., 
+                                                     spinbox_decimals = 3, unit='ms')
+        
+        self.ao_terminals = terminals
+        self.channel_enable = {}
+        self.channel_expression = {}
+        for terminal in terminals:
+            # additional channels generated in the same task, sample-aligned with channel
+            name = terminal.split('/')[-1]
+            self.channel_enable[terminal] = self.add_logged_quantity(f'{name}_enable', dtype = bool,
+                                                                     initial = False)
+            self.channel_expression[terminal] = self.add_logged_quantity(f'{name}_expression', dtype = str,
+                                                                         initial = '')
         
         self.add_operation("start_task", self.start)
         self.add_operation("stop_task", self.stop)
         
     def connect(self):
 
-        self.AO_device = NI_AO_device(self.channel.val, verbose = True)
+        self.AO_device = NI_AO_device(','.join(self.task_channels()), verbose = True)
         self.AO_device.create_task()
         self.mode.hardware_set_func = self.AO_device.reset_task_on_mode_change
-        self.channel.hardware_set_func = self.AO_device.reset_task_on_channel_change
+        self.channel.hardware_set_func = self.reset_channels
+        for lq in self.channel_enable.values():
+            lq.hardware_set_func = self.reset_channels
+        for lq in [self.waveform, self.num_periods, self.amplitude0, self.amplitude1,
+                   self.frequency, self.spike_amplitude, self.spike_duration,
+                   self.samples_per_period, self.steps, self.offset, self.regenerate,
+                   self.expression, self.exact_timing, *self.channel_expression.values()]:
+            lq.hardware_set_func = self.update_waveform
+        self.cache_max_size.hardware_set_func = self.set_cache_max_size
+        self.cache_hits.hardware_read_func = self.get_cache_hits
+        self.cache_misses.hardware_read_func = self.get_cache_misses
+        self.start_latency.hardware_read_func = self.get_start_latency
+        self.stop_latency.hardware_read_func = self.get_stop_latency
+        self.set_cache_max_size(self.cache_max_size.val)
+        self.precompute = DebouncedWorker(self.AO_device.precompute, verbose = True)
+        self.precompute.trigger(self.channel_settings())
         
     def disconnect(self):
         
+        if hasattr(self, 'precompute'):
+            self.precompute.flush()
+            
         if hasattr(self, 'AO_device'):
             self.AO_device.close()
             del self.AO_device
@@ -83,6 +162,17 @@ class NI_AO_hw(HardwareComponent):
             
     def start(self):
     
+        start_time = time.perf_counter()
+        self.prepare()
+        self.AO_device.start_task()
+        self.start_duration.update_value(1e3 * (time.perf_counter() - start_time))
+        self.cache_hits.read_from_hardware()
+        self.cache_misses.read_from_hardware()
+        self.start_latency.read_from_hardware()
+        
+    def prepare(self):
+        '''Configure and write the task for the current mode without starting it'''
+        self.precompute.flush()
         if not hasattr(self.AO_device, 'task'):
             self.AO_device.create_task()
         
@@ -90,25 +180,122 @@ class NI_AO_hw(HardwareComponent):
             self.AO_device.set_trigger(self.trigger.val, 
                                        self.trigger_source.val, 
                                        self.trigger_edge.val)
-            self.AO_device.generate_waveform(  self.waveform.val,  
-                                            self.num_periods.val,
-                                            [self.amplitude0.val, self.amplitude1.val], 
-                                            self.frequency.val,
-                                            self.spike_amplitude.val,
-                                            self.spike_duration.val,
-                                            self.samples_per_period.val,
-                                            self.steps.val,
-                                            self.offset.val ) 
+            channel_settings = self.channel_settings()
+            if len(channel_settings) > 1:
+                self.AO_device.generate_multichannel_waveform(channel_settings)
+            else:
+                self.AO_device.generate_waveform(**channel_settings[0]) 
             self.AO_device.write_waveform(self.sample_mode.val)
+        elif self.mode.val == 'ao_stream':
+            self.AO_device.set_trigger(self.trigger.val, 
+                                       self.trigger_source.val, 
+                                       self.trigger_edge.val)
+            settings = self.waveform_settings()
+            del settings['num_periods'], settings['regenerate']
+            chunks = self.AO_device.waveform_chunks(self.stream_chunk_size.val, **settings)
+            self.AO_device.stream_waveform(chunks,
+                                           settings['frequency'] * settings['samples_per_period'],
+                                           self.stream_chunk_size.val)
+        elif self.mode.val == 'ao_file':
+            self.AO_device.set_trigger(self.trigger.val, 
+                                       self.trigger_source.val, 
+                                       self.trigger_edge.val)
+            chunks = self.AO_device.file_chunks(self.file_path.val,
+                                                self.stream_chunk_size.val,
+                                                self.file_format.val,
+                                                self.file_scale.val,
+                                                self.file_loop.val)
+            self.AO_device.stream_waveform(chunks,
+                                           self.AO_device.check_rate(self.report_file_rate()),
+                                           self.stream_chunk_size.val)
         elif self.mode.val == 'ao_voltage':
             self.AO_device.write_constant_voltage(self.amplitude0.val)
         else: 
             raise(AttributeError('Waveform not specified'))
         
-        self.AO_device.start_task()
-        
     def stop(self):
         self.AO_device.stop_task()
+        self.stop_latency.read_from_hardware()
+        
+    def waveform_settings(self):
+        '''generate_waveform arguments. With exact_timing, frequency and samples_per_period 
+        are replaced by the closest combination the board can produce'''
+        plan = self.AO_device.plan_timing(self.frequency.val, self.samples_per_period.val, 
+                                          search = self.exact_timing.val)
+        self.report_timing(plan.rate, plan.frequency)
+        return dict(waveform_type = self.waveform.val,
+                    num_periods = self.num_periods.val,
+                    amplitude_list = [self.amplitude0.val, self.amplitude1.val],
+                    frequency = float(plan.frequency),
+                    spike_amplitude = self.spike_amplitude.val,
+                    spike_duration = self.spike_duration.val,
+                    samples_per_period = plan.samples_per_period,
+                    steps = self.steps.val,
+                    offset = self.offset.val,
+                    regenerate = self.regenerate.val,
+                    expression = self.expression.val)
+    
+    def update_waveform(self, value = None):
+        '''Apply a waveform setting to the running generation, 
+        restart the task only if the change cannot be written live.
+        Otherwise prepare the samples in background, so that start only writes them'''
+        if self.mode.val in ('ao_voltage', 'ao_file'):
+            return
+        if not (self.live_update.val and self.AO_device.is_running()):
+            if self.mode.val == 'ao_waveform':
+                self.precompute.trigger(self.channel_settings())
+            return
+        if len(self.task_channels()) > 1:
+            updated = self.AO_device.update_multichannel_waveform(self.channel_settings())
+        else:
+            updated = self.AO_device.update_waveform(**self.waveform_settings())
+        if not updated:
+            self.start()
+            
+    def task_channels(self):
+        '''channel followed by the other enabled AO channels'''
+        return [self.channel.val] + [terminal for terminal in self.ao_terminals 
+                                     if terminal != self.channel.val and self.channel_enable[terminal].val]
+        
+    def channel_settings(self):
+        '''Waveform settings of each task channel: the additional channels follow their 
+        expression, or copy the main waveform if it is empty'''
+        settings = [self.waveform_settings()]
+        for terminal in self.task_channels()[1:]:
+            channel_settings = self.waveform_settings()
+            expression = self.channel_expression[terminal].val
+            if expression:
+                channel_settings.update(waveform_type = 'expression', expression = expression)
+            settings.append(channel_settings)
+        return settings
+    
+    def reset_channels(self, value = None):
+        self.AO_device.reset_task_on_channel_change(','.join(self.task_channels()))
+        
+    def report_timing(self, rate, frequency):
+        self.actual_rate.update_value(float(rate))
+        self.actual_frequency.update_value(float(frequency))
+        self.frequency_error.update_value(float(frequency) - self.frequency.val)
+        
+    def report_file_rate(self):
+        rate = self.AO_device.timing.coerce_rate(self.file_rate.val)
+        self.actual_rate.update_value(float(rate))
+        return float(rate)
+        
+    def set_cache_max_size(self, size_MB):
+        self.AO_device.set_cache_max_bytes(size_MB * 2**20)
+        
+    def get_cache_hits(self):
+        return self.AO_device.cache_hits
+    
+    def get_cache_misses(self):
+        return self.AO_device.cache_misses
+    
+    def get_start_latency(self):
+        return 1e3 * self.AO_device.start_latency
+    
+    def get_stop_latency(self):
+        return 1e3 * self.AO_device.stop_latency
         
     def detect_channels(self):
         ''' Find a NI device and return board + do_terminals'''
@@ -1,5 +1,8 @@
 
 from ScopeFoundry import BaseMicroscopeApp
+from qtpy import QtCore
+
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
 
 class NI_App(BaseMicroscopeApp):
 
@@ -12,25 +15,42 @@ class NI_App(BaseMicroscopeApp):
     def setup(self):
         
         #Add App wide settings
+        self.settings.New('task_table', dtype=str, ro=True, initial='')
         
         #Add hardware components
         print("Adding Hardware Components")
         from ni_ao_hardware import NI_AO_hw
         from ni_do_hardware import NI_DO_hw
         from ni_co_hardware import NI_CO_hw
+        from ni_ci_hardware import NI_CI_hw
+        from ni_ai_hardware import NI_AI_hw
         self.add_hardware(NI_AO_hw(self))
         self.add_hardware(NI_DO_hw(self))
         self.add_hardware(NI_CO_hw(self))
+        self.add_hardware(NI_CI_hw(self))
+        self.add_hardware(NI_AI_hw(self))
         
         #Add measurement components
         print("Create Measurement objects")
+        from ni_live_plot import NI_LivePlot_measurement
+        self.add_measurement(NI_LivePlot_measurement(self))
+        from ni_loopback import NI_Loopback_measurement
+        self.add_measurement(NI_Loopback_measurement(self))
         # Connect to custom gui
         
         # load side panel UI
         
+        # tasks of the registry, with owner and state
+        self.task_table_timer = QtCore.QTimer()
+        self.task_table_timer.timeout.connect(self.read_task_table)
+        self.task_table_timer.start(1000)
+        
         # show ui
         self.ui.show()
         self.ui.activateWindow()
+        
+    def read_task_table(self):
+        self.settings['task_table'] = registry.format_table()
 
 
 if __name__ == '__main__':
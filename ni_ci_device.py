@@ -0,0 +1,180 @@
+import nidaqmx
+import numpy as np
+import threading
+import time
+
+from nidaqmx import stream_readers
+from NIdaqmx_ScopeFoundry.ni_ring_buffer import RingBuffer
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
+
+class NI_CI_device(object):
+    '''Counter input: edge counting, frequency, period or pulse width measurement.
+    Buffered samples are read chunk by chunk from an every n samples callback directly
+    into a preallocated RingBuffer, the statistics are updated with one numpy reduction per chunk.
+    Edge counting is buffered on sample_clock if given, otherwise the count is read on demand.'''
+
+    def __init__(self, channel, measurement = 'frequency', terminal = '',
+                 min_val = 2., max_val = 100e3, edge = 'rising',
+                 sample_clock = '', rate = 1000.,
+                 chunk_size = 1000, n_blocks = 64, verbose = True):
+
+        self.verbose = verbose
+        self.channel = channel
+        self.measurement = measurement
+        self.terminal = terminal
+        self.min_val = min_val
+        self.max_val = max_val
+        self.edge = edge
+        self.sample_clock = sample_clock
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.n_blocks = n_blocks
+        self.edges = {"rising": nidaqmx.constants.Edge.RISING,
+                      "falling": nidaqmx.constants.Edge.FALLING}
+        self.terminal_properties = {'edge_count': 'ci_count_edges_term',
+                                    'frequency': 'ci_freq_term',
+                                    'period': 'ci_period_term',
+                                    'pulse_width': 'ci_pulse_width_term'}
+        self.stats_lock = threading.Lock()
+        self.callback_registered = False
+        self.create_task()
+
+    @property
+    def buffered(self):
+        return self.measurement != 'edge_count' or bool(self.sample_clock)
+
+    def create_task(self):
+        '''creates a task with the counter input channel and its ring buffer'''
+        if hasattr(self, 'task'):
+            self.close()
+
+        timing = (self.measurement, self.terminal, self.min_val, self.max_val, self.edge,
+                  self.sample_clock, self.rate, self.chunk_size * self.n_blocks)
+        self.task = registry.acquire('ci', self.channel, self.configure, timing, owner = self)
+        self.reader = stream_readers.CounterReader(self.task.in_stream)
+        dtype = np.uint32 if self.measurement == 'edge_count' else np.float64
+        self.ring = RingBuffer(self.chunk_size, self.n_blocks, dtype)
+        self.reset_stats()
+
+    def configure(self, task):
+        edge = self.edges[self.edge]
+        if self.measurement != 'edge_count' and not 0 < self.min_val < self.max_val:
+            # period and pulse width limits are the inverse of the frequency limits
+            raise(ValueError(f'Frequency limits must satisfy 0 < min_val < max_val, '
+                             f'got {self.min_val} and {self.max_val} Hz'))
+        channels = task.ci_channels
+        if self.measurement == 'edge_count':
+            channel = channels.add_ci_count_edges_chan(self.channel, edge = edge)
+        elif self.measurement == 'frequency':
+            channel = channels.add_ci_freq_chan(self.channel, min_val = self.min_val, max_val = self.max_val,
+                                                edge = edge)
+        elif self.measurement == 'period':
+            channel = channels.add_ci_period_chan(self.channel, min_val = 1 / self.max_val, max_val = 1 / self.min_val,
+                                                  edge = edge)
+        elif self.measurement == 'pulse_width':
+            channel = channels.add_ci_pulse_width_chan(self.channel, min_val = 1 / self.max_val, max_val = 1 / self.min_val,
+                                                       starting_edge = edge)
+        else:
+            raise(ValueError(f'Unknown counter input measurement {self.measurement}'))
+        if self.terminal:
+            setattr(channel, self.terminal_properties[self.measurement], self.terminal)
+
+        buffer_size = self.chunk_size * self.n_blocks
+        sample_mode = nidaqmx.constants.AcquisitionType.CONTINUOUS
+        if self.measurement == 'edge_count' and self.sample_clock:
+            task.timing.cfg_samp_clk_timing(rate = self.rate, source = self.sample_clock,
+                                            sample_mode = sample_mode, samps_per_chan = buffer_size)
+        elif self.measurement != 'edge_count':
+            # one sample per measured period or pulse
+            task.timing.cfg_implicit_timing(sample_mode = sample_mode, samps_per_chan = buffer_size)
+
+    def start_task(self):
+
+        if not hasattr(self, 'task'):
+            raise(AttributeError('CI task not active, unable to start'))
+        if not self.task.is_task_done():
+            return
+        self.ring.reset()
+        self.reset_stats()
+        if self.buffered and not self.callback_registered:
+            self.task.register_every_n_samples_acquired_into_buffer_event(self.chunk_size, self.read_callback)
+            self.callback_registered = True
+        self.task.start()
+
+    def read_callback(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        try:
+            block = self.ring.next_block()
+            if self.measurement == 'edge_count':
+                self.reader.read_many_sample_uint32(block, number_of_samples_per_channel = self.chunk_size)
+            else:
+                self.reader.read_many_sample_double(block, number_of_samples_per_channel = self.chunk_size)
+            self.update_stats(block)
+            self.ring.commit()
+        except Exception as err:
+            print(err)
+        return 0
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.window = dict(n = 0, sum = 0., min = np.inf, max = -np.inf, counts = 0,
+                               start = time.perf_counter())
+            self.last_count = None
+            self.total_samples = 0
+
+    def update_stats(self, block):
+        '''Accumulate a chunk in the current statistics window, a few numpy reductions per chunk'''
+        with self.stats_lock:
+            window = self.window
+            if self.measurement == 'edge_count':
+                last = int(block[-1])
+                first = self.last_count if self.last_count is not None else int(block[0])
+                window['counts'] += (last - first) % 2**32 # the counter rolls over at 2**32
+                self.last_count = last
+            else:
+                window['sum'] += float(block.sum())
+                window['min'] = min(window['min'], float(block.min()))
+                window['max'] = max(window['max'], float(block.max()))
+            window['n'] += len(block)
+            self.total_samples += len(block)
+
+    def stats(self):
+        '''Statistics since the previous call: rate (Hz), mean, min and max of the measurement.
+        The rate is the mean frequency, 1 / mean period, pulses per second or counts per second'''
+        if not self.buffered and not self.task.is_task_done():
+            self.update_stats(np.array([self.reader.read_one_sample_uint32()], dtype = np.uint32))
+        now = time.perf_counter()
+        with self.stats_lock:
+            window = self.window
+            self.window = dict(n = 0, sum = 0., min = np.inf, max = -np.inf, counts = 0, start = now)
+            total_samples = self.total_samples
+        elapsed = now - window['start']
+
+        if self.measurement == 'edge_count':
+            duration = window['n'] / self.rate if self.buffered else elapsed
+            rate = window['counts'] / duration if duration > 0 else 0.
+            mean, low, high = rate, rate, rate
+        elif window['n'] == 0:
+            rate, mean, low, high = 0., 0., 0., 0.
+        else:
+            mean, low, high = window['sum'] / window['n'], window['min'], window['max']
+            rate = {'frequency': mean,
+                    'period': 1 / mean if mean else 0.,
+                    'pulse_width': window['n'] / elapsed}[self.measurement]
+        return dict(rate = rate, mean = mean, min = low, max = high, samples = total_samples)
+
+    def stop_task(self):
+        try:
+            self.task.stop()
+            if self.callback_registered:
+                self.task.register_every_n_samples_acquired_into_buffer_event(self.chunk_size, None)
+                self.callback_registered = False
+        except AttributeError as err:
+            if self.verbose:  print('Task not active: ', err)
+
+    def close(self):
+        try:
+            self.stop_task()
+            registry.release(self.task)
+            delattr(self, 'task')
+        except AttributeError as err:
+            if self.verbose:  print('Task not active: ', err)
@@ -0,0 +1,100 @@
+from ScopeFoundry import HardwareComponent
+from qtpy import QtCore
+
+from NIdaqmx_ScopeFoundry.ni_ci_device import NI_CI_device
+
+import nidaqmx.system as ni
+
+class NI_CI_hw(HardwareComponent):
+
+    name = 'NI_CI_hw'
+
+    def setup(self):
+
+        board, terminals, trig = self.update_channels()
+
+        self.devices = self.add_logged_quantity('device',  dtype=str, initial=board)
+        self.channel = self.add_logged_quantity('channel', dtype=str, choices=terminals, initial=terminals[0])
+        self.measurement = self.add_logged_quantity('measurement', dtype=str,
+                                                    choices=['edge_count', 'frequency', 'period', 'pulse_width'],
+                                                    initial='frequency')
+        self.terminal = self.add_logged_quantity('terminal', dtype=str, choices=[''] + trig, initial='')
+        self.edge = self.add_logged_quantity('edge', dtype=str, choices=['rising', 'falling'], initial='rising')
+        self.min_val = self.add_logged_quantity('min_val', dtype=float, initial=2., vmin=0.01, unit='Hz')
+        self.max_val = self.add_logged_quantity('max_val', dtype=float, initial=100e3, vmin=0.01, unit='Hz')
+        self.sample_clock = self.add_logged_quantity('sample_clock', dtype=str, initial='')
+        self.rate = self.add_logged_quantity('rate', dtype=float, initial=1000., vmin=0, unit='Hz')
+        self.chunk_size = self.add_logged_quantity('chunk_size', dtype=int, initial=1000, vmin=1)
+        self.stats_interval = self.add_logged_quantity('stats_interval', dtype=float, initial=0.5, vmin=0.05, unit='s')
+
+        self.event_rate = self.add_logged_quantity('event_rate', dtype=float, ro=1, initial=0, spinbox_decimals=3, unit='Hz')
+        self.mean = self.add_logged_quantity('mean', dtype=float, ro=1, initial=0, spinbox_decimals=9)
+        self.min = self.add_logged_quantity('min', dtype=float, ro=1, initial=0, spinbox_decimals=9)
+        self.max = self.add_logged_quantity('max', dtype=float, ro=1, initial=0, spinbox_decimals=9)
+        self.samples = self.add_logged_quantity('samples', dtype=int, ro=1, initial=0)
+
+        self.add_operation("start_task", self.start)
+        self.add_operation("stop_task", self.stop)
+
+    def connect(self):
+
+        self.channel.change_readonly(True)
+        self.CI_device = NI_CI_device(**self.device_settings(), verbose=self.debug_mode.val)
+        self.stats_timer = QtCore.QTimer()
+        self.stats_timer.timeout.connect(self.read_stats)
+
+    def disconnect(self):
+        self.channel.change_readonly(False)
+        if hasattr(self, 'stats_timer'):
+            self.stats_timer.stop()
+            del self.stats_timer
+        if hasattr(self, 'CI_device'):
+            self.CI_device.close()
+            del self.CI_device
+
+        for lq in self.settings.as_list():
+            lq.hardware_read_func = None
+            lq.hardware_set_func = None
+
+    def device_settings(self):
+        return dict(channel=self.channel.val, measurement=self.measurement.val, terminal=self.terminal.val,
+                    min_val=self.min_val.val, max_val=self.max_val.val, edge=self.edge.val,
+                    sample_clock=self.sample_clock.val, rate=self.rate.val, chunk_size=self.chunk_size.val)
+
+    def start(self):
+        '''Apply the settings (a task with unchanged settings is reused) and start counting'''
+        self.stop()
+        for name, value in self.device_settings().items():
+            setattr(self.CI_device, name, value)
+        self.CI_device.create_task()
+        self.CI_device.start_task()
+        self.stats_timer.start(int(1000 * self.stats_interval.val))
+
+    def stop(self):
+
+        self.stats_timer.stop()
+        self.CI_device.stop_task()
+
+    def read_stats(self):
+        '''Publish the statistics, called at the low rate of stats_interval'''
+        stats = self.CI_device.stats()
+        self.event_rate.update_value(stats['rate'])
+        self.mean.update_value(stats['mean'])
+        self.min.update_value(stats['min'])
+        self.max.update_value(stats['max'])
+        self.samples.update_value(stats['samples'])
+
+    def update_channels(self):
+        ''' Find a NI device and return board + ci terminals + PFI terminals'''
+        system = ni.System.local()
+        device=system.devices[0]
+        board=device.product_type + ' : ' + device.name
+        terminals=[]
+        trig=[]
+        for line in device.ci_physical_chans:
+            terminals.append(line.name)
+        for j in device.terminals:
+            if 'PFI' in j:
+                trig.append(j)
+
+        return board, terminals, trig
@@ -4,6 +4,23 @@ import math
 import numpy as np
 
 from nidaqmx import stream_writers
+from NIdaqmx_ScopeFoundry.ni_timing import co_planner, device_name
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
+
+
+def pulse_chunks(first, second, chunk_size, loop = False):
+    '''Generator of (first, second) chunks of chunk_size pulses, 
+    with loop the chunks wrap around the end of the train'''
+    if not loop:
+        for start in range(0, len(first), chunk_size):
+            yield first[start:start+chunk_size], second[start:start+chunk_size]
+        return
+    start = 0
+    while True:
+        index = np.arange(start, start + chunk_size) % len(first)
+        yield first[index], second[index]
+        start = (start + chunk_size) % len(first)
+
 
 class NI_CO_device(object):
     
@@ -14,69 +31,183 @@ class NI_CO_device(object):
                      "falling": nidaqmx.constants.Edge.FALLING}
         self.debug = debug 
         self.channel = channel
+        self.timing = co_planner(device_name(channel))
         self.initial_delay = initial_delay
         self.freq = freq
         self.duty_cycle = duty_cycle
         self.trigger = trigger
         self.trigger_source = trigger_source
         self.trigger_edge = trigger_edge
+        self.sample_modes = {"continuous": nidaqmx.constants.AcquisitionType.CONTINUOUS,
+                             "finite": nidaqmx.constants.AcquisitionType.FINITE}
+        self.units = None # None for the constant pulse train, 'frequency' or 'time' for buffered pulses
+        self.stream_chunk_size = None
                  
         self.Task()
     
-    def Task(self):
+    def Task(self, units = None):
+        '''(Re)create the task, needed only when the channel, the trigger or the units change.
+        With units 'frequency' or 'time' the task generates buffered pulses, see write_pulse_train'''
         if hasattr(self, 'task'):
             self.close()
             
-        self.task = nidaqmx.Task()
-        self.task.co_channels.add_co_pulse_chan_freq(counter=self.channel,
-                                                     initial_delay=self.initial_delay,
-                                                     freq=self.freq,
-                                                     duty_cycle=self.duty_cycle)
-        #self.task.co_channels.add_co_pulse_chan_time(counter=self.channel, units=nidaqmx.constants.TimeUnits.SECONDS, idle_state=nidaqmx.constants.Level.LOW, initial_delay=0, low_time=0.01, high_time=0.01)
-        self.task.timing.cfg_implicit_timing(sample_mode = nidaqmx.constants.AcquisitionType.CONTINUOUS, 
-                                             samps_per_chan = round(self.freq))
+        # the pulse settings are written on the channel, only the trigger is fixed at creation
+        timing = (units, self.trigger, self.trigger_source, self.trigger_edge)
+        self.task = registry.acquire('co', self.channel, lambda task: self.configure(task, units), 
+                                     timing, owner = self)
+        self.units = units
+        if units is None:
+            self.apply_pulse() # a task reused from the registry keeps its previous pulse settings
+        self.dirty = False
+        
+    def configure(self, task, units = None):
+        if units == 'time':
+            task.co_channels.add_co_pulse_chan_time(counter=self.channel, 
+                                                    units=nidaqmx.constants.TimeUnits.SECONDS, 
+                                                    idle_state=nidaqmx.constants.Level.LOW, 
+                                                    initial_delay=self.initial_delay, 
+                                                    low_time=(1 - self.duty_cycle) / self.freq, 
+                                                    high_time=self.duty_cycle / self.freq)
+        else:
+            task.co_channels.add_co_pulse_chan_freq(counter=self.channel,
+                                                    initial_delay=self.initial_delay,
+                                                    freq=self.freq,
+                                                    duty_cycle=self.duty_cycle)
+        task.timing.cfg_implicit_timing(sample_mode = nidaqmx.constants.AcquisitionType.CONTINUOUS, 
+                                        samps_per_chan = round(self.freq))
         #samps_per_chan(*or/)freq must be an integer! (maybe) 
         if self.trigger:
-            self.task.triggers.start_trigger.trig_type = nidaqmx.constants.TriggerType.DIGITAL_EDGE
-            self.task.triggers.start_trigger.cfg_dig_edge_start_trig(trigger_source = self.trigger_source,
-                                                                     trigger_edge = self.dict.get(self.trigger_edge))
+            task.triggers.start_trigger.trig_type = nidaqmx.constants.TriggerType.DIGITAL_EDGE
+            task.triggers.start_trigger.cfg_dig_edge_start_trig(trigger_source = self.trigger_source,
+                                                                trigger_edge = self.dict.get(self.trigger_edge))
+        
+    def pulse_plan(self):
+        '''Frequency and duty cycle the counter actually produces, see ni_timing.TimingPlanner'''
+        return self.timing.plan_pulse(self.freq, self.duty_cycle)
+        
+    def apply_pulse(self):
+        '''Write the pulse settings on the channel. On a running task the driver 
+        applies frequency and duty cycle at the end of the current period'''
+        channel = self.task.co_channels[0]
+        channel.co_pulse_freq = self.freq
+        channel.co_pulse_duty_cyc = self.duty_cycle
+        channel.co_pulse_freq_initial_delay = self.initial_delay # used at the next start
+        
+    def write_pulse_train(self, first, second, units = 'frequency', sample_mode_key = 'finite',
+                          chunk_size = 1000, buffer_chunks = 4):
+        '''Buffered pulse train, one pulse per sample: with units 'frequency' first and second
+        are the frequencies (Hz) and duty cycles of the pulses, with units 'time' their
+        high and low times (s). In continuous mode the train repeats.
+        Trains longer than chunk_size * buffer_chunks pulses are streamed through a
+        non regenerated buffer, refilled each time chunk_size pulses are generated.
+        Call start_task to start.'''
+        first = np.ascontiguousarray(first, dtype = 'float')
+        second = np.ascontiguousarray(second, dtype = 'float')
+        if first.shape != second.shape or first.ndim != 1 or len(first) == 0:
+            raise(ValueError('Pulse train needs two 1D arrays of the same, non zero, length'))
+        if units not in ('frequency', 'time'):
+            raise(ValueError(f'Unknown pulse units {units}'))
+            
+        if self.dirty or units != self.units or not hasattr(self, 'task'):
+            self.Task(units)
+        self.task.stop()
+        self.stop_stream()
+        writer = stream_writers.CounterWriter(self.task.out_stream, auto_start = False)
+        self.stream_writer = {'frequency': writer.write_many_sample_pulse_frequency,
+                              'time': writer.write_many_sample_pulse_time}[units]
+        
+        num_pulses = len(first)
+        continuous = sample_mode_key == 'continuous'
+        buffer_size = chunk_size * buffer_chunks
+        if num_pulses <= buffer_size:
+            self.task.timing.cfg_implicit_timing(sample_mode = self.sample_modes[sample_mode_key], 
+                                                 samps_per_chan = num_pulses)
+            self.task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.ALLOW_REGENERATION
+            self.task.out_stream.output_buf_size = num_pulses
+            self.stream_writer(first, second)
+        else:
+            self.stream_chunks = pulse_chunks(first, second, chunk_size, loop = continuous)
+            self.task.timing.cfg_implicit_timing(sample_mode = self.sample_modes[sample_mode_key], 
+                                                 samps_per_chan = buffer_size if continuous else num_pulses)
+            self.task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.DONT_ALLOW_REGENERATION
+            self.task.out_stream.output_buf_size = buffer_size
+            for _ in range(buffer_chunks):
+                self.write_next_chunk()
+            self.task.register_every_n_samples_transferred_from_buffer_event(chunk_size, self.stream_callback)
+            self.stream_chunk_size = chunk_size
+        self.task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+        if self.debug: print(f'{num_pulses} pulses written on {self.channel}')
+        
+    def write_next_chunk(self):
+        if self.stream_chunks is None:
+            return
+        try:
+            self.stream_writer(*next(self.stream_chunks))
+        except StopIteration:
+            self.stream_chunks = None # end of a finite train, nothing left to write
+        
+    def stream_callback(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        try:
+            self.write_next_chunk()
+        except Exception as err:
+            print(err)
+        return 0
+    
+    def stop_stream(self):
+        '''Unregister the streaming callback, if any'''
+        if self.stream_chunk_size is None:
+            return
+        self.task.register_every_n_samples_transferred_from_buffer_event(self.stream_chunk_size, None)
+        self.stream_chunk_size = None
+        self.stream_chunks = None
         
     def start_task(self):
         
-        self.Task()
-        self.task.start()
+        if self.dirty or not hasattr(self, 'task'):
+            self.Task(self.units)
+        if self.task.is_task_done():
+            self.task.start()
             
     def set_initial_delay(self, initial_delay):
         
         self.initial_delay = initial_delay
+        if hasattr(self, 'task') and self.units is None:
+            self.task.co_channels[0].co_pulse_freq_initial_delay = initial_delay
     
   
     def set_freq(self, freq):
         
         self.freq = freq
+        if hasattr(self, 'task') and self.units is None:
+            self.task.co_channels[0].co_pulse_freq = freq
         
 
         
     def set_duty_cycle(self, duty_cycle):
         
         self.duty_cycle = duty_cycle
+        if hasattr(self, 'task') and self.units is None:
+            self.task.co_channels[0].co_pulse_duty_cyc = duty_cycle
     
 
         
     def set_trigger(self, trigger):
         
         self.trigger = trigger
+        self.dirty = True
         
 
         
     def set_trigger_source(self,trigger_source):
         
         self.trigger_source = trigger_source
+        self.dirty = True
         
         
     def set_trigger_edge(self,trigger_edge):
         
         self.trigger_edge = trigger_edge
+        self.dirty = True
         
 
         
@@ -89,5 +220,8 @@ class NI_CO_device(object):
             
     def close(self):
         
-        self.task.close() #close the task
+        self.task.stop() # events can only be unregistered on a stopped task
+        self.stop_stream()
+        registry.release(self.task) #the task stays in the registry pool
+        delattr(self, 'task')
         
\ No newline at end of file
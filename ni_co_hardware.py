@@ -1,4 +1,5 @@
 from ScopeFoundry import HardwareComponent
+import numpy as np
 
 from NIdaqmx_ScopeFoundry.ni_co_device import NI_CO_device
 
@@ -14,12 +15,19 @@ class NI_CO_hw(HardwareComponent):
         
         self.devices = self.add_logged_quantity('device',  dtype=str, initial=board)        
         self.channel = self.add_logged_quantity('channel', dtype=str, choices=terminals, initial=terminals[0])
+        self.mode = self.add_logged_quantity('mode', dtype=str, choices=['pulses', 'pulse_train'], initial='pulses')
+        self.train_file = self.add_logged_quantity('train_file', dtype='file', initial='')
+        self.train_units = self.add_logged_quantity('train_units', dtype=str, choices=['frequency', 'time'], initial='frequency')
+        self.sample_mode = self.add_logged_quantity('sample_mode', dtype=str, choices=['finite', 'continuous'], initial='finite')
         self.initial_delay = self.add_logged_quantity('initial_delay', dtype=float, initial=0, vmin=0, spinbox_decimals=6, unit='s')
         self.freq = self.add_logged_quantity('freq', dtype = float, si = False, ro = 0, initial = 100, vmin=1, spinbox_decimals=6, unit='Hz')
         self.duty_cycle = self.add_logged_quantity('duty_cycle', dtype=float, initial=0.5, vmin=0, vmax=1)
         self.trigger=self.add_logged_quantity('trigger',dtype=bool, initial=False)
         self.trigger_source= self.add_logged_quantity('trigger_source', dtype=str, choices=trig, initial=trig[0])
         self.trigger_edge= self.add_logged_quantity('trigger_edge', dtype=str, choices=['rising', 'falling'], initial='rising')
+        self.actual_freq = self.add_logged_quantity('actual_freq', dtype=float, ro=1, initial=0, spinbox_decimals=6, unit='Hz')
+        self.actual_duty_cycle = self.add_logged_quantity('actual_duty_cycle', dtype=float, ro=1, initial=0, spinbox_decimals=6)
+        self.freq_error = self.add_logged_quantity('freq_error', dtype=float, ro=1, initial=0, spinbox_decimals=9, unit='Hz')
        
         
         self.add_operation("start_task", self.start)
@@ -35,8 +43,8 @@ class NI_CO_hw(HardwareComponent):
         
         #connect logged quantities
         self.initial_delay.hardware_set_func = self.CO_device.set_initial_delay
-        self.freq.hardware_set_func = self.CO_device.set_freq
-        self.duty_cycle.hardware_set_func = self.CO_device.set_duty_cycle
+        self.freq.hardware_set_func = self.set_freq
+        self.duty_cycle.hardware_set_func = self.set_duty_cycle
         self.trigger.hardware_set_func = self.CO_device.set_trigger
         self.trigger_source.hardware_set_func = self.CO_device.set_trigger_source
         self.trigger_edge.hardware_set_func = self.CO_device.set_trigger_edge
@@ -47,7 +55,10 @@ class NI_CO_hw(HardwareComponent):
         self.trigger.hardware_read_func = self.get_trigger
         self.trigger_source.hardware_read_func = self.get_trigger_source
         self.trigger_edge.hardware_read_func = self.get_trigger_edge
-        
+        self.actual_freq.hardware_read_func = self.get_actual_freq
+        self.actual_duty_cycle.hardware_read_func = self.get_actual_duty_cycle
+        self.freq_error.hardware_read_func = self.get_freq_error
+        self.read_pulse_plan()
         
         
     def disconnect(self):
@@ -63,12 +74,45 @@ class NI_CO_hw(HardwareComponent):
             
     def start(self):
         
+        if self.mode.val == 'pulse_train':
+            train = self.load_train()
+            self.CO_device.write_pulse_train(train[:, 0], train[:, 1], 
+                                             self.train_units.val, self.sample_mode.val)
+        elif self.CO_device.units is not None:
+            self.CO_device.Task() # back to the constant pulse train
         self.CO_device.start_task()
         
+    def load_train(self):
+        '''Pulse train from a .npy file or a two columns text file: frequency (Hz) 
+        and duty cycle or, with train_units 'time', high and low times (s) of each pulse'''
+        if self.train_file.val.endswith('.npy'):
+            train = np.load(self.train_file.val)
+        else:
+            train = np.loadtxt(self.train_file.val, ndmin = 2)
+        if train.ndim != 2 or train.shape[1] != 2:
+            raise(ValueError(f'Pulse train of shape {train.shape}, two columns expected'))
+        return train
+        
     def stop(self):
         
         self.CO_device.stop_task()
     
+    def set_freq(self, freq):
+        
+        self.CO_device.set_freq(freq)
+        self.read_pulse_plan()
+        
+    def set_duty_cycle(self, duty_cycle):
+        
+        self.CO_device.set_duty_cycle(duty_cycle)
+        self.read_pulse_plan()
+        
+    def read_pulse_plan(self):
+        
+        self.actual_freq.read_from_hardware()
+        self.actual_duty_cycle.read_from_hardware()
+        self.freq_error.read_from_hardware()
+    
     def update_channels(self):
         ''' Find a NI device and return board + do_terminals + trigger terminals'''
         system = ni.System.local()
@@ -107,6 +151,18 @@ class NI_CO_hw(HardwareComponent):
     def get_trigger_edge(self):
         
         return self.trigger_edge.val
+    
+    def get_actual_freq(self):
+        
+        return float(self.CO_device.pulse_plan().frequency)
+    
+    def get_actual_duty_cycle(self):
+        
+        return float(self.CO_device.pulse_plan().duty_cycle)
+    
+    def get_freq_error(self):
+        
+        return self.CO_device.pulse_plan().frequency_error
             
         
                     
\ No newline at end of file
@@ -0,0 +1,116 @@
+import threading
+
+import numpy as np
+
+
+class MinMaxPyramid(object):
+    '''Min/max decimation pyramid of a signal, for plotting.
+
+    Level k holds the min and max of consecutive groups of factor**k samples, in
+    circular buffers of capacity // factor**k entries, so the last capacity samples
+    are always available. append() updates every level with a few vectorized
+    reductions, view() returns about 2 * width points from the coarsest level
+    that still has width groups in the requested range: the cost of a redraw
+    depends on the plot width, not on the number of samples.
+    Samples are on the last axis, leading axes (channels) are kept.
+    append() and view() hold a lock: samples can be appended from a DAQ callback
+    while a GUI thread draws.
+    '''
+
+    def __init__(self, capacity, channels = (), factor = 4, min_entries = 256, dtype = 'float64'):
+
+        self.factor = factor
+        self.channels = tuple(np.atleast_1d(channels)) if channels != () else ()
+        self.capacity = int(capacity)
+        self.mins, self.maxs = [], []
+        size = self.capacity
+        while True:
+            self.mins.append(np.zeros(self.channels + (size,), dtype = dtype))
+            self.maxs.append(np.zeros(self.channels + (size,), dtype = dtype))
+            if size // factor < min_entries:
+                break
+            size //= factor
+        self.counts = [0] * len(self.mins) # entries written on each level
+        self.firsts = [0] * len(self.mins) # first valid entry of each level
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_array(cls, data, factor = 4):
+        '''Pyramid holding all of data'''
+        data = np.asarray(data)
+        pyramid = cls(max(1, data.shape[-1]), data.shape[:-1], factor, dtype = data.dtype)
+        pyramid.append(data)
+        return pyramid
+
+    @property
+    def length(self):
+        '''Number of samples appended'''
+        return self.counts[0]
+
+    def append(self, samples):
+        samples = np.asarray(samples)
+        with self.lock:
+            self.append_locked(samples)
+
+    def append_locked(self, samples):
+        if samples.shape[-1] > self.capacity:
+            # only the last capacity samples fit, the older ones would be overwritten anyway
+            self.counts[0] = self.firsts[0] = self.counts[0] + samples.shape[-1] - self.capacity
+            samples = samples[..., -self.capacity:]
+        self.write(0, samples, samples)
+        for k in range(1, len(self.mins)):
+            lowest = max(self.firsts[k-1], self.counts[k-1] - self.mins[k-1].shape[-1])
+            if self.counts[k] * self.factor < lowest:
+                # entries of the next groups overwritten before being reduced: skip these groups
+                self.counts[k] = self.firsts[k] = -(-lowest // self.factor)
+            new = self.counts[k-1] // self.factor - self.counts[k]
+            if new <= 0:
+                break
+            first = self.counts[k] * self.factor
+            index = np.arange(first, first + new * self.factor)
+            shape = self.channels + (new, self.factor)
+            mins = np.take(self.mins[k-1], index, axis = -1, mode = 'wrap').reshape(shape).min(axis = -1)
+            maxs = np.take(self.maxs[k-1], index, axis = -1, mode = 'wrap').reshape(shape).max(axis = -1)
+            self.write(k, mins, maxs)
+
+    def write(self, level, mins, maxs):
+        size = self.mins[level].shape[-1]
+        start = self.counts[level] % size
+        n = mins.shape[-1]
+        first = min(n, size - start)
+        self.mins[level][..., start:start+first] = mins[..., :first]
+        self.maxs[level][..., start:start+first] = maxs[..., :first]
+        self.mins[level][..., :n-first] = mins[..., first:]
+        self.maxs[level][..., :n-first] = maxs[..., first:]
+        self.counts[level] += n
+
+    def level_for(self, start, stop, width):
+        '''Coarsest level with at least width groups between samples start and stop'''
+        span = max(1, stop - start)
+        level = 0
+        while level + 1 < len(self.mins) and span // self.factor**(level + 1) >= width:
+            level += 1
+        return level
+
+    def view(self, start, stop, width):
+        '''(x, y) of the samples start to stop for a plot width pixels wide:
+        x are sample indices, y alternate the min and max of each group (last axis)'''
+        with self.lock:
+            return self.view_locked(start, stop, width)
+
+    def view_locked(self, start, stop, width):
+        level = self.level_for(start, stop, width)
+        step = self.factor**level
+        size = self.mins[level].shape[-1]
+        count = self.counts[level]
+        first = max(start // step, count - size, self.firsts[level])
+        last = min(-(-stop // step), count)
+        if last <= first:
+            return np.zeros(0), np.zeros(self.channels + (0,))
+        index = np.arange(first, last)
+        mins = np.take(self.mins[level], index, axis = -1, mode = 'wrap')
+        maxs = np.take(self.maxs[level], index, axis = -1, mode = 'wrap')
+        x = np.repeat(index * step, 2)
+        x[1::2] += step - 1
+        y = np.stack((mins, maxs), axis = -1).reshape(self.channels + (2 * len(index),))
+        return x, y
@@ -4,6 +4,7 @@ import math
 import numpy as np
 
 from nidaqmx import stream_writers
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
 
 class NI_DO_device(object):
     
@@ -18,8 +19,9 @@ class NI_DO_device(object):
         if hasattr(self, 'task'):
             self.close()
             
-        self.task = nidaqmx.Task()
-        self.task.do_channels.add_do_chan(lines=self.channel)
+        self.task = registry.acquire('do', self.channel, 
+                                     lambda task: task.do_channels.add_do_chan(lines=self.channel),
+                                     timing='on_demand', owner=self)
         
         
     def write(self, value):
@@ -36,5 +38,107 @@ class NI_DO_device(object):
             
     def close(self):
         
-        self.task.close() #close the task
-        
\ No newline at end of file
+        registry.release(self.task) #the task stays in the registry pool
+
+
+class NI_DO_port_device(object):
+    '''Static digital output on a whole port with a single task.
+    A shadow copy of the port state is kept, so that set_lines changes any 
+    number of lines with one port write, and no write when nothing changes.
+    Only the bits read from the port or set by set_lines are known: while some 
+    lines are unknown, the requested lines are written one by one, so that lines
+    nobody set are never driven. Use shared() to get the device of a port, one 
+    device and shadow state per port for all its users.'''
+    
+    def __init__(self, port, debug=False):
+    
+        self.debug = debug 
+        self.port = port
+        self.line_tasks = {}
+                 
+        self.Task()
+    
+    @classmethod
+    def shared(cls, port, debug=False):
+        '''The device of port, shared with the other users of the port'''
+        return registry.share(('do_port', port), lambda: cls(port, debug))
+    
+    def unshare(self):
+        '''Give up the shared device, closed by its last user'''
+        if registry.unshare(('do_port', self.port)):
+            self.close()
+    
+    def Task(self):
+        if hasattr(self, 'task'):
+            self.close()
+            
+        self.task = registry.acquire('do', self.port, 
+                                     lambda task: task.do_channels.add_do_chan(lines=self.port, 
+                                                                               line_grouping=nidaqmx.constants.LineGrouping.CHAN_FOR_ALL_LINES),
+                                     timing='on_demand', owner=self)
+        self.num_lines = self.task.do_channels[0].do_num_lines
+        self.all_lines = (1 << self.num_lines) - 1
+        self.writer = stream_writers.DigitalSingleChannelWriter(self.task.out_stream, auto_start=True)
+        self.writes = 0
+        try:
+            self.state = int(self.task.read()) # the output state of the port
+            self.known = self.all_lines
+        except nidaqmx.DaqError:
+            self.state = 0
+            self.known = 0 # bits read or written
+        
+    def set_lines(self, lines):
+        '''lines is {line: value}, return True if the port was written'''
+        mask = 0
+        bits = 0
+        for line, value in lines.items():
+            if not 0 <= line < self.num_lines:
+                raise(ValueError(f'Line {line} outside of {self.port} ({self.num_lines} lines)'))
+            mask |= 1 << line
+            if value:
+                bits |= 1 << line
+        changed = mask & ~(self.known & ~(self.state ^ bits))
+        if not changed:
+            return False
+        if self.known | mask == self.all_lines:
+            bits |= self.state & ~mask
+            self.writer.write_one_sample_port_uint32(bits)
+            self.writes += 1
+        else:
+            for line in range(self.num_lines):
+                if changed >> line & 1:
+                    self.line_task(line).write(bool(bits >> line & 1))
+                    self.writes += 1
+            bits |= self.state & ~mask
+        self.state = bits
+        self.known |= mask
+        if self.debug: print(f'{self.port} set to {bin(bits)}, known lines {bin(self.known)}')
+        return True
+    
+    def line_task(self, line):
+        '''Task on a single line of the port, to write it alone'''
+        if line not in self.line_tasks:
+            channel = f'{self.port}/line{line}'
+            self.line_tasks[line] = registry.acquire('do', channel,
+                                                     lambda task: task.do_channels.add_do_chan(lines=channel),
+                                                     timing='on_demand', owner=self)
+        return self.line_tasks[line]
+    
+    def write_port(self, value):
+        '''Set all the lines of the port at once'''
+        return self.set_lines({line: (value >> line) & 1 for line in range(self.num_lines)})
+    
+    def get_line(self, line):
+        if not self.known >> line & 1:
+            raise(AttributeError(f'State of {self.port}/line{line} unknown before its first write'))
+        return (self.state >> line) & 1
+        
+    def stop_task(self):
+        self.task.stop()
+            
+    def close(self):
+        
+        for task in self.line_tasks.values():
+            registry.release(task)
+        self.line_tasks = {}
+        registry.release(self.task)
@@ -1,6 +1,6 @@
 from ScopeFoundry import HardwareComponent
 
-from NIdaqmx_ScopeFoundry.ni_do_device import NI_DO_device
+from NIdaqmx_ScopeFoundry.ni_do_device import NI_DO_port_device
 
 import nidaqmx.system as ni
 
@@ -16,7 +16,10 @@ class NI_DO_hw(HardwareComponent):
         self.devices = self.add_logged_quantity('device',  dtype=str, initial=board)        
         self.channel = self.add_logged_quantity('channel', dtype=str, choices=terminals, initial='Dev1/port1/line0')
         self.value = self.add_logged_quantity('value', dtype=int, initial='0', vmax=1, vmin=0)
+        self.lines = self.add_logged_quantity('lines', dtype=str, initial='0: 0, 1: 0')
+        self.port_state = self.add_logged_quantity('port_state', dtype=int, ro=1, initial=0)
         self.add_operation("write_value", self.write_value)
+        self.add_operation("write_lines", self.write_lines)
       
         
     def connect(self):
@@ -24,15 +27,20 @@ class NI_DO_hw(HardwareComponent):
             
         #open connection to hardware
         self.channel.change_readonly(True)
-        self.DO_device = NI_DO_device(channel=self.channel.val, debug=self.debug_mode.val)
+        port, line = self.channel.val.rsplit('/', 1)
+        self.line = int(line.replace('line', ''))
+        # one device per port, shared with the other components using lines of the port
+        self.DO_device = NI_DO_port_device.shared(port, debug=self.debug_mode.val)
         #connect logged quantities
+        self.port_state.hardware_read_func = self.get_port_state
+        self.port_state.read_from_hardware()
         
         
     def disconnect(self):
         self.channel.change_readonly(False)
         #disconnect hardware
         if hasattr(self, 'DO_device'):
-            self.DO_device.close()
+            self.DO_device.unshare()
             del self.DO_device
         
         for lq in self.settings.as_list():
@@ -41,7 +49,26 @@ class NI_DO_hw(HardwareComponent):
             
     def write_value(self):
         
-        self.DO_device.write(self.value.val)
+        self.set_lines({self.line: self.value.val})
+        
+    def write_lines(self):
+        '''Write the lines setting, e.g. "0: 1, 3: 0", in a single port write'''
+        lines = {}
+        for item in self.lines.val.split(','):
+            if item.strip():
+                line, value = item.split(':')
+                lines[int(line)] = int(value)
+        self.set_lines(lines)
+        
+    def set_lines(self, lines):
+        '''Set several lines {line: value} of the port with one write, 
+        nothing is written if the lines already have these values'''
+        if self.DO_device.set_lines(lines):
+            self.port_state.read_from_hardware()
+        
+    def get_port_state(self):
+        '''Known bits of the port, lines never read nor written read as 0'''
+        return self.DO_device.state & self.DO_device.known
         
               
     def update_channels(self):
@@ -0,0 +1,122 @@
+'''Packing of per-line digital patterns into port samples.
+
+A pattern is a dict {line: definition}, definitions are tuples
+    ('rect', duty, phase=0)   high for duty of the period, starting at phase (fractions of period)
+    ('const', value)          constant 0 or 1
+    ('not', a)                boolean functions of lines defined before
+    ('and', a, b), ('or', a, b), ('xor', a, b)
+The text form used by the hardware settings is
+    0: rect(0.5); 1: rect(0.1, 0.25); 2: not(0); 3: and(0, 1)
+'''
+
+import ast
+import math
+import re
+
+import numpy as np
+
+from NIdaqmx_ScopeFoundry.ni_phase import exact_fraction
+
+PORT_DTYPES = {8: np.uint8, 16: np.uint16, 32: np.uint32}
+
+# not, and, or are Python keywords, the definitions are tokenized here rather than by ast
+DEFINITION = re.compile(r'^\s*(\w+)\s*\(([^()]*)\)\s*$')
+
+BOOLEAN_UFUNCS = {'and': np.logical_and,
+                  'or': np.logical_or,
+                  'xor': np.logical_xor}
+
+
+def port_dtype(num_lines):
+    '''Smallest unsigned integer holding num_lines lines'''
+    for width, dtype in sorted(PORT_DTYPES.items()):
+        if num_lines <= width:
+            return dtype
+    raise(ValueError(f'Ports wider than 32 lines are not supported ({num_lines} lines)'))
+
+
+def parse_pattern(text):
+    '''Pattern dict from its text form'''
+    pattern = {}
+    for item in text.split(';'):
+        if not item.strip():
+            continue
+        line, definition = item.split(':', 1)
+        match = DEFINITION.match(definition)
+        if match is None:
+            raise(ValueError(f'Invalid line definition: {definition.strip()}'))
+        kind, args = match.groups()
+        args = tuple(ast.literal_eval(arg.strip()) for arg in args.split(',') if arg.strip())
+        pattern[int(line)] = (kind,) + args
+    return pattern
+
+
+class PatternPacker(object):
+    '''Evaluate a pattern on the phase of a PhaseAccumulator directly into a preallocated
+    uint8/uint16/uint32 port array. Work is done in chunks with a few reused temporaries,
+    so memory is the output array plus a constant.'''
+
+    def __init__(self, pattern, dtype = np.uint8, chunk_size = 2**16):
+
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        width = 8 * np.dtype(dtype).itemsize
+        defined = set()
+        for line, definition in pattern.items():
+            if not 0 <= line < width:
+                raise(ValueError(f'Line {line} outside of a {width} lines port'))
+            kind, args = definition[0], definition[1:]
+            if kind in BOOLEAN_UFUNCS or kind == 'not':
+                missing = [a for a in args if a not in defined]
+                if missing:
+                    raise(ValueError(f'Line {line} uses lines {missing} not defined before it'))
+            elif kind not in ('rect', 'const'):
+                raise(ValueError(f'Unknown line definition {kind}'))
+            defined.add(line)
+        self.pattern = pattern
+
+    def pack(self, phase, num_samples):
+        '''Return the next num_samples port samples, advancing the PhaseAccumulator phase'''
+        out = np.empty(num_samples, dtype = self.dtype)
+        chunk_size = min(self.chunk_size, num_samples)
+        bit = np.empty(chunk_size, dtype = bool)
+        other = np.empty(chunk_size, dtype = bool)
+        word = np.empty(chunk_size, dtype = self.dtype)
+        rem = np.empty(chunk_size, dtype = np.int64)
+        den = phase.den
+
+        for start in range(0, num_samples, chunk_size):
+            n = min(chunk_size, num_samples - start)
+            o, b, w, r = out[start:start+n], bit[:n], word[:n], rem[:n]
+            np.remainder(phase.advance(n), den, out = r)
+            o.fill(0)
+            for line, definition in self.pattern.items():
+                kind, args = definition[0], definition[1:]
+                if kind == 'rect':
+                    # on for the integer phase positions in [shift, shift + width) modulo den
+                    duty = exact_fraction(args[0])
+                    shift = math.ceil(exact_fraction(args[1]) * den) if len(args) > 1 else 0
+                    np.subtract(r, shift, out = r)
+                    np.remainder(r, den, out = r)
+                    np.less(r, math.ceil(duty * den), out = b)
+                    np.add(r, shift, out = r)
+                    np.remainder(r, den, out = r)
+                elif kind == 'const':
+                    b.fill(bool(args[0]))
+                else:
+                    self.extract(o, args[0], w, b)
+                    if kind == 'not':
+                        np.logical_not(b, out = b)
+                    else:
+                        self.extract(o, args[1], w, other[:n])
+                        BOOLEAN_UFUNCS[kind](b, other[:n], out = b)
+                np.multiply(b, 1 << line, out = w, casting = 'unsafe')
+                np.bitwise_or(o, w, out = o)
+        return out
+
+    @staticmethod
+    def extract(samples, line, word, out):
+        '''Boolean value of line in samples, using word as temporary'''
+        np.right_shift(samples, line, out = word)
+        np.bitwise_and(word, 1, out = word)
+        np.not_equal(word, 0, out = out)
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class RLESequence(object):
+    '''Digital port sequence stored as runs of (value, duration in samples).
+    A long TTL program with few edges takes a few bytes per edge on the host,
+    samples are expanded with np.repeat only for the slices being written.
+    '''
+
+    def __init__(self, values, durations, dtype = np.uint8):
+
+        self.values = np.asarray(values, dtype = dtype)
+        self.durations = np.asarray(durations, dtype = np.int64)
+        if self.values.shape != self.durations.shape or self.values.ndim != 1:
+            raise(ValueError('values and durations must be 1D arrays of the same length'))
+        if np.any(self.durations <= 0):
+            raise(ValueError('Run durations must be positive'))
+        self.ends = np.cumsum(self.durations)
+        self.num_samples = int(self.ends[-1]) if len(self.ends) else 0
+
+    @classmethod
+    def from_edges(cls, edges, num_samples, initial = 0, dtype = np.uint8):
+        '''Sequence from (sample index, port value) edges sorted by index,
+        the port is at initial before the first edge'''
+        edges = np.asarray(edges, dtype = np.int64).reshape(-1, 2)
+        indices, values = edges[:, 0], edges[:, 1]
+        if len(indices) and (indices[0] < 0 or indices[-1] >= num_samples):
+            raise(ValueError(f'Edges must be within the {num_samples} samples of the sequence'))
+        if np.any(np.diff(indices) <= 0):
+            raise(ValueError('Edge indices must be strictly increasing'))
+        if not len(indices) or indices[0] > 0:
+            indices = np.concatenate(([0], indices))
+            values = np.concatenate(([initial], values))
+        # merge consecutive runs of equal value
+        keep = np.concatenate(([True], values[1:] != values[:-1]))
+        starts, values = indices[keep], values[keep]
+        durations = np.diff(np.concatenate((starts, [num_samples])))
+        return cls(values, durations, dtype)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.durations.nbytes + self.ends.nbytes
+
+    def stretch(self, factor):
+        '''Same sequence with every run factor times longer, e.g. for a factor times faster clock'''
+        return RLESequence(self.values, self.durations * int(factor), self.values.dtype)
+
+    def expand(self, start, count):
+        '''Samples [start, start + count) of the sequence'''
+        stop = min(start + count, self.num_samples)
+        if stop <= start:
+            return np.zeros(0, dtype = self.values.dtype)
+        first = np.searchsorted(self.ends, start, side = 'right')
+        last = np.searchsorted(self.ends, stop - 1, side = 'right')
+        ends = np.minimum(self.ends[first:last+1], stop)
+        lengths = np.diff(np.concatenate(([start], ends)))
+        return np.repeat(self.values[first:last+1], lengths)
+
+    def chunks(self, chunk_size, loop = False):
+        '''Generator of consecutive expanded chunks of chunk_size samples.
+        Without loop the last chunk may be shorter, with loop the chunks wrap
+        around the end of the sequence and are all of chunk_size samples'''
+        if not loop:
+            for start in range(0, self.num_samples, chunk_size):
+                yield self.expand(start, chunk_size)
+            return
+        start = 0
+        while self.num_samples:
+            pieces = []
+            filled = 0
+            while filled < chunk_size:
+                piece = self.expand(start, chunk_size - filled)
+                pieces.append(piece)
+                filled += len(piece)
+                start = (start + len(piece)) % self.num_samples
+            yield np.concatenate(pieces)
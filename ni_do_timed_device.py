@@ -1,7 +1,13 @@
 import nidaqmx
 import numpy as np
+import threading
 
 from nidaqmx import stream_writers
+from NIdaqmx_ScopeFoundry.ni_phase import PhaseAccumulator, exact_fraction
+from NIdaqmx_ScopeFoundry.ni_timing import do_planner, device_name
+from NIdaqmx_ScopeFoundry.ni_do_pattern import PatternPacker, parse_pattern, port_dtype
+from NIdaqmx_ScopeFoundry.ni_do_timeline import compile_timeline, parse_timeline
+from NIdaqmx_ScopeFoundry.ni_task_registry import registry
 
 class NI_DO_device(object):
     
@@ -12,6 +18,7 @@ class NI_DO_device(object):
         self.verbose = verbose
 
         self.port = port
+        self.timing = do_planner(device_name(port))
         self.sample_modes = {"continuous": nidaqmx.constants.AcquisitionType.CONTINUOUS,
                              "finite": nidaqmx.constants.AcquisitionType.FINITE,
                              "hw_timed": nidaqmx.constants.AcquisitionType.HW_TIMED_SINGLE_POINT
@@ -20,6 +27,8 @@ class NI_DO_device(object):
         self.trigger_edge_modes = {"rising": nidaqmx.constants.Edge.RISING,
                                    "falling": nidaqmx.constants.Edge.FALLING
                                    }
+        self.signal_cache = (None, None) # (parameters, samples) of the last generated signal
+        self.signal_lock = threading.Lock()
         self.create_task()
 
     def create_task(self):
@@ -27,8 +36,11 @@ class NI_DO_device(object):
         if hasattr(self, 'task'):
             self.close_task()
             
-        self.task = nidaqmx.Task()
-        self.task.do_channels.add_do_chan(lines=self.port)
+        self.task = registry.acquire('do', self.port,
+                                     lambda task: task.do_channels.add_do_chan(lines=self.port),
+                                     owner = self)
+        self.port_dtype = port_dtype(self.task.do_channels[0].do_num_lines) # uint8, uint16 or uint32
+        self.stream_chunk_size = None
         
     
     def _set_trigger(self, trigger = False, trigger_source = "/Dev1/PFI0", trigger_edge_key = 'rising'):
@@ -82,41 +94,132 @@ class NI_DO_device(object):
         
         try:
             self.stop_task()
-            self.task.timing.cfg_samp_clk_timing(rate = rate, 
+            self.stop_stream()
+            self.task.timing.cfg_samp_clk_timing(rate = float(rate), 
                                                  source = source,
                                                  sample_mode = sample_mode,
                                                  active_edge = self.trigger_edge_modes['rising'], #TODO check if there is any form of trigger
                                                  samps_per_chan = num_samples)
-            writer = stream_writers.DigitalSingleChannelWriter(self.task.out_stream, auto_start = False)
-            written_num = writer.write_many_sample_port_byte(samples.astype('uint8'))
+            self.task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.ALLOW_REGENERATION
+            written_num = self.port_writer()(samples.astype(self.port_dtype, copy = False))
             if self.verbose: print(f'successfully written {written_num} samples' )
             
         except Exception as err: 
             print (err)
         
+    def port_writer(self):
+        '''write_many_sample_port_* method matching the port width'''
+        writer = stream_writers.DigitalSingleChannelWriter(self.task.out_stream, auto_start = False)
+        return {np.uint8: writer.write_many_sample_port_byte,
+                np.uint16: writer.write_many_sample_port_uint16,
+                np.uint32: writer.write_many_sample_port_uint32}[self.port_dtype]
+
+    def stream_sequence(self, sequence, rate,
+                        source = '/Dev1/ao/SampleClock',
+                        loop = False,
+                        chunk_size = 10000,
+                        buffer_chunks = 4):
+        '''Generate an RLESequence (see ni_do_sequence) without expanding it in memory.
+        The buffer is prefilled, then each time chunk_size samples are transferred to the
+        board the next chunk_size samples are expanded and written.
+        Without loop the generation is finite and stops at the end of the sequence.
+        Call start_task to start.
+        '''
+        if not hasattr(self, 'task'):
+            raise(AttributeError('DO task not active, unable to stream sequence'))
+        if sequence.num_samples == 0:
+            raise(ValueError('Empty sequence, unable to stream'))
+
+        self.stop_task()
+        self.stop_stream()
+        self.rate = self.timing.check_rate(rate)
+        self.stream_chunks = sequence.chunks(chunk_size, loop)
+        self.stream_writer = self.port_writer()
+
+        if loop:
+            sample_mode = self.sample_modes['continuous']
+            buffer_size = chunk_size * buffer_chunks
+        else:
+            sample_mode = self.sample_modes['finite']
+            buffer_size = min(chunk_size * buffer_chunks, sequence.num_samples)
+        self.task.timing.cfg_samp_clk_timing(rate = float(rate),
+                                             source = source,
+                                             sample_mode = sample_mode,
+                                             active_edge = self.trigger_edge_modes['rising'],
+                                             samps_per_chan = sequence.num_samples if not loop else buffer_size)
+        self.task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.DONT_ALLOW_REGENERATION
+        self.task.out_stream.output_buf_size = buffer_size
+        for _ in range(buffer_chunks):
+            self.write_next_chunk()
+        self.task.register_every_n_samples_transferred_from_buffer_event(chunk_size, self.stream_callback)
+        self.stream_chunk_size = chunk_size
+        self.task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+        if self.verbose: print(f'streaming {sequence.num_samples} samples from {len(sequence.values)} runs, '
+                               f'buffer of {buffer_size} samples')
+
+    def write_next_chunk(self):
+        if self.stream_chunks is None:
+            return
+        try:
+            chunk = next(self.stream_chunks)
+        except StopIteration:
+            self.stream_chunks = None # end of a finite sequence, nothing left to write
+            return
+        self.stream_writer(chunk.astype(self.port_dtype, copy = False))
+
+    def stream_callback(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        try:
+            self.write_next_chunk()
+        except Exception as err:
+            print(err)
+        return 0
+
+    def stop_stream(self):
+        '''Unregister the streaming callback, if any'''
+        if getattr(self, 'stream_chunk_size', None) is None:
+            return
+        self.task.register_every_n_samples_transferred_from_buffer_event(self.stream_chunk_size, None)
+        self.stream_chunk_size = None
+        self.stream_chunks = None
+
     def generate_signal(self,  
                         waveform_type = 'rect',
                         frequency = 50,
                         num_periods = 6,
                         samples_per_period = 100,
+                        pattern = ''
                         ):
+        '''For waveform_type == pattern the lines follow pattern (see ni_do_pattern)
+        The samples of the last generated signal are kept, 
+        a call with unchanged parameters reuses them'''
+        self.rate = self.timing.check_rate(frequency * samples_per_period)
+        self.samples = self.signal_samples(waveform_type, frequency, num_periods, 
+                                           samples_per_period, pattern)
         
-        rate = frequency * samples_per_period 
-        # if rate >= 250000:
-        #    raise(ValueError('Frequency too high, unable to set DO'))
-        self.rate = rate
-        
-        T = 1/frequency # Hz 
-        dt = 1/rate
+    def signal_samples(self,  
+                       waveform_type = 'rect',
+                       frequency = 50,
+                       num_periods = 6,
+                       samples_per_period = 100,
+                       pattern = ''
+                       ):
+        '''Return the samples of generate_signal without changing the device state, 
+        so that it can run on a worker thread'''
+        rate = self.timing.check_rate(frequency * samples_per_period)
+        dtype = self.port_dtype
+        key = (waveform_type, frequency, num_periods, samples_per_period, pattern, dtype)
+        with self.signal_lock:
+            if self.signal_cache[0] == key:
+                return self.signal_cache[1]
         
         Ncycles = num_periods
-        epsilon = 1e-9 # 1ns delay to avoid approximation error in rect and step function
-        t = np.arange(0, Ncycles*T, dt) + epsilon
+        phase = PhaseAccumulator(frequency, rate)
 
         if waveform_type == "rect": 
             '''set all lines to True: 0b11111111 = 255 '''
             width = 0.5
-            samples = 255* ( (t) % T < (width*T) )
+            samples = phase.below(phase.advance(Ncycles * samples_per_period), width).astype(dtype)
+            samples *= np.iinfo(dtype).max
         
         elif waveform_type == "custom": 
             '''set line0 to a rect with width0
@@ -124,22 +227,67 @@ class NI_DO_device(object):
                    line2 to not line0
                    line3 to line0 and line1
                    All other lines to 0'''
-            
-            line = []
             width0 = 0.5
-            line.append( ( (t) % T < (width0*T) ).astype('bool') )
             width1 = 0.1
-            line.append( ( (t) % T < (width1*T) ).astype('bool') )
-            
-            line.append ( np.bitwise_not(line[0]))
-            line.append ( np.bitwise_and(line[0],line[1]))
+            packer = PatternPacker({0: ('rect', width0),
+                                    1: ('rect', width1),
+                                    2: ('not', 0),
+                                    3: ('and', 0, 1)}, dtype)
+            samples = packer.pack(phase, Ncycles * samples_per_period)
             
-            samples = sum([b << i for i, b in enumerate(line)]).astype('uint8')
+        elif waveform_type == "pattern":
+            packer = PatternPacker(parse_pattern(pattern), dtype)
+            samples = packer.pack(phase, Ncycles * samples_per_period)
 
         else:
             raise(ValueError('Waveform not specified in DO device'))    
         
-        self.samples = samples
+        with self.signal_lock:
+            self.signal_cache = (key, samples)
+        return samples
+              
+    def generate_timeline(self, timeline, duration):
+        '''Compile a timeline (text or list of pulses, see ni_do_timeline) lasting duration seconds.
+        Sets the rate to the coarsest one representing every edge exactly
+        and returns the CompiledTimeline'''
+        if isinstance(timeline, str):
+            timeline = parse_timeline(timeline)
+        compiled = compile_timeline(timeline, duration, self.timing, self.port_dtype)
+        self.rate = compiled.rate
+        self.sequence = compiled.sequence
+        if self.verbose: print(f'timeline compiled at {float(compiled.rate)} Hz, '
+                               f'{compiled.num_samples} samples from {len(compiled.sequence.values)} runs')
+        return compiled
+
+    def retime_sequence(self, rate):
+        '''Run the compiled timeline on a faster clock, rate must be a multiple of the timeline rate'''
+        factor = exact_fraction(rate) / exact_fraction(self.rate)
+        if factor.denominator != 1:
+            raise(ValueError(f'Clock at {float(rate)} Hz is not a multiple of the timeline rate of {float(self.rate)} Hz'))
+        self.sequence = self.sequence.stretch(factor)
+        self.rate = exact_fraction(rate)
+
+    def write_timeline(self,
+                       source = '/Dev1/ao/SampleClock',
+                       sample_mode_key = 'continuous',
+                       chunk_size = 10000,
+                       buffer_chunks = 4):
+        '''Write the compiled timeline: short timelines are expanded in the buffer
+        and regenerated, long ones are streamed'''
+        if not hasattr(self, 'sequence'):
+            raise(AttributeError('Timeline not compiled, unable to write'))
+        if self.sequence.num_samples <= chunk_size * buffer_chunks:
+            self.samples = self.sequence.expand(0, self.sequence.num_samples)
+            self.write_waveform(source, sample_mode_key)
+        else:
+            self.stream_sequence(self.sequence, self.rate, source,
+                                 loop = sample_mode_key == 'continuous',
+                                 chunk_size = chunk_size,
+                                 buffer_chunks = buffer_chunks)
+
+    def plan_timing(self, frequency, samples_per_period, search = True):
+        '''TimingPlan with the rate the board can produce, see ni_timing.TimingPlanner'''
+        return self.timing.plan(frequency, samples_per_period, search)
               
     def start_task(self):
         
@@ -158,8 +306,9 @@ class NI_DO_device(object):
     def close_task(self):
         
         try:
-            self.task.stop()
-            self.task.close()
+            self.task.stop() # events can only be unregistered on a stopped task
+            self.stop_stream()
+            registry.release(self.task) # kept configured in the registry pool
             delattr(self, 'task')
         except AttributeError as err:
             if self.verbose:  print('Task not active: ', err)
@@ -169,6 +318,7 @@ if __name__ == '__main__':
     
     import time  
     from matplotlib import pyplot as plt
+    from NIdaqmx_ScopeFoundry.ni_decimation import MinMaxPyramid
        
     dev = NI_DO_device('Dev1/port0')
     #dev = NI_DO_device('Dev1/PFI0')
@@ -188,7 +338,8 @@ if __name__ == '__main__':
         if hasattr(dev, 'samples'):
              dev.start_task()
              plt.figure() 
-             plt.plot(dev.samples)
+             x, y = MinMaxPyramid.from_array(dev.samples).view(0, dev.samples.shape[-1], 2000)
+             plt.plot(x, y.T)
              
         time.sleep(0.2)    
         dev.stop_task()
@@ -1,6 +1,11 @@
 from ScopeFoundry import HardwareComponent
+import time
 
 from NIdaqmx_ScopeFoundry.ni_do_timed_device import NI_DO_device
+from NIdaqmx_ScopeFoundry.ni_precompute import DebouncedWorker
+from NIdaqmx_ScopeFoundry.ni_phase import exact_fraction
+from NIdaqmx_ScopeFoundry.ni_sync import SyncStart
+from NIdaqmx_ScopeFoundry.ni_timing import device_name
 
 import nidaqmx.system as ni
 
@@ -31,8 +36,15 @@ class NI_DO_timed_hw(HardwareComponent):
                                                     si = False, 
                                                     vmin=1, initial = 3)
         self.waveform = self.add_logged_quantity('waveform', dtype=str,
-                                                 choices=["rect","custom"],
+                                                 choices=["rect","custom","pattern","timeline"],
                                                  initial='rect')
+        self.pattern = self.add_logged_quantity('pattern', dtype=str,
+                                                initial='0: rect(0.5); 1: rect(0.1, 0.25); 2: not(0); 3: and(0, 1)')
+        self.timeline = self.add_logged_quantity('timeline', dtype=str,
+                                                 initial='0: pulse(1.2e-3, 300e-6); 3: pulse(0, 2.5e-3, 5e-3)')
+        self.timeline_duration = self.add_logged_quantity('timeline_duration', dtype = float,
+                                                          si = False, vmin = 0, 
+                                                          initial = 20e-3, unit='s')
         self.frequency = self.add_logged_quantity('frequency', dtype = float,
                                                   si = False, 
                                                   initial = 100, unit='Hz')
@@ -41,10 +53,26 @@ class NI_DO_timed_hw(HardwareComponent):
                                                            si = False, ro = 0,
                                                            vmin= 2, initial = 200)
         self.constant_value = self.add_logged_quantity('constant_value', dtype = int,
-                                                  si = False, vmin = 0, vmax = 255, 
+                                                  si = False, vmin = 0, vmax = 2**32 - 1, 
                                                   initial = 255 )
+        self.exact_timing = self.add_logged_quantity('exact_timing', dtype = bool,
+                                                     si = False, initial = False)
+        self.actual_rate = self.add_logged_quantity('actual_rate', dtype = float,
+                                                    ro = 1, initial = 0., unit='Hz')
+        self.actual_frequency = self.add_logged_quantity('actual_frequency', dtype = float,
+                                                         ro = 1, initial = 0., 
+                                                         spinbox_decimals = 6, unit='Hz')
+        self.frequency_error = self.add_logged_quantity('frequency_error', dtype = float,
+                                                        ro = 1, initial = 0., 
+                                                        spinbox_decimals = 9, unit='Hz')
+        self.buffer_size = self.add_logged_quantity('buffer_size', dtype = int,
+                                                    ro = 1, initial = 0, unit='samples')
+        self.start_skew = self.add_logged_quantity('start_skew', dtype = float,
+                                                   ro = 1, initial = 0., unit='samples')
         
         self.add_operation("start_task", self.start)
+        self.add_operation("start_synchronized", self.start_synchronized)
+        self.add_operation("stop_synchronized", self.stop_synchronized)
         self.add_operation("stop_task", self.close)
         
     def connect(self):
@@ -53,9 +81,18 @@ class NI_DO_timed_hw(HardwareComponent):
         self.DO_device.create_task()
         self.mode.hardware_set_func = self.DO_device.reset_task_on_mode_change
         self.port.hardware_set_func = self.DO_device.reset_task_on_port_change
+        for lq in [self.waveform, self.frequency, self.num_periods, 
+                   self.samples_per_period, self.exact_timing, self.pattern,
+                   self.timeline, self.timeline_duration]:
+            lq.hardware_set_func = self.update_signal
+        self.precompute = DebouncedWorker(self.DO_device.signal_samples, verbose = True)
+        self.update_signal()
         
     def disconnect(self):
         
+        if hasattr(self, 'precompute'):
+            self.precompute.flush()
+            
         if hasattr(self, 'DO_device'):
         #     self.DO_device.close_task()
             self.close()    
@@ -67,23 +104,130 @@ class NI_DO_timed_hw(HardwareComponent):
             
     def start(self):
     
+        self.prepare()
+        self.DO_device.start_task()
+        
+    def prepare(self, rate = None, num_samples = None, timing_source = None, sample_mode = None):
+        '''Configure and write the task for the current mode without starting it.
+        With rate, the signal is generated for a timing source at that rate, 
+        with num_samples its length must be num_samples. timing_source and sample_mode
+        override the settings for this write only'''
+        timing_source = timing_source or self.timing_source.val
+        sample_mode = sample_mode or self.sample_mode.val
+        self.precompute.flush()
         if not hasattr(self.DO_device, 'task'):
             self.DO_device.create_task()
         
-        if self.mode.val == 'do_waveform':
-            self.DO_device.generate_signal( self.waveform.val,  
-                                            self.num_periods.val,
-                                            self.frequency.val,
-                                            self.samples_per_period.val)
+        if self.mode.val == 'do_waveform' and self.waveform.val == 'timeline':
+            self.compile_timeline()
+            if rate is not None:
+                self.DO_device.retime_sequence(rate)
+                self.actual_rate.update_value(float(rate))
+                self.buffer_size.update_value(self.DO_device.sequence.num_samples)
+            self.check_length(self.DO_device.sequence.num_samples, num_samples, sample_mode)
+            self.DO_device.write_timeline(timing_source, sample_mode)
+        elif self.mode.val == 'do_waveform':
+            settings = self.signal_settings()
+            if rate is not None:
+                waveform, frequency, num_periods, samples_per_period, pattern = settings
+                samples_per_period = max(2, round(rate / frequency))
+                settings = (waveform, exact_fraction(rate) / samples_per_period, 
+                            num_periods, samples_per_period, pattern)
+                self.actual_rate.update_value(float(rate))
+                self.actual_frequency.update_value(float(settings[1]))
+                self.frequency_error.update_value(float(settings[1]) - self.frequency.val)
+                self.buffer_size.update_value(num_periods * samples_per_period)
+            self.check_length(settings[2] * settings[3], num_samples, sample_mode)
+            self.DO_device.generate_signal(*settings)
             
-            self.DO_device.write_waveform(self.timing_source.val,
-                                          self.sample_mode.val) 
+            self.DO_device.write_waveform(timing_source, sample_mode)
         elif self.mode.val == 'do_constant':
             self.DO_device.write_single_value(self.constant_value.val)
         else: 
             raise(AttributeError('Waveform not specified in DO hardware'))
         
-        self.DO_device.start_task()
+    def check_length(self, length, num_samples, sample_mode):
+        if num_samples is not None and sample_mode == 'finite' and length != num_samples:
+            raise(ValueError(f'DO signal of {length} samples, the timing source generates {num_samples} samples'))
+        
+    def start_synchronized(self):
+        '''Start the DO task together with the AO task of NI_DAQ_AO_hw, on the AO sample clock.
+        The DO signal is generated at the AO rate (and length, in finite mode), the DO 
+        task is armed first, then the AO task is started.
+        The DO settings are not changed: the timing source and sample mode of the AO 
+        are used for this start only, and the frequency the DO signal gets at the AO 
+        rate is reported in actual_rate, actual_frequency and frequency_error'''
+        ao_hw = self.app.hardware['NI_DAQ_AO_hw']
+        if ao_hw.mode.val == 'ao_voltage':
+            raise(ValueError('AO in ao_voltage mode has no sample clock to share'))
+        if self.mode.val != 'do_waveform':
+            raise(ValueError('DO must be in do_waveform mode to follow the AO sample clock'))
+        
+        ao_hw.prepare()
+        ao_task = ao_hw.AO_device.task
+        rate = ao_task.timing.samp_clk_rate # coerced by the driver
+        num_samples = None
+        sample_mode = self.sample_mode.val
+        if ao_hw.mode.val == 'ao_waveform' and ao_hw.sample_mode.val == 'finite':
+            num_samples = ao_hw.AO_device.num_samples
+            sample_mode = 'finite'
+        self.prepare(rate, num_samples,
+                     timing_source = f'/{device_name(ao_hw.AO_device.channel)}/ao/SampleClock',
+                     sample_mode = sample_mode)
+        if self.waveform.val != 'timeline' and self.actual_frequency.val != self.frequency.val:
+            print(f'DO signal at {self.actual_frequency.val} Hz on the AO clock '
+                  f'({self.frequency.val} Hz requested)')
+        
+        self.sync = SyncStart(ao_task, [self.DO_device.task], rate)
+        report = self.sync.start()
+        self.start_skew.update_value(report.skew_samples)
+        ao_hw.AO_device.start_latency = report.start_duration
+        ao_hw.start_latency.read_from_hardware()
+        
+    def stop_synchronized(self):
+        '''Stop the AO task, then the DO task, on the same clock edge, 
+        and set both outputs to 0'''
+        if not hasattr(self, 'sync'):
+            raise(AttributeError('No synchronized start to stop'))
+        ao_hw = self.app.hardware['NI_DAQ_AO_hw']
+        start_time = time.perf_counter()
+        self.sync.stop()
+        stop_latency = time.perf_counter() - start_time
+        del self.sync
+        ao_hw.AO_device.stop_task()
+        ao_hw.AO_device.stop_latency = stop_latency
+        ao_hw.stop_latency.read_from_hardware()
+        self.close()
+        
+    def signal_settings(self):
+        '''generate_signal arguments, with the timing planned by the device'''
+        plan = self.DO_device.plan_timing(self.frequency.val, self.samples_per_period.val,
+                                          search = self.exact_timing.val)
+        self.actual_rate.update_value(float(plan.rate))
+        self.actual_frequency.update_value(float(plan.frequency))
+        self.frequency_error.update_value(plan.frequency_error)
+        self.buffer_size.update_value(self.num_periods.val * plan.samples_per_period)
+        return (self.waveform.val, float(plan.frequency), 
+                self.num_periods.val, plan.samples_per_period, self.pattern.val)
+        
+    def update_signal(self, value = None):
+        '''Prepare the samples in background after a signal setting change'''
+        if self.mode.val != 'do_waveform':
+            return
+        if self.waveform.val == 'timeline':
+            try:
+                self.compile_timeline()
+            except (ValueError, SyntaxError) as err:
+                print('Invalid timeline: ', err)
+        else:
+            self.precompute.trigger(*self.signal_settings())
+            
+    def compile_timeline(self):
+        '''Compile the timeline and report the rate and buffer size it needs'''
+        compiled = self.DO_device.generate_timeline(self.timeline.val, self.timeline_duration.val)
+        self.actual_rate.update_value(float(compiled.rate))
+        self.buffer_size.update_value(compiled.num_samples)
+        return compiled
         
     def close(self):
         '''close the task, reopen a new one to set the channel to 0'''    
@@ -0,0 +1,117 @@
+'''Compilation of TTL timelines into port sequences.
+
+A timeline is a list of pulses (line, start, width, period), times in seconds,
+period None for a single pulse. A periodic pulse repeats from start until the
+end of the timeline. The text form used by the hardware settings is
+    0: pulse(1.2e-3, 300e-6); 3: pulse(0, 2.5e-3, 5e-3); 0: pulse(10e-3, 1e-3)
+Times are taken at their decimal representation (see ni_phase.exact_fraction),
+the sample period is the coarsest one on which every edge falls exactly.
+'''
+
+import ast
+import math
+from collections import namedtuple
+from fractions import Fraction
+
+import numpy as np
+
+from NIdaqmx_ScopeFoundry.ni_phase import exact_fraction
+from NIdaqmx_ScopeFoundry.ni_do_sequence import RLESequence
+
+MAX_DIVISOR = 2**32 - 1 # sample clock divisor register
+
+CompiledTimeline = namedtuple('CompiledTimeline', ['sequence', 'rate', 'sample_period', 'num_samples'])
+
+
+def parse_timeline(text):
+    '''List of pulses (line, start, width, period) from the text form'''
+    pulses = []
+    for item in text.split(';'):
+        if not item.strip():
+            continue
+        line, definition = item.split(':', 1)
+        call = ast.parse(definition.strip(), mode = 'eval').body
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == 'pulse'):
+            raise(ValueError(f'Invalid pulse definition: {definition.strip()}'))
+        args = tuple(ast.literal_eval(arg) for arg in call.args)
+        if len(args) not in (2, 3):
+            raise(ValueError(f'pulse takes start, width and optionally period: {definition.strip()}'))
+        pulses.append((int(line), *args[:2], args[2] if len(args) == 3 else None))
+    return pulses
+
+
+def fraction_gcd(a, b):
+    '''Greatest common divisor of two non negative Fractions'''
+    return Fraction(math.gcd(a.numerator * b.denominator, b.numerator * a.denominator),
+                    a.denominator * b.denominator)
+
+
+def sample_period(times, timebase, min_divisor):
+    '''Coarsest period timebase_ticks/timebase dividing all times, with at least min_divisor ticks'''
+    period = Fraction(0)
+    for t in times:
+        period = fraction_gcd(period, t)
+    ticks = period * exact_fraction(timebase)
+    if ticks.denominator != 1:
+        raise(ValueError(f'Edge times are not multiples of the {float(1/exact_fraction(timebase))} s timebase period'))
+    ticks = ticks.numerator
+    if ticks < min_divisor:
+        raise(ValueError(f'Edges {float(period)} s apart require {float(1/period)} Hz, '
+                         f'above the board maximum'))
+    # very slow timelines: split the period until the divisor fits in the counter
+    k = math.ceil(ticks / MAX_DIVISOR)
+    while ticks % k:
+        k += 1
+    return Fraction(ticks // k) / exact_fraction(timebase)
+
+
+def compile_timeline(pulses, duration, planner, dtype = np.uint8):
+    '''CompiledTimeline of pulses lasting duration seconds, on the clock of a TimingPlanner.
+    The work is proportional to the number of edges, samples are never materialized.'''
+    width = 8 * np.dtype(dtype).itemsize
+    duration = exact_fraction(duration)
+    pulses = [(line, exact_fraction(start), exact_fraction(w), exact_fraction(period) if period else None)
+              for line, start, w, period in pulses]
+    for line, start, w, period in pulses:
+        if not 0 <= line < width:
+            raise(ValueError(f'Line {line} outside of a {width} lines port'))
+        if start < 0 or w <= 0 or start >= duration:
+            raise(ValueError(f'Pulse at {float(start)} s of width {float(w)} s outside of the timeline'))
+        if period is not None and period <= w:
+            raise(ValueError(f'Pulse period {float(period)} s not longer than its width {float(w)} s'))
+
+    if planner.timebase is None:
+        raise(ValueError('Sample clock timebase of the board unknown, timelines cannot be made exact'))
+    times = [duration] + [t for pulse in pulses for t in pulse[1:] if t]
+    period = sample_period(times, planner.timebase, planner.min_divisor)
+    num_samples = int(duration / period)
+
+    # events: sample index, line, +1 rising / -1 falling
+    indices, lines, signs = [], [], []
+    for line, start, w, pulse_period in pulses:
+        start, w = int(start / period), int(w / period)
+        if pulse_period is None:
+            rises = np.array([start], dtype = np.int64)
+        else:
+            rises = np.arange(start, num_samples, int(pulse_period / period), dtype = np.int64)
+        for edges, sign in ((rises, 1), (rises + w, -1)):
+            edges = edges[edges < num_samples] # a pulse running past the end holds the line high
+            indices.append(edges)
+            lines.append(np.full(len(edges), line))
+            signs.append(np.full(len(edges), sign))
+    indices, lines, signs = (np.concatenate(a) if a else np.zeros(0, dtype = np.int64)
+                             for a in (indices, lines, signs))
+
+    # falling before rising at equal times, so back to back pulses merge
+    order = np.lexsort((signs, indices))
+    indices, lines, signs = indices[order], lines[order], signs[order]
+    for line in np.unique(lines):
+        level = np.cumsum(signs[lines == line])
+        if level.min() < 0 or level.max() > 1:
+            raise(ValueError(f'Overlapping pulses on line {line}'))
+
+    values = np.cumsum(signs * (np.int64(1) << lines.astype(np.int64)))
+    last = np.flatnonzero(np.append(indices[1:] != indices[:-1], True)) # last event of each index
+    sequence = RLESequence.from_edges(np.stack((indices[last], values[last]), axis = 1),
+                                      num_samples, dtype = dtype)
+    return CompiledTimeline(sequence, 1 / period, period, num_samples)
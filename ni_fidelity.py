@@ -0,0 +1,127 @@
+from collections import namedtuple
+
+import numpy as np
+
+FidelityReport = namedtuple('FidelityReport', ['delay_samples', 'latency', 'gain', 'gain_error', 'offset',
+                                               'residual_rms', 'relative_error', 'edges', 'settling_times'])
+
+
+def fold(acquired, period):
+    '''Average of the acquired samples over the repetitions of a buffer of period samples'''
+    acquired = np.asarray(acquired, dtype = float)
+    repeats = len(acquired) // period
+    if repeats < 1:
+        raise(ValueError(f'{len(acquired)} samples acquired, at least a buffer of {period} needed'))
+    return acquired[:repeats * period].reshape(repeats, period).mean(axis = 0)
+
+
+def signal_period(reference, tolerance = 1e-9):
+    '''Shortest number of samples after which reference repeats, a divisor of its length'''
+    reference = np.asarray(reference, dtype = float)
+    n = len(reference)
+    atol = tolerance * max(np.ptp(reference), 1.)
+    for period in range(1, n):
+        if n % period == 0 and np.allclose(reference, np.roll(reference, period), rtol = 0, atol = atol):
+            return period
+    return n
+
+
+def estimate_delay(reference, acquired, ambiguity = 0.9):
+    '''Delay in samples of acquired on reference, from the peak of their circular
+    cross-correlation computed with FFTs, refined by a parabola through the peak.
+    reference must be one period of the signal: the delay is found between minus and
+    plus half a period. A ValueError is raised if the correlation reaches ambiguity
+    times its maximum away from the lobe of the maximum: with several peaks of similar
+    height, the delay would be decided by the noise'''
+    reference = np.asarray(reference, dtype = float)
+    acquired = np.asarray(acquired, dtype = float)
+    n = len(reference)
+    spectrum = np.fft.rfft(acquired - acquired.mean()) * np.conj(np.fft.rfft(reference - reference.mean()))
+    correlation = np.fft.irfft(spectrum, n)
+    peak = int(np.argmax(correlation))
+    if correlation[peak] <= 0:
+        return 0. # constant signal, no delay to measure
+    # samples above the threshold, rolled so that the peak is the first one
+    above = np.roll(correlation >= ambiguity * correlation[peak], -peak)
+    right = np.argmin(above) # lobe of the peak: the run of samples above around it
+    left = np.argmin(above[::-1])
+    if above.all() or above[right:n - left].any():
+        raise(ValueError(f'Ambiguous delay: the correlation of the {n} samples period has several '
+                         'peaks of similar height'))
+    before, at, after = correlation[[(peak - 1) % n, peak, (peak + 1) % n]]
+    curvature = before - 2 * at + after
+    fraction = 0.5 * (before - after) / curvature if curvature < 0 else 0.
+    delay = peak + fraction
+    # lags beyond half the period are negative delays
+    return delay - n if delay > n / 2 else delay
+
+
+def find_edges(reference, threshold = 0.1):
+    '''First samples of the new level after each step of reference larger than threshold
+    of its range. The buffer is regenerated, so the step from the last sample to the
+    first counts too'''
+    reference = np.asarray(reference, dtype = float)
+    span = np.ptp(reference)
+    if span == 0:
+        return np.zeros(0, dtype = int)
+    return np.flatnonzero(np.abs(reference - np.roll(reference, 1)) > threshold * span)
+
+
+def settling(trace, edges, rate, tolerance = 0.01):
+    '''Settling time after each edge and mask of the settled samples.
+
+    The trace between two edges settles to its value just before the next edge: it has
+    settled after the last sample further than tolerance times the step from that value.
+    All the segments are reduced at once with np.maximum.reduceat, on the trace rolled
+    so that it starts on the first edge.
+    '''
+    n = len(trace)
+    if len(edges) == 0:
+        return np.zeros(0), np.ones(n, dtype = bool)
+    shift = edges[0]
+    rolled = np.roll(trace, -shift)
+    starts = edges - shift
+    lengths = np.diff(np.append(starts, n))
+    finals = rolled[np.append(starts[1:], n) - 1]
+    steps = np.abs(finals - np.roll(finals, 1))
+    index = np.arange(n)
+    outside = np.where(np.abs(rolled - np.repeat(finals, lengths)) > np.repeat(tolerance * steps, lengths),
+                       index, -1)
+    last = np.maximum.reduceat(outside, starts)
+    last = np.where(last < 0, starts - 1, last)
+    settled = np.roll(index > np.repeat(last, lengths), shift)
+    return (last - starts + 1) / float(rate), settled
+
+
+def loopback_fidelity(reference, acquired, rate, edge_threshold = 0.1, settle_tolerance = 0.01):
+    '''Compare the acquired loopback of a regenerated buffer with the buffer written.
+
+    acquired holds one or more whole repetitions of reference, sampled on the same clock
+    and started on the same trigger: they are averaged, the delay is estimated by
+    cross-correlation over one period of the signal (a buffer usually holds several)
+    and removed, then gain and offset are fitted by least squares on the settled
+    samples. The delay must be under half a signal period. Settling times are counted
+    from the edges of reference. The residual is what gain, offset and delay do not
+    explain, transients included.
+    '''
+    reference = np.asarray(reference, dtype = float)
+    period = len(reference)
+    trace = fold(acquired, period)
+    cycle = signal_period(reference)
+    delay = estimate_delay(reference[:cycle], fold(trace, cycle))
+    shift = int(round(delay))
+    aligned = np.roll(trace, -shift)
+    edges = find_edges(reference, edge_threshold)
+    # settling is counted from the edge written, latency included
+    settling_times, settled = settling(trace, edges, rate, settle_tolerance)
+    settled = np.roll(settled, -shift)
+    if np.ptp(reference[settled]) == 0:
+        settled[:] = True
+    design = np.column_stack((reference, np.ones(period)))
+    (gain, offset), *_ = np.linalg.lstsq(design[settled], aligned[settled], rcond = None)
+    residual = aligned - (gain * reference + offset)
+    residual_rms = np.sqrt(np.mean(residual**2))
+    signal_rms = np.std(reference)
+    return FidelityReport(delay, delay / float(rate), gain, gain - 1., offset,
+                          residual_rms, residual_rms / signal_rms if signal_rms > 0 else 0.,
+                          edges, settling_times)
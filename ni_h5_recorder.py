@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None # optional, only needed to record
+
+
+class H5Recorder(object):
+    '''Append sample blocks to resizable, chunked HDF5 datasets from a background thread.
+
+    put() only copies the block into a bounded queue, so it can be called from a DAQ
+    callback: disk stalls never block the acquisition. When the queue is full the block
+    is dropped and counted, so the memory used is bounded by max_queue blocks.
+    Datasets grow along their last (time) axis, one HDF5 chunk per block.
+    '''
+
+    def __init__(self, file_path, max_queue = 256, compression = None, compression_opts = None,
+                 verbose = True):
+
+        if h5py is None:
+            raise(ImportError('Recording to HDF5 needs h5py (pip install h5py)'))
+        self.file_path = file_path
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.verbose = verbose
+        self.file = h5py.File(file_path, 'a')
+        self.datasets = {}
+        self.queue = queue.Queue(maxsize = max_queue)
+        self.dropped = 0
+        self.blocks_written = 0
+        self.bytes_written = 0
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def add_dataset(self, name, block_shape, dtype = 'float64', attrs = {}):
+        '''Create (or extend) the dataset name, for blocks of block_shape'''
+        block_shape = tuple(block_shape)
+        if name in self.file:
+            dataset = self.file[name]
+            if dataset.shape[:-1] != block_shape[:-1]:
+                raise(ValueError(f'Dataset {name} of shape {dataset.shape} in {self.file_path}, '
+                                 f'blocks of shape {block_shape} cannot be appended'))
+        else:
+            dataset = self.file.create_dataset(name, shape = block_shape[:-1] + (0,),
+                                               maxshape = block_shape[:-1] + (None,),
+                                               chunks = block_shape, dtype = dtype,
+                                               compression = self.compression,
+                                               compression_opts = self.compression_opts)
+        for key, value in attrs.items():
+            if value is not None:
+                dataset.attrs[key] = value
+        self.datasets[name] = dataset
+        return dataset
+
+    def put(self, name, block):
+        '''Queue a copy of block, return False if it was dropped'''
+        try:
+            self.queue.put_nowait((name, np.array(block)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            name, block = item
+            try:
+                dataset = self.datasets[name]
+                length = dataset.shape[-1]
+                dataset.resize(length + block.shape[-1], axis = dataset.ndim - 1)
+                dataset[..., length:] = block
+                self.blocks_written += 1
+                self.bytes_written += block.nbytes
+            except Exception as err:
+                print(f'Block not written to {name}: ', err)
+
+    def stats(self):
+        '''Write throughput (MB/s since the start), queue depth and dropped blocks'''
+        elapsed = time.perf_counter() - self.start_time
+        return dict(throughput = self.bytes_written / 2**20 / elapsed if elapsed > 0 else 0.,
+                    queue_depth = self.queue.qsize(),
+                    blocks_written = self.blocks_written,
+                    dropped = self.dropped)
+
+    def close(self):
+        '''Write the queued blocks and close the file'''
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.verbose: print(f'{self.blocks_written} blocks written to {self.file_path}, '
+                               f'{self.dropped} dropped')
@@ -0,0 +1,98 @@
+from ScopeFoundry import Measurement
+import numpy as np
+import pyqtgraph as pg
+import time
+
+from NIdaqmx_ScopeFoundry.ni_decimation import MinMaxPyramid
+
+class NI_LivePlot_measurement(Measurement):
+    '''Plot of the AO or DO buffer written to the board, or of the AI acquisition.
+    The data go through a MinMaxPyramid: each redraw plots about twice as many points
+    as the plot is wide, taken from the pyramid level matching the zoom.'''
+
+    name = 'ni_live_plot'
+
+    def setup(self):
+
+        self.settings.New('source', dtype=str, choices=['ai', 'ao_buffer', 'do_buffer'], initial='ai')
+        self.settings.New('history', dtype=float, initial=10., vmin=0.01, unit='s')
+        self.settings.New('follow', dtype=bool, initial=True)
+        self.display_update_period = 0.05 # s
+        self.pyramid = None
+        self.rate = 1.
+        self.live = False
+        self.drawing = False
+
+    def setup_figure(self):
+
+        self.ui = pg.GraphicsLayoutWidget()
+        self.plot = self.ui.addPlot()
+        self.plot.setLabel('bottom', 'time', units='s')
+        self.plot.showGrid(x=True, y=True)
+        self.curves = []
+        # zooming a static buffer redraws from the matching level
+        self.plot.sigXRangeChanged.connect(self.redraw)
+
+    def buffer_source(self):
+        '''Samples and rate of the AO or DO buffer'''
+        if self.settings['source'] == 'ao_buffer':
+            device = self.app.hardware['NI_DAQ_AO_hw'].AO_device
+        else:
+            device = self.app.hardware['NI_DAQ_timed_DO_hw'].DO_device
+        if not hasattr(device, 'samples'):
+            raise(AttributeError('Samples not generated, nothing to plot'))
+        return device.samples, float(device.rate)
+
+    def pre_run(self):
+        self.plot.enableAutoRange()
+
+    def run(self):
+
+        if self.settings['source'] == 'ai':
+            device = self.app.hardware['NI_DAQ_AI_hw'].AI_device
+            self.rate = float(device.rate)
+            self.pyramid = MinMaxPyramid(int(self.settings['history'] * self.rate), (device.num_channels,))
+            listener = lambda index, block: self.pyramid.append(block)
+            self.live = True
+            device.ring.listeners.append(listener)
+            try:
+                while not self.interrupt_measurement_called:
+                    time.sleep(self.display_update_period)
+            finally:
+                device.ring.listeners.remove(listener)
+                self.live = False
+        else:
+            samples, self.rate = self.buffer_source()
+            samples = np.atleast_2d(samples)
+            self.pyramid = MinMaxPyramid.from_array(samples)
+            self.live = False
+            while not self.interrupt_measurement_called:
+                time.sleep(self.display_update_period)
+
+    def update_display(self):
+        self.redraw()
+
+    def redraw(self, *args):
+        '''Plot the visible range, about two points per pixel'''
+        if self.pyramid is None or self.drawing:
+            return
+        self.drawing = True
+        try:
+            pyramid = self.pyramid
+            if self.live and self.settings['follow'] or self.plot.getViewBox().autoRangeEnabled()[0]:
+                start, stop = max(0, pyramid.length - pyramid.capacity), pyramid.length
+            else:
+                t0, t1 = self.plot.getViewBox().viewRange()[0]
+                start, stop = max(0, int(t0 * self.rate)), int(np.ceil(t1 * self.rate)) + 1
+            width = max(100, int(self.plot.getViewBox().width()))
+            x, y = pyramid.view(start, stop, width)
+            while len(self.curves) < len(y):
+                self.curves.append(self.plot.plot(pen=pg.intColor(len(self.curves))))
+            for curve, channel in zip(self.curves, y):
+                curve.setData(x / self.rate, channel)
+            for curve in self.curves[len(y):]:
+                curve.setData([], [])
+            if self.live and self.settings['follow'] and len(x):
+                self.plot.setXRange(start / self.rate, stop / self.rate, padding=0)
+        finally:
+            self.drawing = False
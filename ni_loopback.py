@@ -0,0 +1,131 @@
+from ScopeFoundry import Measurement
+import numpy as np
+import pyqtgraph as pg
+import threading
+import time
+
+from NIdaqmx_ScopeFoundry.ni_fidelity import fold, loopback_fidelity
+from NIdaqmx_ScopeFoundry.ni_timing import device_name
+
+class NI_Loopback_measurement(Measurement):
+    '''Fidelity of the AO waveform, with the AO channel wired to the AI channel.
+    AI is clocked by the AO sample clock and started by the AO start trigger, so that
+    each AI sample is taken on the clock edge of an AO sample: repetitions buffers are
+    acquired, averaged and compared with AO_device.samples.'''
+
+    name = 'ni_loopback'
+
+    def setup(self):
+
+        self.settings.New('repetitions', dtype=int, initial=8, vmin=1)
+        self.settings.New('edge_threshold', dtype=float, initial=0.1, vmin=0., vmax=1.)
+        self.settings.New('settle_tolerance', dtype=float, initial=0.01, vmin=0., vmax=1.)
+        self.settings.New('max_error', dtype=float, initial=0.01, vmin=0.)
+        self.settings.New('latency', dtype=float, ro=True, initial=0., unit='s')
+        self.settings.New('delay_samples', dtype=float, ro=True, initial=0., spinbox_decimals=3)
+        self.settings.New('gain_error', dtype=float, ro=True, initial=0., spinbox_decimals=5)
+        self.settings.New('offset', dtype=float, ro=True, initial=0., spinbox_decimals=5, unit='V')
+        self.settings.New('residual_rms', dtype=float, ro=True, initial=0., spinbox_decimals=5, unit='V')
+        self.settings.New('relative_error', dtype=float, ro=True, initial=0., spinbox_decimals=5)
+        self.settings.New('edges', dtype=int, ro=True, initial=0)
+        self.settings.New('settling_mean', dtype=float, ro=True, initial=0., unit='s')
+        self.settings.New('settling_max', dtype=float, ro=True, initial=0., unit='s')
+        self.settings.New('faithful', dtype=bool, ro=True, initial=False)
+        self.display_update_period = 0.1 # s
+        self.reference = None
+        self.trace = None
+        self.report = None
+
+    def setup_figure(self):
+
+        self.ui = pg.GraphicsLayoutWidget()
+        self.plot = self.ui.addPlot(title='written and acquired')
+        self.plot.setLabel('bottom', 'time', units='s')
+        self.plot.showGrid(x=True, y=True)
+        self.reference_curve = self.plot.plot(pen='w')
+        self.trace_curve = self.plot.plot(pen='y')
+        self.ui.nextRow()
+        self.residual_plot = self.ui.addPlot(title='residual')
+        self.residual_plot.setLabel('bottom', 'time', units='s')
+        self.residual_plot.showGrid(x=True, y=True)
+        self.residual_plot.setXLink(self.plot)
+        self.residual_curve = self.residual_plot.plot(pen='r')
+
+    def run(self):
+
+        ao_hw = self.app.hardware['NI_DAQ_AO_hw']
+        ai_hw = self.app.hardware['NI_DAQ_AI_hw']
+        if ao_hw.settings['mode'] != 'ao_waveform' or ao_hw.settings['sample_mode'] != 'continuous':
+            raise(ValueError('Loopback needs the AO in ao_waveform mode, with continuous sample_mode'))
+        ao_hw.prepare()
+        AO_device = ao_hw.AO_device
+        reference = np.atleast_2d(AO_device.samples)[0]
+        rate = float(AO_device.task.timing.samp_clk_rate)
+
+        # AI on the AO clock and start trigger, armed before the AO starts
+        ai_hw.prepare()
+        AI_device = ai_hw.AI_device
+        device = device_name(AO_device.channel)
+        AI_device.set_trigger(True, f'/{device}/ao/StartTrigger', 'rising')
+        AI_device.configure_acquisition(rate, f'/{device}/ao/SampleClock')
+
+        acquired = np.empty(len(reference) * self.settings['repetitions'])
+        self.filled = 0
+        done = threading.Event()
+
+        def listener(index, block):
+            n = min(block.shape[-1], len(acquired) - self.filled)
+            acquired[self.filled:self.filled + n] = block[0, :n]
+            self.filled += n
+            if self.filled == len(acquired):
+                done.set()
+
+        AI_device.ring.listeners.append(listener)
+        try:
+            AI_device.start_task()
+            AO_device.start_task()
+            timeout = time.perf_counter() + len(acquired) / rate + 5.
+            while not done.wait(0.1):
+                self.set_progress(100. * self.filled / len(acquired))
+                if self.interrupt_measurement_called:
+                    return
+                if time.perf_counter() > timeout:
+                    raise(TimeoutError(f'{self.filled} of {len(acquired)} samples acquired, '
+                                       'is the AO channel wired to the AI channel?'))
+        finally:
+            AI_device.ring.listeners.remove(listener)
+            ao_hw.stop()
+            ai_hw.stop()
+
+        report = loopback_fidelity(reference, acquired, rate,
+                                   self.settings['edge_threshold'],
+                                   self.settings['settle_tolerance'])
+        self.publish(report)
+        self.rate = rate
+        self.reference = reference
+        self.trace = fold(acquired, len(reference))
+        self.report = report
+
+    def publish(self, report):
+        self.settings['latency'] = report.latency
+        self.settings['delay_samples'] = report.delay_samples
+        self.settings['gain_error'] = report.gain_error
+        self.settings['offset'] = report.offset
+        self.settings['residual_rms'] = report.residual_rms
+        self.settings['relative_error'] = report.relative_error
+        self.settings['edges'] = len(report.edges)
+        settling = report.settling_times
+        self.settings['settling_mean'] = settling.mean() if len(settling) else 0.
+        self.settings['settling_max'] = settling.max() if len(settling) else 0.
+        self.settings['faithful'] = bool(report.relative_error <= self.settings['max_error'])
+
+    def update_display(self):
+        if self.report is None:
+            return
+        report = self.report
+        shift = int(round(report.delay_samples))
+        aligned = np.roll(self.trace, -shift)
+        t = np.arange(len(self.reference)) / self.rate
+        self.reference_curve.setData(t, report.gain * self.reference + report.offset)
+        self.trace_curve.setData(t, aligned)
+        self.residual_curve.setData(t, aligned - (report.gain * self.reference + report.offset))
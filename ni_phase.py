@@ -0,0 +1,77 @@
+from fractions import Fraction
+
+import numpy as np
+
+
+def exact_fraction(value):
+    '''Return value as a Fraction, floats are taken at their decimal representation
+    (0.1 -> 1/10) so that frequencies and rates typed in the GUI stay exact'''
+    if isinstance(value, (Fraction, int, np.integer)):
+        return Fraction(value)
+    return Fraction(repr(float(value)))
+
+
+class PhaseAccumulator(object):
+    '''DDS-like phase accumulator working on integer sample indices.
+
+    Sample n sits at n*frequency/rate periods. With frequency/rate = step/den
+    the accumulator holds n*step modulo den*cycle, so that:
+        acc // den is the period index, in [0, cycle)
+        acc % den / den is the phase inside the period, in [0, 1)
+    All comparisons are done on integers, edges are identical for any run length
+    and consecutive calls to advance are phase continuous.
+    '''
+
+    def __init__(self, frequency, rate, cycle = 1):
+
+        # periods longer than 2**24 samples are approximated, to keep the int64 arithmetic far from overflow
+        ratio = (exact_fraction(frequency) / exact_fraction(rate)).limit_denominator(2**24)
+        if ratio <= 0:
+            raise(ValueError('Frequency and rate must be positive'))
+        self.step = ratio.numerator
+        self.den = ratio.denominator
+        self.cycle = int(cycle)
+        self.modulus = self.den * self.cycle
+        self.acc = 0
+
+    def reset(self, acc = 0):
+        self.acc = acc % self.modulus
+
+    def retune(self, frequency, rate, cycle = None):
+        '''New accumulator at frequency/rate starting at the current period index and phase'''
+        phase = PhaseAccumulator(frequency, rate, self.cycle if cycle is None else cycle)
+        phase.reset(self.acc * phase.den // self.den)
+        return phase
+
+    def block_length(self):
+        '''Number of samples after which the accumulator returns to its start value'''
+        return self.modulus // np.gcd(self.modulus, self.step)
+
+    def advance(self, num_samples):
+        '''Return the accumulator values (int64) of the next num_samples samples
+        and move the phase forward'''
+        acc = np.arange(num_samples, dtype = np.int64)
+        acc *= self.step
+        acc += self.acc
+        np.remainder(acc, self.modulus, out = acc)
+        self.acc = (self.acc + num_samples * self.step) % self.modulus
+        return acc
+
+    def period(self, acc):
+        '''Period index of each sample, in [0, cycle)'''
+        return acc // self.den
+
+    def phase(self, acc):
+        '''Phase of each sample inside its period, as float in [0, 1)'''
+        phase = np.remainder(acc, self.den).astype('float')
+        phase /= self.den
+        return phase
+
+    def below(self, acc, fraction):
+        '''True where the phase inside the period is below fraction (of the period)'''
+        # remainder / den < fraction  <=>  remainder < ceil(fraction * den), the threshold is
+        # computed on Python ints: fraction.denominator can be ~1e17 and overflow int64
+        fraction = exact_fraction(fraction)
+        threshold = -(-fraction.numerator * self.den // fraction.denominator)
+        threshold = min(max(threshold, 0), self.den)
+        return np.remainder(acc, self.den) < threshold
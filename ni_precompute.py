@@ -0,0 +1,39 @@
+import threading
+
+
+class DebouncedWorker(object):
+    '''Run func(*args) on a worker thread, delay seconds after the last call to trigger.
+    Settings changed in a burst (typing, spinbox) give a single run with the last arguments.
+    '''
+
+    def __init__(self, func, delay = 0.3, verbose = False):
+
+        self.func = func
+        self.delay = delay
+        self.verbose = verbose
+        self.timer = None
+        self.run_lock = threading.Lock() # held while func runs
+
+    def trigger(self, *args):
+        '''(Re)schedule a run with args, cancelling the pending one'''
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(self.delay, self.run, args)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def run(self, *args):
+        with self.run_lock:
+            try:
+                self.func(*args)
+            except Exception as err:
+                # the synchronous path reports the error again when it is needed
+                if self.verbose: print('Background precomputation failed: ', err)
+
+    def flush(self):
+        '''Drop a pending run and wait for the running one, if any, to complete'''
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        with self.run_lock:
+            pass
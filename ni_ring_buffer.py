@@ -0,0 +1,70 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer(object):
+    '''Preallocated ring of n_blocks blocks of block_shape samples.
+
+    The producer (a DAQ callback) reads directly into next_block() and calls
+    commit(); nothing is allocated while acquiring. Consumers keep their own
+    cursor, the absolute index of the next block they want, and get views
+    of the blocks with read(). The slot of next_block() may be being filled, so
+    only the last n_blocks - 1 committed blocks are readable: a block stays valid
+    until n_blocks - 1 more blocks are committed, consumers falling further behind
+    are told how many blocks they lost.
+    '''
+
+    def __init__(self, block_shape, n_blocks, dtype = 'float64'):
+
+        self.block_shape = tuple(np.atleast_1d(block_shape))
+        self.n_blocks = int(n_blocks)
+        self.data = np.zeros((self.n_blocks,) + self.block_shape, dtype = dtype)
+        self.count = 0 # blocks committed since the start
+        self.lock = threading.Lock()
+        self.listeners = [] # called with (index, block) on the producer thread at each commit
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+
+    def next_block(self):
+        '''View of the block to be filled next'''
+        return self.data[self.count % self.n_blocks]
+
+    def commit(self):
+        '''Publish the block returned by next_block'''
+        with self.lock:
+            index = self.count
+            self.count += 1
+        block = self.data[index % self.n_blocks]
+        for listener in self.listeners:
+            listener(index, block)
+
+    def block(self, index):
+        '''View of the block with absolute index'''
+        oldest = max(0, self.count - self.n_blocks + 1)
+        if not oldest <= index < self.count:
+            raise(IndexError(f'Block {index} not in the buffer (blocks {oldest} to {self.count - 1})'))
+        return self.data[index % self.n_blocks]
+
+    def read(self, cursor, max_blocks = None):
+        '''Views of the blocks from cursor to the latest one, at most two slices of the ring.
+        Returns (views, new cursor, lost blocks), each view has the blocks on the first axis'''
+        count = self.count
+        lost = max(0, count - self.n_blocks + 1 - cursor) # the oldest slot is next_block()
+        start = cursor + lost
+        stop = count if max_blocks is None else min(count, start + max_blocks)
+        if stop <= start:
+            return [], start, lost
+        first, last = start % self.n_blocks, (stop - 1) % self.n_blocks + 1
+        if first < last:
+            views = [self.data[first:last]]
+        else:
+            views = [self.data[first:], self.data[:last]]
+        return views, stop, lost
+
+    def latest(self, num_blocks = 1):
+        '''Views of the last num_blocks blocks'''
+        views, _, _ = self.read(max(0, self.count - num_blocks))
+        return views
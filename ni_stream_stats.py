@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamStats(object):
+    '''Running statistics of multichannel sample blocks, without keeping the samples.
+
+    Each block of shape (num_channels, block_size) is merged into fixed-size state
+    arrays, updated in place: mean and M2 with the Welford/Chan merge of the block
+    mean and M2 (numerically stable, unlike sums of squares), min and max. RMS and
+    variance derive from mean and M2.
+    The Welch spectrum averages the periodograms of segments of nperseg samples
+    overlapping by overlap: the samples not yet in a whole segment are carried in a
+    preallocated work array, so segments span block boundaries exactly as if the
+    stream were one array. All the segments of a block are transformed with one rfft.
+    '''
+
+    def __init__(self, num_channels, block_size, rate, nperseg = 256, overlap = 0.5, spectrum = True):
+
+        self.num_channels = num_channels
+        self.block_size = block_size
+        self.rate = float(rate)
+        self.nperseg = nperseg
+        self.step = max(1, int(round(nperseg * (1 - overlap))))
+        self.spectrum = spectrum
+        self.lock = threading.Lock()
+
+        self.mean = np.zeros(num_channels)
+        self.m2 = np.zeros(num_channels)
+        self.minimum = np.zeros(num_channels)
+        self.maximum = np.zeros(num_channels)
+        # scratch arrays of the block reductions, nothing is allocated per block but the FFT
+        self.block_mean = np.zeros(num_channels)
+        self.block_m2 = np.zeros(num_channels)
+        self.block_min = np.zeros(num_channels)
+        self.block_max = np.zeros(num_channels)
+        self.deviation = np.zeros((num_channels, block_size))
+
+        self.window = np.hanning(nperseg + 1)[:-1] # periodic Hann, as scipy.signal.welch
+        self.window_power = np.sum(self.window**2)
+        self.work = np.zeros((num_channels, nperseg - 1 + block_size))
+        self.psd_sum = np.zeros((num_channels, nperseg // 2 + 1))
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+            self.segments = 0
+            self.held = 0 # samples carried in work
+            self.mean[:] = 0.
+            self.m2[:] = 0.
+            self.minimum[:] = np.inf
+            self.maximum[:] = -np.inf
+            self.psd_sum[:] = 0.
+
+    def update(self, block):
+        '''Merge a block of shape (num_channels, block_size)'''
+        n = block.shape[-1]
+        if n != self.block_size:
+            raise(ValueError(f'Blocks of {self.block_size} samples expected, got {n}'))
+        with self.lock:
+            np.mean(block, axis = -1, out = self.block_mean)
+            np.subtract(block, self.block_mean[:, None], out = self.deviation)
+            np.square(self.deviation, out = self.deviation)
+            np.sum(self.deviation, axis = -1, out = self.block_m2)
+            # Chan et al. merge of (count, mean, m2) with the block
+            total = self.count + n
+            np.subtract(self.block_mean, self.mean, out = self.block_mean)
+            self.m2 += self.block_m2
+            self.m2 += self.block_mean**2 * (self.count * n / total)
+            self.block_mean *= n / total
+            self.mean += self.block_mean
+            self.count = total
+
+            np.min(block, axis = -1, out = self.block_min)
+            np.max(block, axis = -1, out = self.block_max)
+            np.minimum(self.minimum, self.block_min, out = self.minimum)
+            np.maximum(self.maximum, self.block_max, out = self.maximum)
+
+            if self.spectrum:
+                self.update_spectrum(block)
+
+    def update_spectrum(self, block):
+        '''Add the periodograms of the whole segments in the carried samples and block'''
+        n = block.shape[-1]
+        available = self.held + n
+        self.work[:, self.held:available] = block
+        if available < self.nperseg:
+            self.held = available
+            return
+        num_segments = (available - self.nperseg) // self.step + 1
+        segments = sliding_window_view(self.work[:, :available], self.nperseg, axis = -1)
+        segments = segments[:, :num_segments * self.step:self.step]
+        # constant detrend, as scipy.signal.welch
+        spectra = np.fft.rfft((segments - segments.mean(axis = -1, keepdims = True)) * self.window, axis = -1)
+        self.psd_sum += np.sum(spectra.real**2 + spectra.imag**2, axis = 1)
+        self.segments += num_segments
+        consumed = num_segments * self.step
+        self.held = available - consumed
+        self.work[:, :self.held] = self.work[:, consumed:available]
+
+    def variance(self):
+        return self.m2 / max(1, self.count - 1)
+
+    def rms(self):
+        return np.sqrt(self.m2 / max(1, self.count) + self.mean**2)
+
+    def psd(self):
+        '''(frequencies, one-sided power spectral density in V**2/Hz per channel)'''
+        frequencies = np.fft.rfftfreq(self.nperseg, 1. / self.rate)
+        with self.lock:
+            psd = self.psd_sum / (max(1, self.segments) * self.rate * self.window_power)
+        psd[:, 1:] *= 2
+        if self.nperseg % 2 == 0:
+            psd[:, -1] /= 2 # Nyquist is not doubled
+        return frequencies, psd
+
+    def snapshot(self):
+        '''Consistent copy of the statistics, dict of arrays over the channels'''
+        with self.lock:
+            return dict(count = self.count,
+                        mean = self.mean.copy(),
+                        std = np.sqrt(self.variance()),
+                        rms = self.rms(),
+                        min = self.minimum.copy(),
+                        max = self.maximum.copy(),
+                        segments = self.segments)
@@ -0,0 +1,56 @@
+import time
+from collections import namedtuple
+
+import nidaqmx
+
+SyncReport = namedtuple('SyncReport', ['skew_samples', 'skew', 'arm_duration', 'start_duration'])
+
+
+class SyncStart(object):
+    '''Start output tasks clocked by the sample clock of a master task.
+
+    The slave tasks use the master sample clock (e.g. /Dev1/ao/SampleClock) as
+    timing source: they are started first, so that they are armed and wait for
+    the first clock edge, then the master is started. All the tasks then move
+    on the same clock edges.
+    '''
+
+    def __init__(self, master, slaves, rate, verbose = True):
+
+        self.master = master
+        self.slaves = list(slaves)
+        self.rate = rate
+        self.verbose = verbose
+
+    def start(self):
+        '''Arm the slaves, start the master and return the SyncReport'''
+        start_time = time.perf_counter()
+        for task in self.slaves:
+            task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+            task.start()
+        arm_time = time.perf_counter()
+        self.master.start()
+        start_duration = time.perf_counter() - arm_time
+
+        skew_samples = self.measure_skew()
+        report = SyncReport(skew_samples, skew_samples / float(self.rate),
+                            arm_time - start_time, start_duration)
+        if self.verbose: print(f'synchronized start of {len(self.slaves)} tasks, '
+                               f'skew {skew_samples} samples = {report.skew} s')
+        return report
+
+    def measure_skew(self):
+        '''Largest difference in generated samples between a slave and the master.
+        The master is read before and after the slaves, to remove the time
+        between the reads, so that a shared clock gives 0'''
+        before = self.master.out_stream.total_samp_per_chan_generated
+        generated = [task.out_stream.total_samp_per_chan_generated for task in self.slaves]
+        after = self.master.out_stream.total_samp_per_chan_generated
+        master = (before + after) / 2
+        return max((g - master for g in generated), key = abs, default = 0.)
+
+    def stop(self):
+        '''Stop the master first, so that the slaves stop on the same clock edge'''
+        self.master.stop()
+        for task in self.slaves:
+            task.stop()
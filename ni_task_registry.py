@@ -0,0 +1,211 @@
+import atexit
+import threading
+from collections import OrderedDict
+
+import nidaqmx
+from nidaqmx.utils import unflatten_channel_string
+
+
+class TaskEntry(object):
+    '''A task of the registry with its key and its current owner (None when idle)'''
+
+    def __init__(self, task, kind, channels, timing, owner):
+
+        self.task = task
+        self.kind = kind
+        self.channels = channels
+        self.timing = timing
+        self.owner = owner
+        self.resources = resources(kind, channels, timing)
+
+    @property
+    def key(self):
+        return (self.kind, self.channels, self.timing)
+
+    def state(self):
+        if self.owner is None:
+            return 'idle'
+        try:
+            return 'stopped' if self.task.is_task_done() else 'running'
+        except nidaqmx.DaqError:
+            return 'unknown'
+
+
+def resources(kind, channels, timing):
+    '''Physical channels of a task, plus the timing engine of the device for the tasks
+    that may be timed: all but 'on_demand' ones, timing None included since the device
+    configures the sample clock after acquiring the task'''
+    names = {name.strip('/') for name in unflatten_channel_string(channels)}
+    if timing != 'on_demand' and kind in ('ai', 'ao', 'di', 'do'):
+        names |= {f"{name.split('/')[0]}/{kind}/SampleClock" for name in names}
+    return names
+
+
+def reset(task, kind):
+    '''Back to the defaults the timing, start trigger and buffer properties that a
+    device sets after creating a task, so that a pooled task comes back as configure
+    left it. Properties not supported by the task are skipped'''
+    resets = [task.triggers.start_trigger.disable_start_trig,
+              lambda: delattr(task.timing, 'samp_timing_type')]
+    if kind in ('ao', 'do', 'co'):
+        resets += [lambda: delattr(task.out_stream, 'regen_mode'),
+                   lambda: delattr(task.out_stream, 'output_buf_size')]
+    else:
+        resets += [lambda: delattr(task.in_stream, 'input_buf_size')]
+    for reset_property in resets:
+        try:
+            reset_property()
+        except nidaqmx.DaqError:
+            pass
+
+
+def overlap(a, b):
+    '''True if the physical channel a is b or contains b (port and lines of the port)'''
+    return a == b or a.startswith(b + '/') or b.startswith(a + '/')
+
+
+class TaskRegistry(object):
+    '''Process wide owner of the nidaqmx tasks of all the devices.
+
+    Tasks are keyed by (kind, channels, timing), timing being any hashable
+    description of the configuration fixed at creation ('on_demand' for untimed
+    tasks, None if the timing is configured later by the device). Every task but the
+    'on_demand' ones holds the timing engine of its kind on the device. A released task
+    is stopped, unreserved and kept in the pool: acquiring the same key again
+    returns it without rebuilding it, with the properties the device configures
+    later reset when timing is None.
+    Acquiring channels used by a task of another owner raises a ValueError
+    before anything is sent to the driver. Owners that must drive the same channels
+    share one object holding the task, with share() and unshare().
+    '''
+
+    def __init__(self, max_idle = 16, verbose = False):
+
+        self.entries = OrderedDict() # key: TaskEntry, least recently used first
+        self.shared = {} # key: [object, number of users]
+        self.lock = threading.RLock()
+        self.max_idle = max_idle
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, kind, channels, configure, timing = None, owner = None):
+        '''Return a task for owner with the channels added by configure(task),
+        reusing a pooled task with the same key when possible'''
+        key = (kind, channels, timing)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.owner not in (None, owner):
+                raise(ValueError(f'{kind} task on {channels} already used by {name(entry.owner)}'))
+            self.check_conflicts(resources(kind, channels, timing), owner)
+
+            if entry is not None:
+                if timing is None:
+                    reset(entry.task, kind)
+                self.entries.move_to_end(key)
+                entry.owner = owner
+                self.hits += 1
+                if self.verbose: print(f'{kind} task on {channels} reused from the pool')
+                return entry.task
+
+            task = nidaqmx.Task()
+            try:
+                configure(task)
+            except Exception:
+                task.close()
+                raise
+            self.entries[key] = TaskEntry(task, kind, channels, timing, owner)
+            self.misses += 1
+            if self.verbose: print(f'{kind} task on {channels} created')
+            return task
+
+    def share(self, key, create):
+        '''Object of key shared by several users, made by create() for the first one'''
+        with self.lock:
+            if key not in self.shared:
+                self.shared[key] = [create(), 0]
+            self.shared[key][1] += 1
+            return self.shared[key][0]
+
+    def unshare(self, key):
+        '''Remove a user of the shared object of key, True if it was the last one'''
+        with self.lock:
+            entry = self.shared[key]
+            entry[1] -= 1
+            if entry[1] > 0:
+                return False
+            del self.shared[key]
+            return True
+
+    def check_conflicts(self, needed, owner):
+        for entry in self.entries.values():
+            if entry.owner is None or entry.owner is owner:
+                continue
+            shared = [a for a in needed for b in entry.resources if overlap(a, b)]
+            if shared:
+                raise(ValueError(f'{", ".join(sorted(shared))} already used by {name(entry.owner)} '
+                                 f'({entry.kind} task on {entry.channels})'))
+
+    def find(self, task):
+        for entry in self.entries.values():
+            if entry.task is task:
+                return entry
+        raise(AttributeError('Task not in the registry'))
+
+    def release(self, task):
+        '''Stop the task and give back its resources, keeping it configured in the pool'''
+        with self.lock:
+            entry = self.find(task)
+            try:
+                task.stop()
+                task.control(nidaqmx.constants.TaskMode.TASK_UNRESERVE)
+            except nidaqmx.DaqError as err:
+                # not reusable, the next acquire builds a new task
+                if self.verbose: print(f'{entry.kind} task on {entry.channels} dropped: ', err)
+                self.close(task)
+                return
+            entry.owner = None
+            self.trim()
+
+    def close(self, task):
+        '''Close the task and remove it from the registry'''
+        with self.lock:
+            entry = self.find(task)
+            del self.entries[entry.key]
+            task.close()
+
+    def trim(self):
+        '''Close the least recently used idle tasks above max_idle'''
+        idle = [entry for entry in self.entries.values() if entry.owner is None]
+        for entry in idle[:max(0, len(idle) - self.max_idle)]:
+            self.close(entry.task)
+
+    def close_all(self):
+        with self.lock:
+            for entry in list(self.entries.values()):
+                try:
+                    self.close(entry.task)
+                except nidaqmx.DaqError as err:
+                    if self.verbose: print('Task not closed: ', err)
+
+    def table(self):
+        '''One row per task: kind, channels, timing, owner and state'''
+        with self.lock:
+            return [dict(kind = entry.kind, channels = entry.channels, timing = entry.timing,
+                         owner = name(entry.owner), state = entry.state())
+                    for entry in self.entries.values()]
+
+    def format_table(self):
+        rows = [[str(value) for value in row.values()] for row in self.table()]
+        header = ['kind', 'channels', 'timing', 'owner', 'state']
+        widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+        return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+                         for row in [header] + rows)
+
+
+def name(owner):
+    return '-' if owner is None else type(owner).__name__
+
+
+registry = TaskRegistry()
+atexit.register(registry.close_all)
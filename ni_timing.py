@@ -0,0 +1,152 @@
+import functools
+import math
+from collections import namedtuple
+from fractions import Fraction
+
+import numpy as np
+import nidaqmx
+import nidaqmx.system as ni
+
+from NIdaqmx_ScopeFoundry.ni_phase import exact_fraction
+
+TimingPlan = namedtuple('TimingPlan', ['rate', 'samples_per_period', 'frequency', 'frequency_error'])
+PulsePlan = namedtuple('PulsePlan', ['frequency', 'duty_cycle', 'high_ticks', 'low_ticks', 'frequency_error'])
+
+
+@functools.lru_cache(maxsize = None)
+def device_limits(device_name):
+    '''Query the timing limits and sample clock timebases of a device once,
+    None if not supported by the board'''
+    device = ni.Device(device_name)
+    limits = {}
+    for name in ['ao_max_rate', 'do_max_rate', 'ai_max_single_chan_rate', 'ai_max_multi_chan_rate',
+                 'ci_max_timebase', 'co_max_timebase']:
+        try:
+            limits[name] = getattr(device, name)
+        except nidaqmx.DaqError:
+            limits[name] = None
+    for kind in ['ai', 'ao', 'do']:
+        limits[f'{kind}_timebase'] = sample_clock_timebase(device, kind)
+    return limits
+
+
+def sample_clock_timebase(device, kind):
+    '''Rate of the timebase divided to make the ai, ao or do sample clock (20 MHz on
+    M series, 100 MHz on X series), read from a task configured on the first channel
+    of kind. The task is never committed, so no resource is reserved.
+    None if the board has no such channel or no onboard clock for it.'''
+    try:
+        with nidaqmx.Task() as task:
+            if kind == 'ai':
+                task.ai_channels.add_ai_voltage_chan(device.ai_physical_chans[0].name)
+            elif kind == 'ao':
+                task.ao_channels.add_ao_voltage_chan(device.ao_physical_chans[0].name)
+            else:
+                task.do_channels.add_do_chan(device.do_lines[0].name)
+            task.timing.cfg_samp_clk_timing(rate = 1000.)
+            return task.timing.samp_clk_timebase_rate
+    except (nidaqmx.DaqError, IndexError):
+        return None
+
+
+def device_name(channel):
+    '''Dev1 from Dev1/ao0 or /Dev1/PFI0'''
+    return channel.strip('/').split('/')[0]
+
+
+class TimingPlanner(object):
+    '''Sample rates a board can produce are timebase / divisor, divisor integer.
+    The planner coerces requested rates the way the driver does and chooses
+    samples_per_period and rate so that rate / samples_per_period is the requested
+    frequency, or as close as possible.
+    A timebase of None (not reported by the board) leaves the rates as requested,
+    a max_rate of None does not limit them.
+    '''
+
+    def __init__(self, timebase, max_rate):
+
+        self.timebase = exact_fraction(timebase) if timebase else None
+        self.max_rate = max_rate
+        self.min_divisor = 1
+        if self.timebase is not None and max_rate:
+            self.min_divisor = max(1, math.ceil(self.timebase / exact_fraction(max_rate)))
+
+    def divisor(self, rate):
+        return max(self.min_divisor, round(self.timebase / exact_fraction(rate)))
+
+    def coerce_rate(self, rate):
+        '''Rate actually produced when rate is requested'''
+        if self.timebase is None:
+            return exact_fraction(rate)
+        return self.timebase / self.divisor(rate)
+
+    def check_rate(self, rate):
+        if self.max_rate is not None and rate > self.max_rate:
+            raise(ValueError(f'Rate {float(rate)} Hz above the board maximum of {self.max_rate} Hz'))
+        return rate
+
+    def plan(self, frequency, samples_per_period, search = True):
+        '''Return the TimingPlan closest to frequency. With search, samples_per_period
+        is looked for between half and twice the requested value, preferring the value
+        closest to the request among those with the smallest frequency error'''
+        frequency = exact_fraction(frequency)
+        self.check_rate(frequency * samples_per_period)
+        if self.timebase is None:
+            return TimingPlan(frequency * samples_per_period, samples_per_period, frequency, 0.)
+        if search:
+            candidates = np.arange(max(2, samples_per_period // 2), 2 * samples_per_period + 1)
+            if self.max_rate is not None:
+                candidates = candidates[candidates * float(frequency) <= self.max_rate]
+        else:
+            candidates = np.array([samples_per_period])
+        divisors = np.rint(float(self.timebase) / (candidates * float(frequency)))
+        divisors = np.maximum(divisors, self.min_divisor)
+        errors = np.abs(float(self.timebase) / (divisors * candidates) - float(frequency))
+        best = np.flatnonzero(errors <= errors.min() * (1 + 1e-9))
+        n = int(candidates[best[np.argmin(np.abs(candidates[best] - samples_per_period))]])
+
+        rate = self.timebase / self.divisor(frequency * n)
+        actual_frequency = rate / n
+        return TimingPlan(rate, n, actual_frequency, float(actual_frequency - frequency))
+
+    def plan_pulse(self, frequency, duty_cycle, min_ticks = 2):
+        '''Counter output: high and low times are integer numbers of timebase ticks'''
+        frequency = exact_fraction(frequency)
+        if self.timebase is None:
+            return PulsePlan(frequency, exact_fraction(duty_cycle), None, None, 0.)
+        ticks = max(2 * min_ticks, round(self.timebase / frequency))
+        high_ticks = min(max(min_ticks, round(ticks * exact_fraction(duty_cycle))), ticks - min_ticks)
+        actual_frequency = self.timebase / ticks
+        return PulsePlan(actual_frequency, Fraction(high_ticks, ticks), high_ticks, ticks - high_ticks,
+                         float(actual_frequency - frequency))
+
+
+@functools.lru_cache(maxsize = None)
+def ao_planner(device, timebase = None):
+    limits = device_limits(device)
+    return TimingPlanner(timebase or limits['ao_timebase'], limits['ao_max_rate'])
+
+
+@functools.lru_cache(maxsize = None)
+def do_planner(device, timebase = None):
+    '''The DO port is usually clocked by the AO sample clock, bounded by both limits'''
+    limits = device_limits(device)
+    rates = [rate for rate in (limits['do_max_rate'], limits['ao_max_rate']) if rate]
+    return TimingPlanner(timebase or limits['do_timebase'] or limits['ao_timebase'],
+                         min(rates) if rates else None)
+
+
+@functools.lru_cache(maxsize = None)
+def co_planner(device):
+    timebase = device_limits(device)['co_max_timebase']
+    return TimingPlanner(timebase, timebase / 4 if timebase else None)
+
+
+@functools.lru_cache(maxsize = None)
+def ai_planner(device, num_channels = 1, timebase = None):
+    '''Multiplexed AI: the maximum multi channel rate is shared by the channels of the task'''
+    limits = device_limits(device)
+    timebase = timebase or limits['ai_timebase']
+    if num_channels > 1 and limits['ai_max_multi_chan_rate']:
+        return TimingPlanner(timebase, limits['ai_max_multi_chan_rate'] / num_channels)
+    return TimingPlanner(timebase, limits['ai_max_single_chan_rate'])
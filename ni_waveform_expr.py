@@ -0,0 +1,199 @@
+'''Waveform expressions built from a registry of vectorized primitives.
+
+An expression is a string such as
+    sum(rect(amplitude=2, duty=0.25), spikes(amplitude=0.5, duration=0.001), constant(value=-1))
+Primitives take keyword arguments only, combinators take expressions as positional
+arguments (clip also takes low and high). The expression is parsed and compiled once
+into a list of in-place NumPy operations working on a few preallocated registers,
+then evaluated on the integer phase of a PhaseAccumulator.
+'''
+
+import ast
+
+import numpy as np
+
+from NIdaqmx_ScopeFoundry.ni_phase import exact_fraction
+
+
+PRIMITIVES = {}
+
+
+def primitive(name, uses_period = False):
+    '''Register func(context, out, **params) that writes its samples into out'''
+    def register(func):
+        func.uses_period = uses_period
+        PRIMITIVES[name] = func
+        return func
+    return register
+
+
+class WaveformContext(object):
+    '''Samples on which a compiled expression is evaluated'''
+
+    def __init__(self, phase, acc, frequency):
+        self.phase = phase
+        self.acc = acc
+        self.frequency = frequency
+
+    def phase_fraction(self, out):
+        np.remainder(self.acc, self.phase.den, out = out, casting = 'unsafe')
+        out /= self.phase.den
+        return out
+
+
+@primitive('sine')
+def sine(context, out, amplitude = 1., phase = 0.):
+    context.phase_fraction(out)
+    out += phase
+    out *= 2*np.pi
+    np.sin(out, out = out)
+    out *= amplitude
+
+
+@primitive('rect')
+def rect(context, out, amplitude = 1., duty = 0.5, phase = 0.):
+    if phase:
+        context.phase_fraction(out)
+        out -= phase
+        np.remainder(out, 1., out = out)
+        np.less(out, duty, out = out)
+    else:
+        out[:] = context.phase.below(context.acc, duty)
+    out *= amplitude
+
+
+@primitive('ramp')
+def ramp(context, out, amplitude = 1.):
+    context.phase_fraction(out)
+    out *= amplitude
+
+
+@primitive('staircase', uses_period = True)
+def staircase(context, out, amplitude = 1.):
+    '''amplitude times the index of the period in the cycle of steps'''
+    out[:] = context.phase.period(context.acc)
+    out *= amplitude
+
+
+@primitive('step', uses_period = True)
+def step(context, out, amplitude = 1., start = 1):
+    '''amplitude from the start-th period of the cycle of steps on'''
+    np.greater_equal(context.phase.period(context.acc), start, out = out, casting = 'unsafe')
+    out *= amplitude
+
+
+@primitive('spikes')
+def spikes(context, out, amplitude = 1., duration = 0.):
+    '''spike of the given duration (s) at the beginning of each period'''
+    out[:] = context.phase.below(context.acc, exact_fraction(duration) * exact_fraction(context.frequency))
+    out *= amplitude
+
+
+@primitive('exponential')
+def exponential(context, out, amplitude = 1., tau = 1.):
+    '''exponential decay with time constant tau (s), restarted each period'''
+    context.phase_fraction(out)
+    out *= -1. / (context.frequency * tau)
+    np.exp(out, out = out)
+    out *= amplitude
+
+
+@primitive('constant')
+def constant(context, out, value = 0.):
+    out.fill(value)
+
+
+COMBINATORS = {'sum': np.add,
+               'product': np.multiply}
+
+
+class WaveformExpression(object):
+    '''Compiled waveform expression'''
+
+    def __init__(self, text):
+
+        self.text = text
+        self.ops = []
+        self.num_registers = 0
+        self.uses_period = False
+        tree = ast.parse(text.strip(), mode = 'eval').body
+        self.compile_node(tree, 0)
+
+    def compile_node(self, node, register):
+        '''Append the operations that leave the value of node in register'''
+        self.num_registers = max(self.num_registers, register + 1)
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)):
+            raise(ValueError(f'Invalid waveform expression: {ast.unparse(node)}'))
+        name = node.func.id
+
+        if name in PRIMITIVES:
+            func = PRIMITIVES[name]
+            if node.args:
+                raise(ValueError(f'{name} takes keyword arguments only'))
+            params = {kw.arg: self.number(kw.value) for kw in node.keywords}
+            self.uses_period |= func.uses_period
+            self.ops.append(lambda context, regs: func(context, regs[register], **params))
+
+        elif name in COMBINATORS:
+            ufunc = COMBINATORS[name]
+            if not node.args or node.keywords:
+                raise(ValueError(f'{name} takes expressions as arguments'))
+            self.compile_node(node.args[0], register)
+            for arg in node.args[1:]:
+                self.compile_node(arg, register + 1)
+                self.ops.append(lambda context, regs: ufunc(regs[register], regs[register + 1], out = regs[register]))
+
+        elif name == 'clip':
+            if len(node.args) != 1:
+                raise(ValueError('clip takes one expression'))
+            bounds = {kw.arg: self.number(kw.value) for kw in node.keywords}
+            low = bounds.get('low', -np.inf)
+            high = bounds.get('high', np.inf)
+            self.compile_node(node.args[0], register)
+            self.ops.append(lambda context, regs: np.clip(regs[register], low, high, out = regs[register]))
+
+        elif name == 'gate':
+            if len(node.args) != 2:
+                raise(ValueError('gate takes an expression and a gating expression'))
+            self.compile_node(node.args[0], register)
+            self.compile_node(node.args[1], register + 1)
+            self.ops.append(lambda context, regs: np.multiply(regs[register], regs[register + 1] != 0, out = regs[register]))
+
+        else:
+            raise(ValueError(f'Unknown waveform function {name}'))
+
+    @staticmethod
+    def number(node):
+        value = ast.literal_eval(node)
+        if not isinstance(value, (int, float)):
+            raise(ValueError(f'Invalid waveform parameter: {ast.unparse(node)}'))
+        return value
+
+    def evaluate(self, phase, num_samples, frequency):
+        '''Return the next num_samples samples, advancing the PhaseAccumulator phase'''
+        context = WaveformContext(phase, phase.advance(num_samples), frequency)
+        regs = [np.empty(num_samples) for _ in range(self.num_registers)]
+        for op in self.ops:
+            op(context, regs)
+        return regs[0]
+
+
+def classic_expression(waveform_type, amplitude_list, spike_amplitude, spike_duration, offset):
+    '''Expression of the waveforms available before the expression engine'''
+    amplitude0, amplitude1 = float(amplitude_list[0]), float(amplitude_list[1])
+    spike_amplitude, spike_duration, offset = float(spike_amplitude), float(spike_duration), float(offset)
+    if waveform_type == 'sine':
+        terms = [f'sine(amplitude={amplitude0!r})']
+    elif waveform_type == 'rect':
+        terms = [f'rect(amplitude={amplitude0!r}, duty=0.5)']
+    elif waveform_type == 'step':
+        terms = [f'staircase(amplitude={amplitude0!r})']
+    elif waveform_type == 'custom':
+        terms = [f'step(amplitude={amplitude0!r}, start=1)',
+                 f'step(amplitude={amplitude1!r}, start=2)']
+    else:
+        raise(ValueError('Waveform not specified'))
+    if spike_amplitude > 0:
+        terms.append(f'spikes(amplitude={spike_amplitude!r}, duration={spike_duration!r})')
+    terms.append(f'constant(value={offset!r})')
+    return 'sum(' + ', '.join(terms) + ')'
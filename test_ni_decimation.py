@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pytest
+
+from ni_decimation import MinMaxPyramid
+
+
+def check_view(pyramid, data, start, stop, width):
+    '''Every group of the view holds the min and max of its samples in data'''
+    x, y = pyramid.view(start, stop, width)
+    step = pyramid.factor**pyramid.level_for(start, stop, width)
+    firsts, lasts = x[0::2], x[1::2]
+    assert np.all(lasts - firsts == step - 1)
+    assert np.all(np.diff(firsts) == step)
+    # only groups in the requested range
+    assert len(firsts) == 0 or (firsts[0] >= start - step + 1 and lasts[-1] < max(stop, 1) + step - 1)
+    for i, first in enumerate(firsts):
+        group = data[..., first:first + step]
+        assert np.array_equal(y[..., 2*i], group.min(axis = -1))
+        assert np.array_equal(y[..., 2*i + 1], group.max(axis = -1))
+    return firsts
+
+
+@pytest.mark.parametrize('seed, channels', [(0, ()), (1, (2,)), (2, ()), (3, (3,))])
+def test_views_against_brute_force(seed, channels):
+    rng = np.random.default_rng(seed)
+    capacity = 1000
+    pyramid = MinMaxPyramid(capacity, channels, factor = 4, min_entries = 8)
+    data = np.zeros(channels + (0,))
+    # small, unaligned, full and oversized appends
+    for n in [1, 3, 250, 999, 1000, 17, 2500, 5, 1001] + list(rng.integers(1, 400, 20)):
+        block = rng.normal(size = channels + (int(n),))
+        pyramid.append(block)
+        data = np.concatenate((data, block), axis = -1)
+        assert pyramid.length == data.shape[-1]
+        for width in (10, 50, 2000):
+            check_view(pyramid, data, 0, data.shape[-1], width)
+            start = int(rng.integers(0, data.shape[-1]))
+            check_view(pyramid, data, start, int(rng.integers(start, data.shape[-1] + 1)), width)
+
+
+def test_recent_samples_are_complete():
+    pyramid = MinMaxPyramid(1000, min_entries = 8)
+    data = np.arange(3333.)
+    pyramid.append(data[:1500])
+    pyramid.append(data[1500:])
+    # the full resolution view of the last capacity samples has every sample
+    firsts = check_view(pyramid, data, len(data) - 1000, len(data), 2000)
+    assert firsts.tolist() == list(range(len(data) - 1000, len(data)))
+
+
+def test_concurrent_append_and_view():
+    pyramid = MinMaxPyramid(4096, min_entries = 8)
+    done = threading.Event()
+
+    def writer():
+        for k in range(2000):
+            pyramid.append(np.full(37, float(k)))
+        done.set()
+
+    thread = threading.Thread(target = writer)
+    thread.start()
+    while not done.is_set():
+        x, y = pyramid.view(0, pyramid.length, 100)
+        # samples are appended in increasing order: every group is ordered like its position
+        assert np.all(np.diff(y[0::2]) >= 0) and np.all(y[0::2] <= y[1::2])
+    thread.join()
@@ -0,0 +1,63 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from ni_do_pattern import PatternPacker, parse_pattern, port_dtype
+from ni_phase import PhaseAccumulator
+
+DEFAULT_PATTERN = '0: rect(0.5); 1: rect(0.1, 0.25); 2: not(0); 3: and(0, 1)'
+
+
+def reference_lines(pattern, frequency, rate, num_samples):
+    '''Value of each line at each sample, from the exact phase k * frequency / rate'''
+    lines = {}
+    for line, (kind, *args) in pattern.items():
+        values = []
+        for k in range(num_samples):
+            phase = (k * Fraction(frequency) / Fraction(rate)) % 1
+            if kind == 'rect':
+                start = Fraction(str(args[1])) if len(args) > 1 else 0
+                values.append((phase - start) % 1 < Fraction(str(args[0])))
+            elif kind == 'const':
+                values.append(bool(args[0]))
+            elif kind == 'not':
+                values.append(not lines[args[0]][k])
+            elif kind == 'and':
+                values.append(lines[args[0]][k] and lines[args[1]][k])
+            elif kind == 'or':
+                values.append(lines[args[0]][k] or lines[args[1]][k])
+            elif kind == 'xor':
+                values.append(lines[args[0]][k] != lines[args[1]][k])
+        lines[line] = values
+    return lines
+
+
+def test_parse_keyword_operations():
+    assert parse_pattern(DEFAULT_PATTERN) == {0: ('rect', 0.5),
+                                              1: ('rect', 0.1, 0.25),
+                                              2: ('not', 0),
+                                              3: ('and', 0, 1)}
+    assert parse_pattern('0: const(1); 5: or(0, 0); 6: xor(0, 5);') == {0: ('const', 1),
+                                                                      5: ('or', 0, 0),
+                                                                      6: ('xor', 0, 5)}
+    with pytest.raises(ValueError):
+        parse_pattern('0: rect 0.5')
+
+
+@pytest.mark.parametrize('num_lines', [8, 16, 32])
+def test_default_pattern_against_per_line_reference(num_lines):
+    top = num_lines - 1
+    text = DEFAULT_PATTERN + f'; {top - 1}: or(2, 1); {top}: xor(0, 1)'
+    pattern = parse_pattern(text)
+    dtype = port_dtype(num_lines)
+    frequency, rate, num_samples = 100, 4000, 250
+    # packed in two calls of unequal length, the phase must continue across them
+    phase = PhaseAccumulator(frequency, rate)
+    packer = PatternPacker(pattern, dtype, chunk_size = 64)
+    samples = np.concatenate((packer.pack(phase, 101), packer.pack(phase, num_samples - 101)))
+    assert samples.dtype == dtype
+
+    lines = reference_lines(pattern, frequency, rate, num_samples)
+    expected = [sum(int(lines[line][k]) << line for line in lines) for k in range(num_samples)]
+    assert samples.tolist() == expected
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from ni_do_sequence import RLESequence
+
+
+def reference_samples(values, durations):
+    samples = []
+    for value, duration in zip(values, durations):
+        samples += [value] * duration
+    return samples
+
+
+def random_sequence(seed, num_runs = 40):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 256, num_runs)
+    durations = rng.integers(1, 30, num_runs)
+    return RLESequence(values, durations), reference_samples(values.tolist(), durations.tolist())
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_expand_slices(seed):
+    sequence, samples = random_sequence(seed)
+    assert sequence.num_samples == len(samples)
+    rng = np.random.default_rng(seed)
+    for start, count in [(0, len(samples)), (0, 1), (len(samples) - 1, 5), (len(samples), 3)] + \
+                        [tuple(rng.integers(0, len(samples), 2)) for _ in range(50)]:
+        expanded = sequence.expand(int(start), int(count))
+        assert expanded.dtype == np.uint8
+        assert expanded.tolist() == samples[start:start + count]
+
+
+@pytest.mark.parametrize('loop', [False, True])
+def test_chunks(loop):
+    sequence, samples = random_sequence(7)
+    chunk_size = 37
+    chunks = sequence.chunks(chunk_size, loop)
+    if loop:
+        # three times around the sequence, every chunk full
+        num_chunks = 3 * len(samples) // chunk_size
+        got = [next(chunks) for _ in range(num_chunks)]
+        assert all(len(chunk) == chunk_size for chunk in got)
+        assert np.concatenate(got).tolist() == (samples * 4)[:num_chunks * chunk_size]
+    else:
+        assert np.concatenate(list(chunks)).tolist() == samples
+
+
+def test_from_edges():
+    edges = [(3, 1), (5, 1), (6, 4), (10, 0)]
+    sequence = RLESequence.from_edges(edges, 12, initial = 2)
+    expected = [2, 2, 2, 1, 1, 1, 4, 4, 4, 4, 0, 0]
+    assert sequence.expand(0, 12).tolist() == expected
+    # the repeated value at 5 is merged into the run started at 3
+    assert sequence.values.tolist() == [2, 1, 4, 0]
+    with pytest.raises(ValueError):
+        RLESequence.from_edges([(4, 1), (4, 0)], 12)
+    with pytest.raises(ValueError):
+        RLESequence.from_edges([(12, 1)], 12)
+
+
+def test_stretch():
+    sequence, samples = random_sequence(3, num_runs = 10)
+    stretched = sequence.stretch(3)
+    assert stretched.expand(0, stretched.num_samples).tolist() == np.repeat(samples, 3).tolist()
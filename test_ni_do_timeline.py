@@ -0,0 +1,65 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from ni_do_timeline import compile_timeline, parse_timeline
+from ni_timing import TimingPlanner
+
+DEFAULT_TIMELINE = '0: pulse(1.2e-3, 300e-6); 3: pulse(0, 2.5e-3, 5e-3)'
+
+
+def reference_samples(pulses, num_samples, sample_period):
+    '''Port value at each sample time, pulse by pulse, on exact fractions'''
+    samples = []
+    for k in range(num_samples):
+        t = k * sample_period
+        value = 0
+        for line, start, width, period in pulses:
+            start, width = Fraction(str(start)), Fraction(str(width))
+            if period is None:
+                high = start <= t < start + width
+            else:
+                high = t >= start and (t - start) % Fraction(str(period)) < width
+            value |= high << line
+        samples.append(value)
+    return samples
+
+
+def test_parse_timeline():
+    assert parse_timeline(DEFAULT_TIMELINE) == [(0, 1.2e-3, 300e-6, None), (3, 0, 2.5e-3, 5e-3)]
+    with pytest.raises(ValueError):
+        parse_timeline('0: rect(0.5)')
+
+
+@pytest.mark.parametrize('text, duration, rate', [
+    (DEFAULT_TIMELINE, 20e-3, 10e3), # edges on a 100 us grid
+    ('1: pulse(0, 1e-3, 3e-3); 2: pulse(2e-3, 1e-3, 3e-3); 7: pulse(0.5e-3, 0.25e-3)', 12e-3, 4e3),
+    # back to back pulses on one line merge, a pulse past the end holds the line high
+    ('0: pulse(0, 1e-3); 0: pulse(1e-3, 1e-3); 5: pulse(9e-3, 2e-3)', 10e-3, 1e3),
+])
+def test_compiled_timeline_against_reference(text, duration, rate):
+    pulses = parse_timeline(text)
+    compiled = compile_timeline(pulses, duration, TimingPlanner(100e6, 1e6))
+    assert compiled.rate == rate
+    assert compiled.num_samples == round(duration * rate)
+    samples = compiled.sequence.expand(0, compiled.num_samples)
+    assert samples.tolist() == reference_samples(pulses, compiled.num_samples, compiled.sample_period)
+
+
+def test_wide_port():
+    pulses = [(31, 0, 1e-3, 2e-3), (16, 1e-3, 1e-3, None)]
+    compiled = compile_timeline(pulses, 4e-3, TimingPlanner(100e6, 1e6), np.uint32)
+    samples = compiled.sequence.expand(0, compiled.num_samples)
+    assert samples.dtype == np.uint32
+    assert samples.tolist() == reference_samples(pulses, compiled.num_samples, compiled.sample_period)
+
+
+def test_invalid_timelines():
+    planner = TimingPlanner(100e6, 1e6)
+    with pytest.raises(ValueError): # overlapping pulses on line 0
+        compile_timeline([(0, 0, 2e-3, None), (0, 1e-3, 2e-3, None)], 5e-3, planner)
+    with pytest.raises(ValueError): # edges 10 ns apart need more than 1 MHz
+        compile_timeline([(0, 0, 1e-8, None)], 1e-3, planner)
+    with pytest.raises(ValueError): # no timebase, the edges cannot be made exact
+        compile_timeline([(0, 0, 1e-3, None)], 5e-3, TimingPlanner(None, None))
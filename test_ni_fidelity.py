@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from ni_fidelity import estimate_delay, loopback_fidelity, signal_period
+
+
+def delayed_sine(num_samples, samples_per_period, delay, amplitude = 1.):
+    return amplitude * np.sin(2 * np.pi * (np.arange(num_samples) - delay) / samples_per_period)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_delay_of_a_multi_period_buffer_with_noise(seed):
+    rng = np.random.default_rng(seed)
+    reference = delayed_sine(600, 100, 0) # num_periods = 6, samples_per_period = 100
+    repetitions = 4
+    acquired = np.tile(delayed_sine(600, 100, 3), repetitions) + rng.normal(0, 0.05, 600 * repetitions)
+    report = loopback_fidelity(reference, acquired, 1e5)
+    assert abs(report.delay_samples - 3) < 0.5
+    assert abs(report.gain_error) < 0.01
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_fractional_delay_of_a_three_period_buffer(seed):
+    rng = np.random.default_rng(seed)
+    reference = delayed_sine(300, 100, 0)
+    acquired = np.tile(0.98 * delayed_sine(300, 100, 2.4), 3) + rng.normal(0, 0.05, 900)
+    report = loopback_fidelity(reference, acquired, 1e5)
+    assert abs(report.delay_samples - 2.4) < 0.2
+    assert abs(report.latency - 2.4e-5) < 2e-6
+
+
+def test_signal_period():
+    assert signal_period(delayed_sine(600, 100, 0)) == 100
+    assert signal_period(np.repeat([0., 1., 2.], 50)) == 150
+    assert signal_period(np.zeros(10)) == 1
+
+
+def test_ambiguous_delay_is_rejected():
+    # two nearly equal pulses per period: the correlation peaks are a noise away
+    reference = np.zeros(100)
+    reference[0], reference[50] = 1., 0.99
+    with pytest.raises(ValueError):
+        estimate_delay(reference, np.roll(reference, 3))
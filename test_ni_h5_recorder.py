@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip('h5py')
+
+from ni_h5_recorder import H5Recorder
+
+
+def test_blocks_appended_in_order(tmp_path):
+    path = str(tmp_path / 'record.h5')
+    rng = np.random.default_rng(0)
+    blocks = [rng.normal(size = (2, 100)) for _ in range(25)]
+    recorder = H5Recorder(path, verbose = False)
+    recorder.add_dataset('ai', (2, 100), attrs = {'rate': 1e3, 'skipped': None})
+    for block in blocks:
+        assert recorder.put('ai', block)
+        block[:] = 0 # put copies the block, the caller may reuse it
+    recorder.close()
+    stats = recorder.stats()
+    assert stats['blocks_written'] == 25 and stats['dropped'] == 0
+
+    rng = np.random.default_rng(0)
+    with h5py.File(path, 'r') as f:
+        dataset = f['ai']
+        assert dataset.chunks == (2, 100)
+        assert dataset.attrs['rate'] == 1e3 and 'skipped' not in dataset.attrs
+        assert np.array_equal(dataset[()], np.concatenate([rng.normal(size = (2, 100)) for _ in range(25)],
+                                                          axis = -1))
+
+
+def test_reopened_dataset_is_extended(tmp_path):
+    path = str(tmp_path / 'record.h5')
+    for value in (1, 2):
+        recorder = H5Recorder(path, verbose = False)
+        recorder.add_dataset('ai', (1, 10))
+        recorder.put('ai', np.full((1, 10), value))
+        recorder.close()
+    with h5py.File(path, 'r') as f:
+        assert f['ai'][0].tolist() == [1] * 10 + [2] * 10
+    recorder = H5Recorder(path, verbose = False)
+    with pytest.raises(ValueError):
+        recorder.add_dataset('ai', (3, 10))
+    recorder.close()
+
+
+def test_full_queue_drops_blocks(tmp_path):
+    # the writer may or may not keep up: every block is either written or counted as dropped
+    recorder = H5Recorder(str(tmp_path / 'record.h5'), max_queue = 2, verbose = False)
+    recorder.add_dataset('ai', (1, 1000))
+    results = [recorder.put('ai', np.ones((1, 1000))) for _ in range(200)]
+    recorder.close()
+    assert results.count(False) == recorder.dropped
+    assert recorder.blocks_written == results.count(True)
@@ -0,0 +1,58 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from ni_phase import PhaseAccumulator, exact_fraction
+
+
+def reference_phase(k, frequency, rate):
+    '''Exact position of sample k, in periods'''
+    return k * exact_fraction(frequency) / exact_fraction(rate)
+
+
+@pytest.mark.parametrize('frequency, rate, cycle', [(50, 5000, 1), (50, 4999, 3), (0.3, 1234.5, 2),
+                                                    (1e3, Fraction(10**8, 7), 1)])
+def test_advance_matches_exact_phase(frequency, rate, cycle):
+    phase = PhaseAccumulator(frequency, rate, cycle)
+    # several calls of unequal length are phase continuous
+    acc = np.concatenate([phase.advance(n) for n in (1, 99, 250, 7)])
+    periods, fractions = phase.period(acc), phase.phase(acc)
+    for k in range(len(acc)):
+        exact = reference_phase(k, frequency, rate)
+        assert periods[k] == int(exact) % cycle
+        assert fractions[k] == pytest.approx(float(exact % 1), abs = 1e-12)
+
+
+def test_block_length_returns_to_start():
+    phase = PhaseAccumulator(60, 1000, cycle = 3)
+    length = phase.block_length()
+    assert length == 50 # 3 periods of 50/3 samples
+    phase.advance(length)
+    assert phase.acc == 0
+    for n in range(1, length):
+        assert (n * phase.step) % phase.modulus != 0
+
+
+@pytest.mark.parametrize('fraction', [0, 0.1, 0.25, 0.5, 0.123456789012345, 1e-9, 0.999999999999999, 1, 1.5])
+def test_below_matches_exact_comparison(fraction):
+    # fractions with ~1e15 denominators overflowed int64 before
+    phase = PhaseAccumulator(50, 4999)
+    acc = phase.advance(4999)
+    expected = [Fraction(int(a) % phase.den, phase.den) < exact_fraction(fraction) for a in acc]
+    assert phase.below(acc, fraction).tolist() == expected
+
+
+def test_retune_keeps_period_and_phase():
+    phase = PhaseAccumulator(50, 5000, cycle = 3)
+    phase.advance(237) # period 2, phase 0.37
+    retuned = phase.retune(80, 5000)
+    assert retuned.cycle == 3
+    acc = retuned.advance(1)
+    assert retuned.period(acc)[0] == 2
+    assert retuned.phase(acc)[0] == pytest.approx(0.37, abs = 1 / retuned.den)
+
+
+def test_non_positive_frequency_is_rejected():
+    with pytest.raises(ValueError):
+        PhaseAccumulator(0, 1000)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from ni_ring_buffer import RingBuffer
+
+
+def fill(ring, num_blocks):
+    for _ in range(num_blocks):
+        ring.next_block()[:] = ring.count
+        ring.commit()
+
+
+def test_next_block_slot_is_not_readable():
+    ring = RingBuffer(4, 3)
+    fill(ring, 5)
+    # blocks 3 and 4 are readable, block 2 shares its slot with next_block()
+    assert np.shares_memory(ring.next_block(), ring.data[2 % 3])
+    with pytest.raises(IndexError):
+        ring.block(2)
+    assert ring.block(3)[0] == 3
+    assert ring.block(4)[0] == 4
+
+
+def test_read_reports_the_block_being_filled_as_lost():
+    ring = RingBuffer(4, 3)
+    fill(ring, 5)
+    views, cursor, lost = ring.read(0)
+    assert lost == 3
+    assert cursor == 5
+    blocks = np.concatenate(views)
+    assert list(blocks[:, 0]) == [3, 4]
+    assert not any(np.shares_memory(view, ring.next_block()) for view in views)
+
+
+def test_read_in_order_without_loss():
+    ring = RingBuffer(2, 4)
+    cursor = 0
+    for count in range(1, 10):
+        fill(ring, 1)
+        views, cursor, lost = ring.read(cursor)
+        assert lost == 0
+        assert np.concatenate(views)[:, 0].tolist() == [count - 1]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from ni_stream_stats import StreamStats
+
+
+def reference_psd(data, rate, nperseg, step):
+    '''Welch PSD of the whole stream, one segment at a time'''
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(nperseg) / nperseg) # periodic Hann
+    total = np.zeros((data.shape[0], nperseg // 2 + 1))
+    count = 0
+    for start in range(0, data.shape[-1] - nperseg + 1, step):
+        segment = data[:, start:start + nperseg]
+        spectrum = np.fft.rfft((segment - segment.mean(axis = -1, keepdims = True)) * window)
+        total += np.abs(spectrum)**2
+        count += 1
+    psd = total / (count * rate * np.sum(window**2))
+    psd[:, 1:] *= 2
+    if nperseg % 2 == 0:
+        psd[:, -1] /= 2
+    return psd, count
+
+
+def blocks(seed, num_blocks, block_size, offset = 1e3):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_blocks * block_size) / 1e4
+    # a large offset: a sum of squares would lose the variance, Welford must not
+    data = np.stack((offset + rng.normal(0, 0.01, len(t)),
+                     np.sin(2 * np.pi * 1234.5 * t) + rng.normal(0, 0.1, len(t))))
+    return data, np.split(data, num_blocks, axis = -1)
+
+
+@pytest.mark.parametrize('block_size, nperseg, overlap', [(100, 256, 0.5), (1000, 256, 0.5),
+                                                          (64, 128, 0.75), (300, 255, 0.)])
+def test_against_the_whole_stream(block_size, nperseg, overlap):
+    data, stream = blocks(0, 20, block_size)
+    stats = StreamStats(2, block_size, 1e4, nperseg, overlap)
+    for block in stream:
+        stats.update(block)
+    snapshot = stats.snapshot()
+    assert snapshot['count'] == data.shape[-1]
+    assert np.allclose(snapshot['mean'], data.mean(axis = -1), rtol = 1e-12)
+    assert np.allclose(snapshot['std'], data.std(axis = -1, ddof = 1), rtol = 1e-9)
+    assert np.allclose(snapshot['rms'], np.sqrt(np.mean(data**2, axis = -1)), rtol = 1e-12)
+    assert np.array_equal(snapshot['min'], data.min(axis = -1))
+    assert np.array_equal(snapshot['max'], data.max(axis = -1))
+
+    frequencies, psd = stats.psd()
+    expected, count = reference_psd(data, 1e4, nperseg, stats.step)
+    assert snapshot['segments'] == count
+    assert np.allclose(frequencies, np.fft.rfftfreq(nperseg, 1e-4))
+    assert np.allclose(psd, expected, rtol = 1e-9, atol = 0)
+    # the sine shows up in the bin nearest to its frequency
+    assert abs(frequencies[np.argmax(psd[1])] - 1234.5) <= 1e4 / nperseg
+
+
+def test_reset_and_block_size():
+    data, stream = blocks(1, 4, 100)
+    stats = StreamStats(2, 100, 1e4, spectrum = False)
+    stats.update(stream[0])
+    stats.reset()
+    for block in stream[1:]:
+        stats.update(block)
+    assert stats.count == 300
+    assert np.allclose(stats.mean, data[:, 100:].mean(axis = -1), rtol = 1e-12)
+    assert stats.segments == 0
+    with pytest.raises(ValueError):
+        stats.update(np.zeros((2, 50)))
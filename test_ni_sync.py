@@ -0,0 +1,62 @@
+import nidaqmx
+
+from ni_sync import SyncStart
+
+
+class FakeStream(object):
+
+    def __init__(self, task):
+        self.task = task
+
+    @property
+    def total_samp_per_chan_generated(self):
+        return self.task.generated()
+
+
+class FakeTask(object):
+    '''Records the calls in log, generated() counts the samples of a shared clock'''
+
+    def __init__(self, name, log, clock, lead = 0):
+        self.name = name
+        self.log = log
+        self.clock = clock
+        self.lead = lead
+        self.out_stream = FakeStream(self)
+
+    def control(self, action):
+        assert action == nidaqmx.constants.TaskMode.TASK_COMMIT
+        self.log.append(('commit', self.name))
+
+    def start(self):
+        self.log.append(('start', self.name))
+
+    def stop(self):
+        self.log.append(('stop', self.name))
+
+    def generated(self):
+        # every read of a counter takes one clock tick
+        self.clock[0] += 1
+        return self.clock[0] + self.lead
+
+
+def test_slaves_armed_before_master():
+    log, clock = [], [0]
+    master = FakeTask('ao', log, clock)
+    slaves = [FakeTask('do', log, clock), FakeTask('co', log, clock)]
+    sync = SyncStart(master, slaves, 1000, verbose = False)
+    report = sync.start()
+    assert log == [('commit', 'do'), ('start', 'do'), ('commit', 'co'), ('start', 'co'), ('start', 'ao')]
+    # the reads before and after the slaves cancel the time between reads,
+    # up to half a read per slave
+    assert abs(report.skew_samples) <= 0.5 * len(slaves)
+    log.clear()
+    sync.stop()
+    assert log == [('stop', 'ao'), ('stop', 'do'), ('stop', 'co')]
+
+
+def test_skew_of_a_slave_ahead():
+    log, clock = [], [0]
+    sync = SyncStart(FakeTask('ao', log, clock), [FakeTask('do', log, clock, lead = 3)], 1000, verbose = False)
+    report = sync.start()
+    assert report.skew_samples == 3
+    assert report.skew == 3e-3
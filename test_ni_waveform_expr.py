@@ -0,0 +1,86 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from ni_phase import PhaseAccumulator
+from ni_waveform_expr import WaveformExpression, classic_expression
+
+FREQUENCY, RATE = 100, 4000 # 40 samples per period
+
+
+def reference(expression, num_samples, cycle = 1):
+    '''Samples of expression, a function of (phase in the period, period index), computed one by one'''
+    values = []
+    for k in range(num_samples):
+        position = Fraction(k * FREQUENCY, RATE)
+        values.append(expression(position % 1, int(position) % cycle))
+    return np.array(values, dtype = float)
+
+
+def evaluate(text, num_samples, cycle = 1):
+    expression = WaveformExpression(text)
+    phase = PhaseAccumulator(FREQUENCY, RATE, cycle if expression.uses_period else 1)
+    return expression.evaluate(phase, num_samples, FREQUENCY)
+
+
+PRIMITIVES = {
+    'sine(amplitude=2, phase=0.125)': lambda f, n: 2 * math.sin(2 * math.pi * (f + 0.125)),
+    'rect(amplitude=1.5, duty=0.25)': lambda f, n: 1.5 * (f < Fraction('0.25')),
+    'rect(duty=0.5, phase=0.3)': lambda f, n: float((f - Fraction('0.3')) % 1 < Fraction('0.5')),
+    'ramp(amplitude=3)': lambda f, n: 3 * f,
+    'spikes(amplitude=0.5, duration=0.001)': lambda f, n: 0.5 * (f < Fraction('0.001') * FREQUENCY),
+    'exponential(amplitude=1, tau=0.002)': lambda f, n: math.exp(-f / (FREQUENCY * 0.002)),
+    'constant(value=-1)': lambda f, n: -1.,
+    'staircase(amplitude=0.5)': lambda f, n: 0.5 * n,
+    'step(amplitude=2, start=2)': lambda f, n: 2. * (n >= 2),
+}
+
+
+@pytest.mark.parametrize('text', sorted(PRIMITIVES))
+def test_primitive(text):
+    expected = reference(PRIMITIVES[text], 200, cycle = 3)
+    assert np.allclose(evaluate(text, 200, cycle = 3), expected, rtol = 0, atol = 1e-12)
+
+
+def test_combinators():
+    sine, rect = PRIMITIVES['sine(amplitude=2, phase=0.125)'], PRIMITIVES['rect(amplitude=1.5, duty=0.25)']
+    ramp, constant = PRIMITIVES['ramp(amplitude=3)'], PRIMITIVES['constant(value=-1)']
+    cases = {
+        'sum(sine(amplitude=2, phase=0.125), rect(amplitude=1.5, duty=0.25), constant(value=-1))':
+            lambda f, n: sine(f, n) + rect(f, n) + constant(f, n),
+        'product(sine(amplitude=2, phase=0.125), ramp(amplitude=3))':
+            lambda f, n: sine(f, n) * ramp(f, n),
+        'clip(sum(sine(amplitude=2, phase=0.125), ramp(amplitude=3)), low=-1, high=2.5)':
+            lambda f, n: min(max(sine(f, n) + ramp(f, n), -1), 2.5),
+        'gate(sine(amplitude=2, phase=0.125), rect(amplitude=1.5, duty=0.25))':
+            lambda f, n: sine(f, n) if rect(f, n) else 0.,
+        # nested combinators reuse the registers above the one they write
+        'sum(product(ramp(amplitude=3), constant(value=-1)), sum(rect(amplitude=1.5, duty=0.25), ramp(amplitude=3)))':
+            lambda f, n: -ramp(f, n) + rect(f, n) + ramp(f, n),
+    }
+    for text, expression in cases.items():
+        assert np.allclose(evaluate(text, 200), reference(expression, 200), rtol = 0, atol = 1e-12), text
+
+
+def test_consecutive_evaluations_are_phase_continuous():
+    expression = WaveformExpression('sum(sine(amplitude=1), staircase(amplitude=1))')
+    phase = PhaseAccumulator(FREQUENCY, RATE, 3)
+    chunks = np.concatenate([expression.evaluate(phase, n, FREQUENCY) for n in (13, 50, 57)])
+    assert np.allclose(chunks, evaluate('sum(sine(amplitude=1), staircase(amplitude=1))', 120, cycle = 3))
+
+
+def test_classic_custom_expression():
+    text = classic_expression('custom', [1., 0.5], 0.1, 0.0005, 0.2)
+    expected = reference(lambda f, n: 1. * (n >= 1) + 0.5 * (n >= 2)
+                         + 0.1 * (f < Fraction('0.0005') * FREQUENCY) + 0.2, 120, cycle = 3)
+    assert WaveformExpression(text).uses_period
+    assert np.allclose(evaluate(text, 120, cycle = 3), expected, rtol = 0, atol = 1e-12)
+
+
+@pytest.mark.parametrize('text', ['triangle(amplitude=1)', 'sine(1)', 'sum()', 'clip(ramp(), ramp())',
+                                  'sine(amplitude="a")', '3'])
+def test_invalid_expressions(text):
+    with pytest.raises(ValueError):
+        WaveformExpression(text)